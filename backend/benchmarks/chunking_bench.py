@@ -0,0 +1,108 @@
+"""
+Chunker benchmark: legacy 800-char windows vs structure-aware token chunks.
+
+Run from backend/:
+    python -m benchmarks.chunking_bench
+    python -m benchmarks.chunking_bench --embed   # also time MiniLM encoding of both sets
+    python -m benchmarks.chunking_bench --dedup   # also report MinHash near-duplicate shrink
+"""
+import argparse
+import glob
+import os
+import time
+
+from src.services.chunking import EMBEDDING_MODEL, chunk_document, chunk_text, load_tokenizer
+from src.services.dedup import MinHashLSH, dedupe_chunks
+
+PROCESSED_DIR = "./knowledgebase/processed"
+MODEL_MAX_TOKENS = 254  # 256 minus [CLS]/[SEP]
+
+
+def _token_lengths(tokenizer, texts):
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]]
+
+
+def _time_embed(texts, model):
+    start = time.perf_counter()
+    model.encode(texts, batch_size=64)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pattern", default="*.txt")
+    parser.add_argument("--embed", action="store_true", help="time embedding of both chunk sets")
+    parser.add_argument("--dedup", action="store_true", help="report near-duplicate shrink of the new chunks")
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer()
+    model = None
+    if args.embed:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(EMBEDDING_MODEL)
+
+    totals = {k: 0.0 for k in (
+        "bytes", "old_chunks", "old_tokens", "old_truncated", "new_chunks",
+        "new_tokens", "new_seconds", "old_embed", "new_embed", "deduped", "dedup_seconds",
+    )}
+    dedup_indexes = {"BOOK": MinHashLSH(), "PYQ": MinHashLSH()}
+
+    header = f"{'file':<40} {'old':>6} {'new':>6} {'old tok':>9} {'new tok':>9} {'trunc':>6} {'MB/s':>6}"
+    print(header)
+    print("-" * len(header))
+
+    for path in sorted(glob.glob(os.path.join(PROCESSED_DIR, args.pattern))):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+
+        old = chunk_text(text)
+        old_lengths = _token_lengths(tokenizer, old)
+
+        start = time.perf_counter()
+        new = chunk_document(text, tokenizer)
+        elapsed = time.perf_counter() - start
+
+        size = len(text.encode("utf-8"))
+        old_tokens = sum(min(n, MODEL_MAX_TOKENS) for n in old_lengths)  # what actually gets embedded
+        truncated = sum(n > MODEL_MAX_TOKENS for n in old_lengths)
+        new_tokens = sum(c.tokens for c in new)
+
+        totals["bytes"] += size
+        totals["old_chunks"] += len(old)
+        totals["old_tokens"] += old_tokens
+        totals["old_truncated"] += truncated
+        totals["new_chunks"] += len(new)
+        totals["new_tokens"] += new_tokens
+        totals["new_seconds"] += elapsed
+
+        if args.dedup:
+            content_type = "PYQ" if path.endswith("_PYQ.txt") else "BOOK"
+            start = time.perf_counter()
+            keep, _ = dedupe_chunks([c.text for c in new], dedup_indexes[content_type], path)
+            totals["dedup_seconds"] += time.perf_counter() - start
+            totals["deduped"] += len(keep)
+
+        if model is not None:
+            totals["old_embed"] += _time_embed(old, model)
+            totals["new_embed"] += _time_embed([c.text for c in new], model)
+
+        name = os.path.basename(path)[:40]
+        print(f"{name:<40} {len(old):>6} {len(new):>6} {old_tokens:>9} {new_tokens:>9} "
+              f"{truncated:>6} {size / elapsed / 1e6:>6.2f}")
+
+    print("-" * len(header))
+    print(f"chunks:          {int(totals['old_chunks'])} → {int(totals['new_chunks'])} "
+          f"({(1 - totals['new_chunks'] / max(totals['old_chunks'], 1)) * 100:.1f}% fewer)")
+    print(f"embedded tokens: {int(totals['old_tokens'])} → {int(totals['new_tokens'])} "
+          f"({int(totals['old_truncated'])} legacy chunks were truncated by the model)")
+    print(f"chunker speed:   {totals['bytes'] / totals['new_seconds'] / 1e6:.2f} MB/s")
+    if args.dedup:
+        print(f"after dedup:     {int(totals['deduped'])} chunks "
+              f"({(1 - totals['deduped'] / max(totals['new_chunks'], 1)) * 100:.1f}% of new chunks dropped, "
+              f"{totals['dedup_seconds']:.1f}s)")
+    if model is not None:
+        print(f"embed time:      {totals['old_embed']:.1f}s → {totals['new_embed']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+HTTP load test for the API with a stubbed LLM (benchmarks.stub_app).
+
+Run from backend/:
+    python -m benchmarks.load_test                                   # 1 worker, concurrency 1,4,16
+    python -m benchmarks.load_test --mix context=6,notes=1,upload=2 --concurrency 8,32,64 --duration 30
+    python -m benchmarks.load_test --workers 1,2,4 --threads 8,40    # sweep → throughput knee
+    python -m benchmarks.load_test --target http://127.0.0.1:8000    # existing server, no spawn
+
+For every (workers, threads) pair a uvicorn server is started with
+THREADPOOL_SIZE=<threads>, and a closed-loop load (N clients, each sending
+the next request as soon as the previous one finishes) is driven at every
+concurrency level. Reported per run: throughput, p50/p95/p99 latency and
+error rate (overall and per endpoint), peak server RSS (all uvicorn
+processes, from /proc), and server event-loop lag (from /metrics). The knee
+is the concurrency after which throughput grows by less than 10%.
+
+Notes requests get a different two-unit syllabus each time (PYQ questions of
+one subject), and spawned servers run with notes single flight and the
+semantic retrieval cache off, so the numbers measure capacity rather than
+request coalescing. Pass --with-caches to load test them switched on.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from benchmarks.retrieval_bench import PROCESSED_DIR, extract_questions
+from src.services.subjects import detect_subject_from_filename
+
+SYLLABUS = """UNIT I: Introduction
+Definition of learning systems, goals and applications, supervised and unsupervised learning.
+
+UNIT II: Regression
+Simple linear regression, multiple regression, ordinary least squares, logistic regression.
+"""
+FALLBACK_QUERIES = [
+    "Explain simple linear regression and its assumptions",
+    "Differentiate between supervised and unsupervised learning",
+    "Minimize a DFA using the Myhill Nerode theorem",
+    "What is a random variable? Explain probability mass functions",
+]
+KNEE_GAIN = 0.10
+
+
+# ---------------------------------------------------------
+#  PAYLOADS
+# ---------------------------------------------------------
+def _sample_pdf() -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    pdf = canvas.Canvas(buf, pagesize=A4)
+    for page in range(2):
+        y = 800
+        for line in (SYLLABUS * 3).splitlines():
+            pdf.drawString(50, y, line[:95])
+            y -= 14
+        pdf.showPage()
+    pdf.save()
+    return buf.getvalue()
+
+
+def _queries() -> List[Tuple[str, str]]:
+    import glob
+    out = []
+    for path in sorted(glob.glob(os.path.join(PROCESSED_DIR, "*_PYQ.txt"))):
+        subject = detect_subject_from_filename(os.path.basename(path))
+        with open(path, encoding="utf-8") as f:
+            out.extend((q, subject) for q in extract_questions(f.read()))
+    return out or [(q, None) for q in FALLBACK_QUERIES]
+
+
+class Workload:
+    def __init__(self, mix: Dict[str, float]):
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.pdf = _sample_pdf()
+        self.queries = _queries()
+        self.by_subject: Dict[Optional[str], List[str]] = defaultdict(list)
+        for query, subject in self.queries:
+            self.by_subject[subject].append(query)
+
+    def notes_body(self, rng: random.Random) -> dict:
+        """A fresh syllabus per request: two units drawn from one subject's questions."""
+        subject = rng.choice([s for s, qs in self.by_subject.items() if len(qs) >= 2] or list(self.by_subject))
+        questions = self.by_subject[subject]
+        units = rng.sample(questions, 2) if len(questions) >= 2 else questions * 2
+        syllabus = "\n\n".join(
+            f"UNIT {numeral}: {' '.join(q.split()[:6])}\n{q}" for numeral, q in zip(("I", "II"), units)
+        )
+        return {"syllabus_text": syllabus, "subject": subject, "top_k": 10}
+
+    def request(self, rng: random.Random) -> Tuple[str, str, dict]:
+        name = rng.choices(self.names, self.weights)[0]
+        if name == "context":
+            query, subject = rng.choice(self.queries)
+            body = {"syllabus_text": query, "subject": subject, "top_k": 10}
+            return name, "/api/retrieve/context", {"json": body}
+        if name == "query":
+            return name, "/api/retrieve/query", {"json": {"query": rng.choice(self.queries)[0], "top_k": 5}}
+        if name == "notes":
+            return name, "/api/notes/generate", {"json": self.notes_body(rng)}
+        if name == "upload":
+            return name, "/api/upload", {"files": {"file": ("syllabus.pdf", self.pdf, "application/pdf")}}
+        if name == "parse":
+            return name, "/api/parse-topics", {"json": {"text": SYLLABUS}}
+        raise ValueError(f"unknown workload '{name}'")
+
+
+# ---------------------------------------------------------
+#  SERVER
+# ---------------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    def __init__(self, workers: int, threads: int, app: str, with_caches: bool = False):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.metrics_dir = tempfile.mkdtemp(prefix="loadtest-prom-")
+        env = {
+            **os.environ,
+            "THREADPOOL_SIZE": str(threads),
+            "PROMETHEUS_MULTIPROC_DIR": self.metrics_dir,
+            "INDEX_POLL_SECONDS": "0",
+        }
+        if not with_caches:
+            # measure pipeline capacity, not coalescing / cache hits
+            env.update({"NOTES_SINGLEFLIGHT": "0", "SEMANTIC_CACHE_SIZE": "0"})
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", app, "--port", str(self.port),
+             "--workers", str(workers), "--log-level", "warning"],
+            env=env, start_new_session=True,
+        )
+
+    def wait_ready(self, timeout: float = 180):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            try:
+                if httpx.get(self.url + "/", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError("server did not become ready")
+
+    def pids(self) -> List[int]:
+        pids = [self.proc.pid]
+        try:
+            out = subprocess.run(["pgrep", "-g", str(os.getpgid(self.proc.pid))], capture_output=True, text=True)
+            pids = sorted({self.proc.pid, *(int(p) for p in out.stdout.split())})
+        except (OSError, ValueError):
+            pass
+        return pids
+
+    def stop(self):
+        try:
+            os.killpg(os.getpgid(self.proc.pid), signal.SIGTERM)
+            self.proc.wait(timeout=20)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+
+
+def rss_bytes(pids: List[int]) -> int:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+_BUCKET_RE = re.compile(r'^syllabus_gpt_event_loop_lag_seconds_bucket\{[^}]*le="([^"]+)"[^}]*\}\s+(\S+)', re.M)
+_SUM_RE = re.compile(r"^syllabus_gpt_event_loop_lag_seconds_(sum|count)(?:\{[^}]*\})?\s+(\S+)", re.M)
+
+
+def loop_lag(base_url: str) -> Dict[str, float]:
+    """Cumulative server loop-lag histogram (all workers) from /metrics."""
+    try:
+        text = httpx.get(base_url + "/metrics", timeout=5).text
+    except httpx.HTTPError:
+        return {}
+    buckets = defaultdict(float)
+    for le, value in _BUCKET_RE.findall(text):
+        buckets[float(le)] += float(value)
+    totals = defaultdict(float)
+    for kind, value in _SUM_RE.findall(text):
+        totals[kind] += float(value)
+    return {"buckets": dict(buckets), "sum": totals["sum"], "count": totals["count"]}
+
+
+def _lag_delta(before: dict, after: dict) -> Dict[str, float]:
+    if not before or not after or after["count"] <= before["count"]:
+        return {}
+    count = after["count"] - before["count"]
+    buckets = sorted((le, after["buckets"][le] - before["buckets"].get(le, 0)) for le in after["buckets"])
+    p99 = next((le for le, n in buckets if n >= 0.99 * count), float("inf"))
+    return {"mean_ms": 1000 * (after["sum"] - before["sum"]) / count, "p99_ms": 1000 * p99}
+
+
+# ---------------------------------------------------------
+#  CLOSED-LOOP LOAD
+# ---------------------------------------------------------
+async def run_load(base_url: str, workload: Workload, concurrency: int, duration: float,
+                   pids: Optional[List[int]] = None, seed: int = 0) -> dict:
+    results: List[Tuple[str, float, int]] = []  # (endpoint, seconds, status; 0 = transport error)
+    rss_peak = 0
+    client_lag = []
+    stop_at = time.monotonic() + duration
+
+    async def client(i: int, http: httpx.AsyncClient):
+        rng = random.Random(seed * 1000 + i)
+        while time.monotonic() < stop_at:
+            name, path, kwargs = workload.request(rng)
+            start = time.perf_counter()
+            try:
+                resp = await http.post(path, **kwargs)
+                await resp.aread()
+                status = resp.status_code
+            except httpx.HTTPError:
+                status = 0
+            results.append((name, time.perf_counter() - start, status))
+
+    async def sampler():
+        nonlocal rss_peak
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            await asyncio.sleep(0.25)
+            client_lag.append(time.perf_counter() - start - 0.25)
+            if pids:
+                rss_peak = max(rss_peak, rss_bytes(pids))
+
+    lag_before = loop_lag(base_url)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as http:
+        started = time.perf_counter()
+        await asyncio.gather(sampler(), *(client(i, http) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "results": results,
+        "rss_peak": rss_peak,
+        "server_loop_lag": _lag_delta(lag_before, loop_lag(base_url)),
+        "client_loop_lag_max_ms": 1000 * max(client_lag, default=0.0),
+    }
+
+
+def summarize(run: dict) -> dict:
+    def stats(rows):
+        if not rows:
+            return {"n": 0}
+        lat = np.array([r[1] for r in rows])
+        ok = [r for r in rows if 200 <= r[2] < 300]
+        return {
+            "n": len(rows),
+            "rps": len(ok) / run["elapsed"],
+            "p50_ms": float(np.percentile(lat, 50) * 1000),
+            "p95_ms": float(np.percentile(lat, 95) * 1000),
+            "p99_ms": float(np.percentile(lat, 99) * 1000),
+            "error_rate": 1 - len(ok) / len(rows),
+        }
+
+    by_endpoint = defaultdict(list)
+    for row in run["results"]:
+        by_endpoint[row[0]].append(row)
+    return {
+        "concurrency": run["concurrency"],
+        **stats(run["results"]),
+        "endpoints": {name: stats(rows) for name, rows in sorted(by_endpoint.items())},
+        "rss_peak_mb": run["rss_peak"] / 1e6,
+        "server_loop_lag": run["server_loop_lag"],
+        "client_loop_lag_max_ms": run["client_loop_lag_max_ms"],
+    }
+
+
+def find_knee(rows: List[dict]) -> Optional[int]:
+    """Concurrency after which throughput grows by less than KNEE_GAIN."""
+    for prev, cur in zip(rows, rows[1:]):
+        if prev.get("rps", 0) and cur.get("rps", 0) < prev["rps"] * (1 + KNEE_GAIN):
+            return prev["concurrency"]
+    return None
+
+
+def _print_row(label: str, s: dict):
+    if not s.get("n"):
+        print(f"{label:<14} no requests completed")
+        return
+    lag = s.get("server_loop_lag") or {}
+    print(f"{label:<14} {s['concurrency']:>5} {s['n']:>7} {s['rps']:>8.2f} {s['p50_ms']:>9.0f} {s['p95_ms']:>9.0f} "
+          f"{s['p99_ms']:>9.0f} {100 * s['error_rate']:>6.1f}% {s['rss_peak_mb']:>8.0f} "
+          f"{lag.get('mean_ms', float('nan')):>8.1f} {lag.get('p99_ms', float('nan')):>8.1f}")
+    for name, e in s["endpoints"].items():
+        if e.get("n"):
+            print(f"{'  ' + name:<14} {'':>5} {e['n']:>7} {e['rps']:>8.2f} {e['p50_ms']:>9.0f} "
+                  f"{e['p95_ms']:>9.0f} {e['p99_ms']:>9.0f} {100 * e['error_rate']:>6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mix", default="context=6,notes=1,upload=2",
+                        help="endpoint weights: context, query, notes, upload, parse")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument("--workers", default="1", help="uvicorn worker counts to sweep")
+    parser.add_argument("--threads", default="40", help="THREADPOOL_SIZE values to sweep")
+    parser.add_argument("--app", default="benchmarks.stub_app:app")
+    parser.add_argument("--target", help="load an already running server instead of spawning one")
+    parser.add_argument("--json", help="write all results to this file")
+    parser.add_argument("--with-caches", action="store_true",
+                        help="keep notes single flight and the semantic retrieval cache on in spawned servers")
+    args = parser.parse_args()
+
+    mix = {k: float(v) for k, v in (item.split("=") for item in args.mix.split(","))}
+    levels = [int(c) for c in args.concurrency.split(",")]
+    workload = Workload(mix)
+
+    header = (f"{'config':<14} {'conc':>5} {'reqs':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'errors':>7} {'RSS MB':>8} {'lag ms':>8} {'lag p99':>8}")
+    configs = [(None, None)] if args.target else [
+        (int(w), int(t)) for w in args.workers.split(",") for t in args.threads.split(",")
+    ]
+
+    report = []
+    for workers, threads in configs:
+        server = None
+        if args.target:
+            base_url, pids, label = args.target.rstrip("/"), None, "target"
+        else:
+            server = Server(workers, threads, args.app, args.with_caches)
+            print(f"\n▶ workers={workers} threads={threads} (starting {server.url} ...)")
+            server.wait_ready()
+            base_url, pids, label = server.url, server.pids(), f"w{workers}/t{threads}"
+
+        print(header)
+        print("-" * len(header))
+        rows = []
+        try:
+            for level in levels:
+                summary = summarize(asyncio.run(run_load(base_url, workload, level, args.duration, pids)))
+                rows.append(summary)
+                _print_row(label, summary)
+        finally:
+            if server is not None:
+                server.stop()
+
+        knee = find_knee(rows)
+        best = max(rows, key=lambda r: r.get("rps", 0))
+        print(f"→ peak {best.get('rps', 0):.2f} req/s at concurrency {best['concurrency']}; "
+              f"knee at {knee if knee is not None else '> ' + str(levels[-1])}")
+        report.append({"workers": workers, "threads": threads, "knee": knee, "runs": rows})
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mix": mix, "duration": args.duration, "configs": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Retrieval quality + latency benchmark, with PYQ questions as queries.
+
+Run from backend/ (against the published index generation):
+    python -m benchmarks.retrieval_bench
+    python -m benchmarks.retrieval_bench --backends chroma,compressed,snapshot --k 5,10,20
+    python -m benchmarks.retrieval_bench --hyde          # also HyDE-expanded queries (needs GROQ_API_KEY)
+    python -m benchmarks.retrieval_bench --hyde-modes off,always,adaptive,parallel
+    python -m benchmarks.retrieval_bench --json results.json
+
+Query set: questions are cut out of the processed PYQ texts at their
+"(a) / (b) / Q1." markers. For each question, the book text(s) of the same
+subject are split into fixed word windows and the BM25 top windows become
+the graded relevant passages. Labels therefore don't depend on the chunker
+or the index: a retrieved chunk counts as relevant when it covers at least
+half of a labelled passage's word 3-grams (or vice versa).
+
+Metrics per backend / HyDE mode: recall@k (share of labelled passages
+covered by the top k), MRR, nDCG@k, p50/p99 latency per query (HyDE +
+query embedding + search), the share of queries that called HyDE and
+HyDE's share of the total latency. HyDE docs are generated once and cached
+with their generation time; later runs replay that time (or a fixed
+--hyde-latency-ms) so modes are compared on the same documents.
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.services.kb_maintenance import detect_subject_from_filename
+
+PROCESSED_DIR = "./knowledgebase/processed"
+HYDE_CACHE = "./benchmarks/.hyde_cache.json"
+
+PASSAGE_WORDS = 120
+PASSAGE_STRIDE = 60
+LABELS_PER_QUERY = 5
+MIN_QUERY_TERMS = 3
+MIN_CONTAINMENT = 0.5
+
+# "(a)", "(b)", "(6)" (OCR'd b), "Q1.", "Q. 2", "Question 3", "Unit-II"
+QUESTION_SPLIT_RE = re.compile(
+    r"\(\s*[a-d6]\s*\)|\bQ\.?\s*\d+\s*[.:)]?|\bQuestion\s*\d+\s*[.:)]?|\bUnit[\s\-]*\S+",
+    re.IGNORECASE,
+)
+QUESTION_WORD_RE = re.compile(
+    r"\b(what|explain|define|describe|differentiate|distinguish|compare|discuss|list|how|why|"
+    r"write|derive|state|prove|construct|design|convert|minimi[sz]e|find|give|calculate)\b",
+    re.IGNORECASE,
+)
+# marks, roll / paper codes, page furniture and OCR debris ("~Jyoti", "^")
+NOISE_TOKEN_RE = re.compile(r"^(?:\W*(\d+|[A-Z]?\d{5,}\S*|pto|fto|vivo|y21t)\W*|[~^|`].*|\W+)$", re.IGNORECASE)
+TERM_RE = re.compile(r"[a-z][a-z0-9]{2,}")
+STOPWORDS = set(
+    "the and for with what how why are its this that from which into between their there these those "
+    "explain define describe write give list state discuss example examples suitable following using "
+    "does each any two diagram short note notes term terms also can will have has been was were".split()
+)
+
+
+# ---------------------------------------------------------
+#  QUERY SET
+# ---------------------------------------------------------
+def extract_questions(text: str) -> List[str]:
+    flat = " ".join(tok for tok in text.split() if not NOISE_TOKEN_RE.match(tok))
+    questions = []
+    for part in QUESTION_SPLIT_RE.split(flat):
+        part = part.strip(" .;:-|")
+        if "?" in part:
+            part = part[:part.rindex("?") + 1]  # drop whatever OCR'd after the question
+        if len(part.split()) >= 4 and QUESTION_WORD_RE.search(part):
+            questions.append(part[:400])
+    return list(dict.fromkeys(questions))
+
+
+def _terms(text: str) -> List[str]:
+    return [t for t in TERM_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _passages(text: str) -> List[Tuple[int, int]]:
+    """(start, end) char spans of overlapping fixed-size word windows."""
+    spans = [m.span() for m in re.finditer(r"\S+", text)]
+    out = []
+    for i in range(0, max(len(spans) - PASSAGE_WORDS // 2, 1), PASSAGE_STRIDE):
+        window = spans[i:i + PASSAGE_WORDS]
+        if window:
+            out.append((window[0][0], window[-1][1]))
+    return out
+
+
+class BM25:
+    def __init__(self, docs: List[List[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.lengths = np.array([len(d) for d in docs], dtype=np.float32)
+        self.avg_len = float(self.lengths.mean()) if len(docs) else 1.0
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for i, doc in enumerate(docs):
+            for term, tf in Counter(doc).items():
+                self.postings[term].append((i, tf))
+        n = len(docs)
+        self.idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in self.postings.items()}
+
+    def scores(self, query: List[str]) -> np.ndarray:
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / self.avg_len)
+        for term in set(query):
+            for i, tf in self.postings.get(term, ()):
+                scores[i] += self.idf[term] * tf * (self.k1 + 1) / (tf + norm[i])
+        return scores
+
+
+def build_queryset(max_queries: int = 0) -> List[dict]:
+    books: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+    for path in sorted(glob.glob(os.path.join(PROCESSED_DIR, "*_BOOK.txt"))):
+        with open(path, encoding="utf-8") as f:
+            books[detect_subject_from_filename(os.path.basename(path))].append((os.path.basename(path), f.read()))
+
+    # one BM25 index per subject over all of its books' passages
+    indexes = {}
+    for subject, texts in books.items():
+        passages = [(name, text[s:e]) for name, text in texts for s, e in _passages(text)]
+        indexes[subject] = (passages, BM25([_terms(p) for _, p in passages]))
+
+    queries = []
+    for path in sorted(glob.glob(os.path.join(PROCESSED_DIR, "*_PYQ.txt"))):
+        subject = detect_subject_from_filename(os.path.basename(path))
+        if subject not in indexes:
+            continue
+        passages, bm25 = indexes[subject]
+        with open(path, encoding="utf-8") as f:
+            questions = extract_questions(f.read())
+
+        for question in questions:
+            terms = _terms(question)
+            if len(set(terms)) < MIN_QUERY_TERMS:
+                continue
+            scores = bm25.scores(terms)
+            top = np.argsort(-scores)[:LABELS_PER_QUERY]
+            if scores[top[0]] <= 0:
+                continue
+            labels = [
+                {"source": passages[i][0], "text": passages[i][1], "grade": 2 if rank < 2 else 1}
+                for rank, i in enumerate(top)
+                if scores[i] >= 0.5 * scores[top[0]]
+            ]
+            queries.append({"question": question, "subject": subject, "pyq": os.path.basename(path), "labels": labels})
+
+    if max_queries and len(queries) > max_queries:
+        step = len(queries) / max_queries   # spread evenly over subjects / papers
+        queries = [queries[int(i * step)] for i in range(max_queries)]
+    return queries
+
+
+# ---------------------------------------------------------
+#  SCORING
+# ---------------------------------------------------------
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def judge(documents: List[str], labels: List[dict]) -> List[int]:
+    """For each retrieved chunk, the index of the labelled passage it covers (or -1)."""
+    label_shingles = [_shingles(l["text"]) for l in labels]
+    out = []
+    for doc in documents:
+        doc_sh = _shingles(doc or "")
+        best, best_score = -1, MIN_CONTAINMENT
+        for j, lab in enumerate(label_shingles):
+            overlap = len(doc_sh & lab) / max(min(len(doc_sh), len(lab)), 1)
+            if overlap >= best_score:
+                best, best_score = j, overlap
+        out.append(best)
+    return out
+
+
+def query_metrics(matches: List[int], labels: List[dict], ks: List[int]) -> dict:
+    grades = [l["grade"] for l in labels]
+    result = {}
+    first = next((rank for rank, m in enumerate(matches) if m >= 0), None)
+    result["mrr"] = 0.0 if first is None else 1.0 / (first + 1)
+
+    for k in ks:
+        seen, dcg = set(), 0.0
+        for rank, m in enumerate(matches[:k]):
+            if m >= 0 and m not in seen:   # a passage only earns gain once
+                seen.add(m)
+                dcg += (2 ** grades[m] - 1) / math.log2(rank + 2)
+        ideal = sum((2 ** g - 1) / math.log2(r + 2) for r, g in enumerate(sorted(grades, reverse=True)[:k]))
+        result[f"recall@{k}"] = len(seen) / len(labels)
+        result[f"ndcg@{k}"] = dcg / ideal if ideal else 0.0
+    return result
+
+
+# ---------------------------------------------------------
+#  RUN
+# ---------------------------------------------------------
+def _hyde_documents(queries: List[dict], cache_path: str) -> Tuple[Dict[str, dict], List[float]]:
+    """{question: {"doc", "seconds"}} for every query, generating what's missing."""
+    from src.services.hyde_llm import generate_hyde_document
+
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            cache = {q: e for q, e in json.load(f).items() if isinstance(e, dict)}
+
+    seconds = []
+    for q in queries:
+        if q["question"] not in cache:
+            start = time.perf_counter()
+            doc = generate_hyde_document(q["question"])
+            seconds.append(time.perf_counter() - start)
+            cache[q["question"]] = {"doc": doc, "seconds": seconds[-1]}
+
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    return cache, seconds
+
+
+def _replay_hyde(cache: Dict[str, dict], latency_ms: Optional[float]):
+    """A generate_hyde_document stand-in serving cached docs at their recorded latency."""
+    def generate(seed: str) -> str:
+        entry = cache[seed]
+        time.sleep(entry["seconds"] if latency_ms is None else latency_ms / 1000)
+        return entry["doc"]
+    return generate
+
+
+def run_config(queries: List[dict], backend: str, ks: List[int], mode: str, generate_hyde=None) -> dict:
+    from src.services import vector_store
+    from src.services.hyde_retrieval import retrieve_with_hyde
+    from src.services.semantic_cache import retrieval_cache
+
+    vector_store.RETRIEVAL_BACKEND = backend
+    retrieval_cache.capacity = 0  # measure the backend itself, not cache hits
+    vector_store.retrieve_chunks(queries[0]["question"], queries[0]["subject"], False, max(ks))  # warm-up
+
+    per_query, latencies, hyde_seconds, hyde_calls = [], [], [], 0
+    for q in queries:
+        start = time.perf_counter()
+        result = retrieve_with_hyde(q["question"], q["question"], q["subject"], False, max(ks),
+                                    mode=mode, generate_hyde=generate_hyde)
+        latencies.append(time.perf_counter() - start)
+        hyde_seconds.append(result["timings"]["hyde_wait"])  # HyDE time on the critical path
+        hyde_calls += result["hyde_used"]
+        per_query.append(query_metrics(judge(result["hits"]["documents"], q["labels"]), q["labels"], ks))
+
+    summary = {key: float(np.mean([m[key] for m in per_query])) for key in per_query[0]}
+    summary["p50_ms"] = float(np.percentile(latencies, 50) * 1000)
+    summary["p99_ms"] = float(np.percentile(latencies, 99) * 1000)
+    summary["hyde_rate"] = hyde_calls / len(queries)
+    # share of latency spent waiting on HyDE (parallel mode: only the part not hidden behind retrieval)
+    summary["hyde_share"] = float(sum(hyde_seconds) / sum(latencies))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="chroma", help="comma list of chroma, compressed, snapshot")
+    parser.add_argument("--k", default="5,10", help="comma list of cut-offs")
+    parser.add_argument("--hyde", action="store_true", help="shorthand for --hyde-modes off,always")
+    parser.add_argument("--hyde-modes", default="off", help="comma list of off, always, adaptive, parallel")
+    parser.add_argument("--hyde-cache", default=HYDE_CACHE)
+    parser.add_argument("--hyde-latency-ms", type=float, help="replay HyDE at this fixed latency instead")
+    parser.add_argument("--max-queries", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    ks = sorted(int(k) for k in args.k.split(","))
+    queries = build_queryset(args.max_queries)
+    if not queries:
+        raise SystemExit(f"No labelled queries could be built from {PROCESSED_DIR}")
+    by_subject = Counter(q["subject"] for q in queries)
+    print(f"📋 {len(queries)} labelled queries {dict(by_subject)}\n")
+
+    modes = ["off", "always"] if args.hyde else args.hyde_modes.split(",")
+    generate_hyde, hyde_seconds = None, []
+    if any(mode != "off" for mode in modes):
+        cache, hyde_seconds = _hyde_documents(queries, args.hyde_cache)
+        generate_hyde = _replay_hyde(cache, args.hyde_latency_ms)
+
+    cols = ([f"recall@{k}" for k in ks] + ["mrr"] + [f"ndcg@{k}" for k in ks]
+            + ["p50_ms", "p99_ms", "hyde_rate", "hyde_share"])
+    header = f"{'backend':<12} {'hyde':<9} " + " ".join(f"{c:>10}" for c in cols)
+    print(header)
+    print("-" * len(header))
+
+    results = []
+    for backend in args.backends.split(","):
+        for mode in modes:
+            try:
+                summary = run_config(queries, backend, ks, mode, generate_hyde)
+            except (FileNotFoundError, OSError) as e:
+                print(f"{backend:<12} {mode:<9} skipped ({e})")
+                continue
+            results.append({"backend": backend, "hyde": mode, **summary})
+            print(f"{backend:<12} {mode:<9} " + " ".join(
+                f"{summary[c]:>10.1f}" if c.endswith("_ms") else f"{summary[c]:>10.3f}" for c in cols))
+
+    if hyde_seconds:
+        print(f"\nHyDE generation ({len(hyde_seconds)} uncached): "
+              f"p50 {np.percentile(hyde_seconds, 50) * 1000:.0f} ms, p99 {np.percentile(hyde_seconds, 99) * 1000:.0f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"queries": len(queries), "ks": ks, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
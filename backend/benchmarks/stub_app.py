@@ -0,0 +1,76 @@
+"""
+The real FastAPI app with Groq replaced by a local stub, for load tests.
+
+    uvicorn benchmarks.stub_app:app --workers 2
+
+Everything else (MiniLM, Chroma, PDF extraction, ReportLab) is the real code.
+The stub streams like Groq: it waits STUB_LLM_TTFT_MS before the first
+token, then emits tokens at STUB_LLM_TOKENS_PER_SEC, up to `max_tokens`
+(capped at STUB_LLM_MAX_TOKENS), and reports usage on the last chunk under
+`x_groq`. Calls asking for JSON get a small JSON topic list back.
+"""
+import os
+import time
+from types import SimpleNamespace
+
+import groq
+
+STUB_LLM_TTFT_MS = float(os.getenv("STUB_LLM_TTFT_MS", "300"))
+STUB_LLM_TOKENS_PER_SEC = float(os.getenv("STUB_LLM_TOKENS_PER_SEC", "500"))
+STUB_LLM_MAX_TOKENS = int(os.getenv("STUB_LLM_MAX_TOKENS", "400"))
+TOKENS_PER_DELTA = 8
+
+_NOTES_WORDS = (
+    "## Overview\n\nThis unit introduces the core definitions and the main results. "
+    "**Key idea:** every concept is illustrated with a short example.\n\n"
+    "- definition and intuition\n- worked example\n- common exam questions\n\n"
+    "| Term | Meaning |\n|---|---|\n| model | a simplified description |\n\n"
+).split(" ")
+_TOPICS_JSON = '["Introduction", "Core concepts", "Applications"]'
+
+
+def _completion_text(messages, max_tokens: int) -> str:
+    prompt = " ".join(str(m.get("content", "")) for m in messages)
+    if "JSON" in prompt:
+        return _TOPICS_JSON
+    n = min(max_tokens or STUB_LLM_MAX_TOKENS, STUB_LLM_MAX_TOKENS)
+    return " ".join(_NOTES_WORDS[i % len(_NOTES_WORDS)] for i in range(n))
+
+
+def _chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, x_groq=SimpleNamespace(usage=usage) if usage else None)
+
+
+class _Completions:
+    def create(self, messages=None, max_tokens=None, stream=False, **kwargs):
+        text = _completion_text(messages or [], max_tokens)
+        words = text.split(" ")
+        time.sleep(STUB_LLM_TTFT_MS / 1000)
+
+        if not stream:
+            time.sleep(len(words) / STUB_LLM_TOKENS_PER_SEC)
+            message = SimpleNamespace(content=text)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+        def deltas():
+            for i in range(0, len(words), TOKENS_PER_DELTA):
+                if i:
+                    time.sleep(TOKENS_PER_DELTA / STUB_LLM_TOKENS_PER_SEC)
+                piece = " ".join(words[i:i + TOKENS_PER_DELTA])
+                yield _chunk(piece if i == 0 else " " + piece)
+            yield _chunk(usage=SimpleNamespace(completion_tokens=len(words)))
+
+        return deltas()
+
+
+class StubGroq:
+    def __init__(self, *args, **kwargs):
+        self.chat = SimpleNamespace(completions=_Completions())
+
+
+# Must happen before the app imports its services (they build clients at import)
+groq.Groq = StubGroq
+os.environ.setdefault("GROQ_API_KEY", "stub")
+
+from src.main import app  # noqa: E402
@@ -1,3 +1,7 @@
+import asyncio
+import os
+
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -7,9 +11,20 @@ from src.routes.hyde_generate import router as hyde_router
 from src.routes.retrieve import router as retrieve_router
 from src.routes.generate_notes import router as notes_router
 from src.routes.export_notes import router as export_notes_router
+from src.routes.metrics import api_router as metrics_api_router, router as metrics_router
+from src.routes.kb import router as kb_router
+from src.services.admission import AdmissionMiddleware, check_threadpool_budget
+from src.services.metrics import metrics_middleware, monitor_event_loop_lag
+from src.services.cpu_pool import shutdown_pool
+
+# Threads available to sync (def) routes; AnyIO's default is 40
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "0"))
 
 app = FastAPI(title="Syllabus GPT - HyDE + RAG Backend")
 
+# Innermost: rejections still get CORS headers and show up in the request metrics
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -18,6 +33,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.middleware("http")(metrics_middleware)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    if THREADPOOL_SIZE > 0:
+        limiter.total_tokens = THREADPOOL_SIZE
+    check_threadpool_budget(int(limiter.total_tokens))
+    app.state.loop_lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+
+@app.on_event("shutdown")
+def stop_cpu_pool():
+    shutdown_pool()
+
 @app.get("/")
 def home():
     return {"message": "Backend running successfully!"}
@@ -28,4 +57,7 @@ app.include_router(hyde_router, prefix="/api")
 app.include_router(retrieve_router, prefix="/api")
 app.include_router(notes_router, prefix="/api")
 app.include_router(export_notes_router, prefix="/api")
+app.include_router(kb_router, prefix="/api")
+app.include_router(metrics_api_router, prefix="/api")
+app.include_router(metrics_router)
 
@@ -0,0 +1,10 @@
+from fastapi import HTTPException
+
+from src.services.cpu_pool import PoolBusyError
+
+
+def cpu_pool_http_error(e: Exception) -> HTTPException:
+    """Maps CPU pool back-pressure / timeouts onto 503 / 504."""
+    if isinstance(e, PoolBusyError):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return HTTPException(status_code=504, detail=str(e))
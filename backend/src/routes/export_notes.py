@@ -1,8 +1,12 @@
+import os
+
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from src.services.export_notes import generate_beautiful_pdf
+from src.routes.errors import cpu_pool_http_error
+from src.services.cpu_pool import CpuTaskTimeout, PoolBusyError
+from src.services.export_store import get_or_build_pdf_async
 
 
 router = APIRouter(
@@ -10,33 +14,62 @@ router = APIRouter(
     tags=["Notes Export"]
 )
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 class ExportPdfRequest(BaseModel):
     notes_markdown: str
     filename: str | None = "notes.pdf"
     title: str | None = "Syllabus GPT Notes"
     subject: str | None = ""
-    
+
+
+def _safe_filename(filename: str | None) -> str:
+    name = os.path.basename(filename or "notes.pdf").replace('"', "").strip()
+    if not name:
+        name = "notes.pdf"
+    if not name.lower().endswith(".pdf"):
+        name += ".pdf"
+    return name
+
+
+def pdf_streaming_response(pdf: bytes, filename: str | None, content_key: str) -> StreamingResponse:
+    """
+    Streams an in-memory PDF back to the client (nothing is written to disk).
+    """
+    view = memoryview(pdf)
+
+    def iter_chunks():
+        for start in range(0, len(view), STREAM_CHUNK_SIZE):
+            yield view[start:start + STREAM_CHUNK_SIZE]
+
+    return StreamingResponse(
+        iter_chunks(),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="{_safe_filename(filename)}"',
+            "Content-Length": str(len(pdf)),
+            "ETag": f'"{content_key}"',
+        },
+    )
+
 
 @router.post("/export/pdf")
-def export_notes_pdf(req: ExportPdfRequest):
+async def export_notes_pdf(req: ExportPdfRequest):
     """
     Convert Markdown notes → Beautiful PDF
     """
     try:
-        pdf_path = generate_beautiful_pdf(
+        pdf, content_key = await get_or_build_pdf_async(
             markdown_text=req.notes_markdown,
-            filename=req.filename or "notes.pdf",
             title=req.title or "Syllabus GPT Notes",
             subject=req.subject or "",
         )
 
-        return FileResponse(
-            path=pdf_path,
-            media_type="application/pdf",
-            filename=req.filename or "notes.pdf"
-        )
+        return pdf_streaming_response(pdf, req.filename, content_key)
 
+    except (PoolBusyError, CpuTaskTimeout) as e:
+        raise cpu_pool_http_error(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -37,12 +37,14 @@ def generate_notes(req: NotesRequest):
         )
 """
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
 
-from src.services.notes_llm import generate_final_notes
-from src.services.export_notes import generate_beautiful_pdf
-from src.services.vector_store import retrieve_relevant_context
+from src.routes.errors import cpu_pool_http_error
+from src.routes.export_notes import pdf_streaming_response
+from src.services.cpu_pool import CpuTaskTimeout, PoolBusyError
+from src.services.checkpoints import checkpoint_store
+from src.services.notes_pipeline import NotesPipeline, NotesResult, resume_notes
+from src.services.export_store import get_or_build_pdf
 
 router = APIRouter(
     prefix="/notes",
@@ -62,39 +64,73 @@ class NotesAndPdfRequest(NotesRequest):
     title: str | None = None   # optional custom title for PDF cover
 
 
+def notes_response(result: NotesResult) -> dict:
+    return {
+        "request_id": result.request_id,
+        "context_length": result.context_length,
+        "notes_markdown": result.notes_markdown,
+        "units": [unit.provenance() for unit in result.units],
+        "failed_units": [i for i, unit in enumerate(result.units) if unit.error is not None],
+        "timings": result.timings,
+        "coalesced": result.coalesced,
+    }
+
+
 @router.post("/generate")
 def generate_notes(req: NotesRequest):
     """
     Step 1: Generate ONLY markdown notes (no PDF).
     Useful for preview or debugging.
     """
+    pipeline = NotesPipeline(
+        subject=req.subject,
+        use_pyq=req.use_pyq,
+        top_k=req.top_k,
+    )
     try:
-        # (A) Get RAG context
-        context = retrieve_relevant_context(
-            syllabus_text=req.syllabus_text,
-            subject=req.subject,
-            use_pyq=req.use_pyq,
-            top_k=req.top_k,
-        )
+        # Single pass: HyDE + RAG + LLM per unit, provenance kept along the way
+        return notes_response(pipeline.run(req.syllabus_text))
 
-        # (B) Generate final notes markdown using LLM
-        notes_md = generate_final_notes(
-            syllabus_text=req.syllabus_text,
-            subject=req.subject,
-            use_pyq=req.use_pyq,
-            top_k=req.top_k,
+    except Exception as e:
+        # Units finished before the failure are checkpointed: POST /notes/resume/{request_id}
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"Notes generation failed: {str(e)}",
+                "request_id": pipeline.fingerprint(req.syllabus_text),
+            },
         )
 
-        return {
-            "context_length": len(context),
-            "notes_markdown": notes_md,
-        }
 
+@router.post("/resume/{request_id}")
+def resume_generation(request_id: str):
+    """
+    Re-runs a previous /generate request: units that completed are taken
+    from their checkpoints, only missing or failed units are generated.
+    """
+    try:
+        result = resume_notes(request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Notes generation failed: {str(e)}"
+            detail={"message": f"Notes generation failed: {str(e)}", "request_id": request_id},
         )
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No checkpoints for request '{request_id}'")
+    return notes_response(result)
+
+
+@router.get("/checkpoints/{request_id}")
+def checkpoint_status(request_id: str):
+    try:
+        status = checkpoint_store.status(request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"No checkpoints for request '{request_id}'")
+    return status
 
 
 @router.post("/generate-and-export/pdf")
@@ -105,12 +141,11 @@ def generate_notes_and_pdf(req: NotesAndPdfRequest):
     """
     try:
         # (A) Generate full notes markdown
-        notes_md = generate_final_notes(
-            syllabus_text=req.syllabus_text,
+        notes_md = NotesPipeline(
             subject=req.subject,
             use_pyq=req.use_pyq,
             top_k=req.top_k,
-        )
+        ).run(req.syllabus_text).notes_markdown
 
         if not notes_md or not notes_md.strip():
             raise RuntimeError("Generated notes are empty; cannot create PDF.")
@@ -124,23 +159,18 @@ def generate_notes_and_pdf(req: NotesAndPdfRequest):
             else:
                 title = "Syllabus GPT - Generated Notes"
 
-        filename = req.filename or "notes.pdf"
-
-        # (C) Generate PDF from markdown
-        pdf_path = generate_beautiful_pdf(
+        # (C) Generate PDF from markdown (in memory)
+        pdf, content_key = get_or_build_pdf(
             markdown_text=notes_md,
-            filename=filename,
             title=title,
             subject=req.subject or "",
         )
 
-        # (D) Return file
-        return FileResponse(
-            path=pdf_path,
-            media_type="application/pdf",
-            filename=filename
-        )
+        # (D) Stream file
+        return pdf_streaming_response(pdf, req.filename, content_key)
 
+    except (PoolBusyError, CpuTaskTimeout) as e:
+        raise cpu_pool_http_error(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
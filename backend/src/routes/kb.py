@@ -0,0 +1,116 @@
+import os
+import uuid
+from typing import List
+
+from fastapi import APIRouter, File, HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from src.routes.upload_limits import read_upload
+from src.services.kb_ingest import IngestQueueFull, ingest_worker
+from src.services.preprocess_kb import RAW_DIR
+from src.services.semantic_cache import retrieval_cache
+from src.services.vector_store import get_generations, reload_indexes
+
+# ==== CONFIG ====
+INGEST_RETRY_AFTER_SECONDS = int(os.getenv("INGEST_RETRY_AFTER_SECONDS", "60"))
+
+router = APIRouter(
+    prefix="/kb",
+    tags=["Knowledge Base"]
+)
+
+
+@router.get("/generation")
+def kb_generation():
+    """Index generation this worker is serving, plus any still draining."""
+    return {**get_generations().status(), "retrieval_cache": retrieval_cache.stats()}
+
+
+@router.post("/reload")
+def kb_reload():
+    """
+    Switches this worker to the most recently published index generation
+    (and reloads the compressed index / snapshot file when that is the
+    retrieval backend). In-flight queries finish on the previous one.
+    """
+    return reload_indexes()
+
+
+# ---------------------------------------------------------
+#  RUNTIME INGESTION
+# ---------------------------------------------------------
+def _queue_full(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(INGEST_RETRY_AFTER_SECONDS)},
+    )
+
+
+def _stage_raw_file(filename: str, content: bytes) -> str:
+    os.makedirs(RAW_DIR, exist_ok=True)
+    tmp = os.path.join(RAW_DIR, f"{filename}.{os.getpid()}.{uuid.uuid4().hex}.upload")
+    with open(tmp, "wb") as f:
+        f.write(content)
+    return tmp
+
+
+def _discard(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@router.post("/ingest", status_code=202)
+async def kb_ingest(files: List[UploadFile] = File(...)):
+    """
+    Adds PDFs to the knowledge base without a restart. Files are saved to
+    the raw files folder and queued; extraction, OCR, chunking and embedding
+    happen in the background and end in a new published index generation.
+    Poll GET /kb/ingest/{job_id} for per-file status (any server process can
+    answer it: job status is kept in INGEST_JOBS_DIR).
+    """
+    names = [os.path.basename(f.filename or "") for f in files]
+    bad = [n for n in names if not n.lower().endswith(".pdf")]
+    if bad:
+        raise HTTPException(status_code=400, detail=f"Only PDF files can be ingested: {bad}")
+    # All or nothing: don't accept half a batch the queue can't hold
+    try:
+        ingest_worker.reserve(len(files))
+    except IngestQueueFull as e:
+        raise _queue_full(str(e))
+
+    # Nothing lands in the raw files folder until the whole batch is accepted
+    staged = []
+    try:
+        for upload, name in zip(files, names):
+            content = await read_upload(upload)
+            staged.append(await run_in_threadpool(_stage_raw_file, name, content))
+    except BaseException:
+        ingest_worker.release(len(files))
+        await run_in_threadpool(_discard, staged)
+        raise
+
+    jobs = []
+    for tmp, name in zip(staged, names):
+        path = os.path.join(RAW_DIR, name)
+        os.replace(tmp, path)
+        jobs.append(ingest_worker.submit(name, path))
+
+    return {"jobs": [job.to_dict() for job in jobs]}
+
+
+@router.get("/ingest")
+def kb_ingest_jobs():
+    """Recent ingestion jobs (all server processes), newest first; free_slots is this process's queue."""
+    return {"free_slots": ingest_worker.free_slots(), "jobs": [job.to_dict() for job in ingest_worker.jobs()]}
+
+
+@router.get("/ingest/{job_id}")
+def kb_ingest_status(job_id: str):
+    job = ingest_worker.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job '{job_id}'")
+    return job.to_dict()
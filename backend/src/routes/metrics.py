@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from src.services.admission import admission_stats
+from src.services.metrics import render_metrics
+
+router = APIRouter(tags=["Metrics"])        # mounted at the root (Prometheus scrapes /metrics)
+api_router = APIRouter(tags=["Metrics"])    # mounted under /api
+
+
+@router.get("/metrics")
+def metrics():
+    """
+    Prometheus scrape endpoint (per-stage latency, LLM TTFT, cache hit rates).
+    """
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
+@api_router.get("/admission")
+def admission():
+    """
+    Per route class: running / queued requests and the limits they are held to.
+    """
+    return admission_stats()
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
 from src.services.hyde_llm import parse_syllabus_into_topics
+from src.services.metrics import track_stage
+from src.services.syllabus_parser import parse_syllabus, SYLLABUS_PARSER_MIN_CONFIDENCE
 
 router = APIRouter()
 
@@ -9,6 +11,11 @@ class SyllabusData(BaseModel):
 
 @router.post("/parse-topics")
 def parse_topics(data: SyllabusData):
-    topics = parse_syllabus_into_topics(data.text)
-    return {"topics": topics}
+    # Well-formed syllabi are parsed locally; the LLM only sees the messy ones
+    with track_stage("syllabus_parse"):
+        parsed = parse_syllabus(data.text)
+    if parsed.confidence >= SYLLABUS_PARSER_MIN_CONFIDENCE:
+        return {"topics": parsed.topics, "parser": "local", "confidence": parsed.confidence}
 
+    topics = parse_syllabus_into_topics(data.text)
+    return {"topics": topics, "parser": "llm", "confidence": parsed.confidence}
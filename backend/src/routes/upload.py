@@ -1,25 +1,166 @@
-from fastapi import APIRouter, UploadFile, File
-from src.services.pdf_extract import extract_text_from_pdf
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from typing import List
+
+from fastapi import APIRouter, UploadFile, File, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from src.routes.errors import cpu_pool_http_error
+from src.routes.upload_limits import MAX_UPLOAD_BYTES, read_upload, upload_too_large
+from src.services.pdf_extract import extract_text_from_pdf, count_pdf_pages, extract_page_range
 from src.services.ocr import extract_text_from_image
+from src.services.cpu_pool import CPU_POOL_WORKERS, CpuTaskTimeout, PoolBusyError, run_cpu_bound
+
+# ==== CONFIG ====
+UPLOAD_PAGES_PER_TASK = int(os.getenv("UPLOAD_PAGES_PER_TASK", "4"))
+SPOOL_CHUNK_SIZE = 1024 * 1024
 
 router = APIRouter()
 
+
 @router.post("/upload")
 async def upload_syllabus(file: UploadFile = File(...)):
     filename = file.filename.lower()
-    content = await file.read()
+    content = await read_upload(file)
+
+    try:
+        # PDF
+        if filename.endswith(".pdf"):
+            text = await run_cpu_bound(extract_text_from_pdf, content)
+            return {"status": "success", "text": text}
 
-    # PDF
-    if filename.endswith(".pdf"):
-        text = extract_text_from_pdf(content)
-        return {"status": "success", "text": text}
+        # Image
+        if filename.endswith((".jpg", ".jpeg", ".png")):
+            text = await run_cpu_bound(extract_text_from_image, content)
+            return {"status": "success", "text": text}
 
-    # Image
-    if filename.endswith((".jpg", ".jpeg", ".png")):
-        text = extract_text_from_image(content)
-        return {"status": "success", "text": text}
+    except (PoolBusyError, CpuTaskTimeout) as e:
+        raise cpu_pool_http_error(e)
 
     # Plain text file
     text = content.decode("utf-8")
     return {"status": "success", "text": text}
 
+
+# ---------------------------------------------------------
+#  STREAMING PDF UPLOAD
+#  raw PDF body → temp file (size capped) → page ranges in
+#  parallel → NDJSON lines as each range finishes
+# ---------------------------------------------------------
+async def _spool_request_body(request: Request) -> str:
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES:
+        raise upload_too_large()
+
+    tmp = tempfile.NamedTemporaryFile(prefix="syllabus-", suffix=".pdf", delete=False)
+    size = 0
+    buffer = bytearray()
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise upload_too_large()
+            buffer += chunk
+            if len(buffer) >= SPOOL_CHUNK_SIZE:
+                await run_in_threadpool(tmp.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(tmp.write, bytes(buffer))
+        tmp.close()
+        return tmp.name
+    except BaseException:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+
+
+def _unlink_when_done(path: str, futures: List[Future]):
+    """Removes the spooled PDF once no range submitted to the pool can still open it."""
+    running = [f for f in futures if not f.cancel() and not f.done()]  # cancel() only stops queued ones
+    if not running:
+        os.unlink(path)
+        return
+
+    left = len(running)
+    lock = threading.Lock()
+
+    def finished(_future):
+        nonlocal left
+        with lock:
+            left -= 1
+            last = left == 0
+        if last:
+            os.unlink(path)
+
+    for future in running:
+        future.add_done_callback(finished)
+
+
+async def _stream_pages(path: str, page_count: int):
+    ranges = [
+        (start, min(start + UPLOAD_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, UPLOAD_PAGES_PER_TASK)
+    ]
+    # Keep at most one range per pool worker in flight so a single upload
+    # cannot fill the shared queue on its own.
+    window = asyncio.Semaphore(CPU_POOL_WORKERS)
+    submitted: List[Future] = []
+
+    async def run_range(start: int, end: int):
+        async with window:
+            pages = await run_cpu_bound(extract_page_range, path, start, end, on_submit=submitted.append)
+            return start, end, pages
+
+    tasks = [asyncio.ensure_future(run_range(s, e)) for s, e in ranges]
+    ocr_pages = 0
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                start, end, pages = await finished
+            except Exception as e:
+                # pool busy, timeout or a worker error (e.g. a corrupt page): always end
+                # with an explicit line so clients can tell this from a cut-off stream
+                yield json.dumps({"status": "error", "detail": str(e) or type(e).__name__}) + "\n"
+                return
+
+            ocr_pages += sum(1 for p in pages if p["ocr"])
+            yield json.dumps({
+                "status": "partial",
+                "pages": [start + 1, end],
+                "text": "\n".join(p["text"] for p in pages),
+                "ocr_pages": [p["page"] for p in pages if p["ocr"]],
+            }) + "\n"
+
+        yield json.dumps({"status": "done", "page_count": page_count, "ocr_pages": ocr_pages}) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        _unlink_when_done(path, submitted)
+
+
+@router.post("/upload/stream")
+async def upload_syllabus_stream(request: Request):
+    """
+    Streaming upload for large / scanned PDFs.
+    Send the raw PDF as the request body (Content-Type: application/pdf).
+    The response is NDJSON: one "partial" line per page range as soon as it
+    is extracted (ranges may arrive out of order), then a final "done" line,
+    or an "error" line if a range could not be extracted.
+    """
+    path = await _spool_request_body(request)
+
+    try:
+        page_count = await run_cpu_bound(count_pdf_pages, path)
+    except (PoolBusyError, CpuTaskTimeout) as e:
+        os.unlink(path)
+        raise cpu_pool_http_error(e)
+    except Exception as e:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail=f"Invalid PDF: {str(e)}")
+
+    return StreamingResponse(_stream_pages(path, page_count), media_type="application/x-ndjson")
@@ -0,0 +1,21 @@
+import os
+
+from fastapi import HTTPException, UploadFile
+
+# ==== CONFIG ====
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+
+
+def upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit",
+    )
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """The whole uploaded file; 413 once it passes MAX_UPLOAD_BYTES (reads at most one byte more)."""
+    content = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(content) > MAX_UPLOAD_BYTES:
+        raise upload_too_large()
+    return content
@@ -0,0 +1,262 @@
+"""
+Per-route admission control.
+
+Sync routes all share one AnyIO threadpool, so a burst of full-syllabus
+generations (each holding a thread for minutes) used to starve even cheap
+retrieval calls. Requests are now admitted on the event loop, before they
+take a thread, through one gate per route class:
+
+  - at most `limit` requests of the class run at once,
+  - up to `max_queue` more wait in FIFO order, each for at most `max_wait`
+    seconds,
+  - beyond that the caller gets 429 (queue full) or 503 (waited too long)
+    with Retry-After and its queue position, instead of tying up a thread.
+
+Queue positions: a 429 reports the position the request would have taken,
+a 503 the position it had reached when it gave up, and the x-queue-position
+header of an admitted request the position it had on arrival.
+
+Because the generation gate caps how many threads generation can hold, and
+retrieval has its own gate, retrieval latency stays flat during a burst as
+long as the threadpool is larger than the sum of the gated limits
+(check_threadpool_budget warns at startup otherwise).
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from src.services.metrics import ADMISSION_REJECTED, ADMISSION_WAIT
+
+# ==== CONFIG ====
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+DEFAULT_SERVICE_SECONDS = 5.0   # Retry-After estimate before any request has finished
+SERVICE_EWMA_ALPHA = 0.2
+MAX_RETRY_AFTER_SECONDS = 300
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+# name → (path prefixes, limit, max_queue, max_wait seconds); first matching prefix wins
+ROUTE_CLASSES: Dict[str, Tuple[Tuple[str, ...], int, int, float]] = {
+    "generation": (
+        ("/api/notes/generate", "/api/notes/resume/"),
+        _env_int("ADMISSION_GENERATION_LIMIT", 4),
+        _env_int("ADMISSION_GENERATION_QUEUE", 16),
+        _env_float("ADMISSION_GENERATION_MAX_WAIT", 60),
+    ),
+    "llm": (
+        ("/api/hyde/generate", "/api/parse-topics"),
+        _env_int("ADMISSION_LLM_LIMIT", 16),
+        _env_int("ADMISSION_LLM_QUEUE", 64),
+        _env_float("ADMISSION_LLM_MAX_WAIT", 15),
+    ),
+    "retrieval": (
+        ("/api/retrieve/",),
+        _env_int("ADMISSION_RETRIEVAL_LIMIT", 16),
+        _env_int("ADMISSION_RETRIEVAL_QUEUE", 256),
+        _env_float("ADMISSION_RETRIEVAL_MAX_WAIT", 5),
+    ),
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, gate: str, status_code: int, detail: str, queue_position: int, retry_after: int):
+        super().__init__(detail)
+        self.gate = gate
+        self.status_code = status_code
+        self.detail = detail
+        self.queue_position = queue_position
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, position: int, waited: float):
+        self.position = position       # 0 = admitted immediately
+        self.waited = waited
+        self.admitted_at = time.perf_counter()
+
+
+# ---------------------------------------------------------
+#  GATE (one per route class, lives on the event loop)
+# ---------------------------------------------------------
+class Gate:
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._service_seconds = DEFAULT_SERVICE_SECONDS
+
+    def retry_after(self, position: int) -> int:
+        rounds = math.ceil(max(position, 1) / max(self.limit, 1))
+        return int(min(MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(rounds * self._service_seconds))))
+
+    def _reject(self, status_code: int, detail: str, position: int) -> AdmissionRejected:
+        ADMISSION_REJECTED.labels(gate=self.name, status=str(status_code)).inc()
+        return AdmissionRejected(self.name, status_code, detail, position, self.retry_after(position))
+
+    async def acquire(self) -> Ticket:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            ADMISSION_WAIT.labels(gate=self.name).observe(0.0)
+            return Ticket(0, 0.0)
+
+        position = len(self._waiters) + 1
+        if position > self.max_queue:
+            raise self._reject(429, f"Too many '{self.name}' requests queued; retry later", position)
+
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            # client went away while queued: give back a slot handed to us meanwhile
+            self._abandon(waiter)
+            raise
+
+        if not waiter.done():
+            position = self._live_position(waiter)
+            self._abandon(waiter)
+            raise self._reject(503, f"Waited {self.max_wait:.0f}s for a '{self.name}' slot; retry later", position)
+
+        waited = time.perf_counter() - start
+        ADMISSION_WAIT.labels(gate=self.name).observe(waited)
+        return Ticket(position, waited)
+
+    def _live_position(self, waiter: asyncio.Future) -> int:
+        """1-based position of `waiter` among the requests still queued."""
+        position = 1
+        for other in self._waiters:
+            if other is waiter:
+                break
+            if not other.done():
+                position += 1
+        return position
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+        else:
+            waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self, ticket: Optional[Ticket] = None):
+        if ticket is not None:
+            elapsed = time.perf_counter() - ticket.admitted_at
+            self._service_seconds += SERVICE_EWMA_ALPHA * (elapsed - self._service_seconds)
+        # Hand the slot straight to the next live waiter (FIFO), else free it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": sum(1 for w in self._waiters if not w.done()),
+            "max_queue": self.max_queue,
+            "max_wait": self.max_wait,
+            "service_seconds_ewma": round(self._service_seconds, 3),
+        }
+
+
+gates: Dict[str, Gate] = {
+    name: Gate(name, limit, max_queue, max_wait)
+    for name, (_, limit, max_queue, max_wait) in ROUTE_CLASSES.items()
+}
+_prefixes: List[Tuple[str, Gate]] = [
+    (prefix, gates[name]) for name, (prefixes, *_) in ROUTE_CLASSES.items() for prefix in prefixes
+]
+
+
+def gate_for(path: str) -> Optional[Gate]:
+    for prefix, gate in _prefixes:
+        if path.startswith(prefix):
+            return gate
+    return None
+
+
+def admission_stats() -> dict:
+    return {"enabled": ADMISSION_ENABLED, "gates": {name: gate.stats() for name, gate in gates.items()}}
+
+
+def check_threadpool_budget(threads: int):
+    """Warns when the gated limits can use up the whole threadpool (no isolation left)."""
+    gated = sum(gate.limit for gate in gates.values())
+    if ADMISSION_ENABLED and gated >= threads:
+        print(f"⚠️ Admission limits add up to {gated} concurrent requests but the threadpool has "
+              f"{threads} threads; ungated routes can still starve under load")
+
+
+# ---------------------------------------------------------
+#  ASGI MIDDLEWARE
+#  Pure ASGI (not BaseHTTPMiddleware) so the slot is held until the
+#  response body, streamed or not, has been fully sent.
+# ---------------------------------------------------------
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        gate = gate_for(scope["path"]) if ADMISSION_ENABLED and scope["type"] == "http" else None
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            ticket = await gate.acquire()
+        except AdmissionRejected as e:
+            await self._send_rejection(send, e)
+            return
+
+        async def send_with_queue_headers(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-queue-position", str(ticket.position).encode()),
+                    (b"x-queue-wait-ms", str(int(ticket.waited * 1000)).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_queue_headers)
+        finally:
+            gate.release(ticket)
+
+    @staticmethod
+    async def _send_rejection(send, e: AdmissionRejected):
+        body = json.dumps({
+            "detail": e.detail,
+            "gate": e.gate,
+            "queue_position": e.queue_position,
+            "retry_after": e.retry_after,
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": e.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(e.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
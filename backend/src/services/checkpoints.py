@@ -0,0 +1,127 @@
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.services.fs_utils import read_json, write_json_atomic
+from src.services.singleflight import normalize_text, request_key
+
+# ==== CONFIG ====
+# Set NOTES_CHECKPOINTS=0 to disable checkpointing (and resume).
+NOTES_CHECKPOINTS = os.getenv("NOTES_CHECKPOINTS", "1") != "0"
+NOTES_CHECKPOINT_DIR = os.getenv("NOTES_CHECKPOINT_DIR", "./checkpoints/notes")
+NOTES_CHECKPOINT_TTL_SECONDS = float(os.getenv("NOTES_CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600)))
+PRUNE_INTERVAL_SECONDS = 600
+MANIFEST_FILE = "manifest.json"
+
+
+def unit_fingerprint(unit: Dict[str, str]) -> str:
+    return request_key(normalize_text(unit["unit_title"]), normalize_text(unit["unit_text"]))
+
+
+# ---------------------------------------------------------
+#  UNIT CHECKPOINTS
+#  One directory per request fingerprint:
+#    manifest.json   request parameters, unit list, per-unit state
+#    unit_<i>.json   artifacts of every unit that completed without error
+#  A resumed request reuses the stored units and regenerates the rest.
+# ---------------------------------------------------------
+class CheckpointStore:
+    def __init__(self, root: str = NOTES_CHECKPOINT_DIR, ttl_seconds: float = NOTES_CHECKPOINT_TTL_SECONDS,
+                 enabled: bool = NOTES_CHECKPOINTS):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+
+    def _dir(self, fingerprint: str) -> str:
+        if not fingerprint.isalnum():
+            raise ValueError(f"invalid request id '{fingerprint}'")
+        return os.path.join(self.root, fingerprint)
+
+    def _unit_path(self, fingerprint: str, index: int) -> str:
+        return os.path.join(self._dir(fingerprint), f"unit_{index}.json")
+
+    def start(self, fingerprint: str, request: dict, units: List[Dict[str, str]]):
+        """Records the request (so it can be resumed by fingerprint alone) and its units."""
+        if not self.enabled:
+            return
+        self._maybe_prune()
+        os.makedirs(self._dir(fingerprint), exist_ok=True)
+        manifest = self.manifest(fingerprint) or {"created": time.time()}
+        manifest.update({
+            "request_id": fingerprint,
+            "request": request,
+            "units": [{"unit_title": u["unit_title"], "fingerprint": unit_fingerprint(u)} for u in units],
+            "status": "running",
+            "updated": time.time(),
+        })
+        write_json_atomic(os.path.join(self._dir(fingerprint), MANIFEST_FILE), manifest)
+
+    def finish(self, fingerprint: str, failed: List[int]):
+        if not self.enabled:
+            return
+        manifest = self.manifest(fingerprint)
+        if manifest is None:
+            return
+        manifest.update({"status": "partial" if failed else "complete", "failed_units": failed,
+                         "updated": time.time()})
+        write_json_atomic(os.path.join(self._dir(fingerprint), MANIFEST_FILE), manifest)
+
+    def manifest(self, fingerprint: str) -> Optional[dict]:
+        return read_json(os.path.join(self._dir(fingerprint), MANIFEST_FILE))
+
+    def save_unit(self, fingerprint: str, index: int, unit: Dict[str, str], artifacts: dict):
+        if not self.enabled:
+            return
+        os.makedirs(self._dir(fingerprint), exist_ok=True)
+        write_json_atomic(self._unit_path(fingerprint, index),
+                    {"fingerprint": unit_fingerprint(unit), "artifacts": artifacts})
+
+    def load_unit(self, fingerprint: str, index: int, unit: Dict[str, str]) -> Optional[dict]:
+        """Stored artifacts of unit `index`, if it completed and is still the same unit."""
+        if not self.enabled:
+            return None
+        data = read_json(self._unit_path(fingerprint, index))
+        if data is None or data.get("fingerprint") != unit_fingerprint(unit):
+            return None
+        return data["artifacts"]
+
+    def status(self, fingerprint: str) -> Optional[dict]:
+        manifest = self.manifest(fingerprint)
+        if manifest is None:
+            return None
+        units = manifest.get("units", [])
+        done = [i for i in range(len(units)) if os.path.exists(self._unit_path(fingerprint, i))]
+        return {
+            "request_id": fingerprint,
+            "status": manifest.get("status"),
+            "units": len(units),
+            "completed_units": done,
+            "missing_units": [i for i in range(len(units)) if i not in done],
+            "updated": manifest.get("updated"),
+        }
+
+    def delete(self, fingerprint: str):
+        shutil.rmtree(self._dir(fingerprint), ignore_errors=True)
+
+    def _maybe_prune(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < PRUNE_INTERVAL_SECONDS:
+                return
+            self._last_prune = now
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(os.path.join(path, MANIFEST_FILE)) > self.ttl_seconds:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+
+checkpoint_store = CheckpointStore()
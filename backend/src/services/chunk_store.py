@@ -0,0 +1,186 @@
+"""
+Chunk text stored as offsets into the processed KB text files.
+
+preprocess_kb already writes every extracted document to
+knowledgebase/processed/*.txt. With CHUNK_STORE=offsets the index keeps only
+a reference into that file per chunk (metadata "text_file", "byte_start",
+"byte_end") and no document string: Chroma then holds neither a second copy
+of the text nor its full-text index over it.
+
+Reads go through read-only mmaps of the processed files (shared page cache,
+nothing loaded up front). A chunk is decoded straight from a memoryview
+slice of the map, so the only copy made is the returned str itself.
+
+In offsets mode the processed file name carries a digest of its content
+("<name>_<TYPE>.<digest>.txt"), so re-extracting a source never changes the
+bytes an older, still-served generation points into. Files no generation
+references any more are removed by `kb_maintenance prune-texts`.
+
+Having the surrounding text at hand also makes neighbour windows cheap:
+`window()` returns a chunk plus up to N bytes on either side.
+"""
+import hashlib
+import mmap
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# ==== CONFIG ====
+# inline  → chunk text stored as the Chroma document (original behaviour)
+# offsets → only (text_file, byte_start, byte_end) stored, text read from PROCESSED_DIR
+CHUNK_STORE = os.getenv("CHUNK_STORE", "inline")
+PROCESSED_DIR = "./knowledgebase/processed"
+# Bytes of surrounding text added on each side of retrieved chunks (0 = off)
+CHUNK_EXPAND_BYTES = int(os.getenv("CHUNK_EXPAND_BYTES", "0"))
+DIGEST_CHARS = 12
+
+OFFSET_KEYS = ("text_file", "byte_start", "byte_end")
+
+
+def processed_file_name(source: str, content_type: str, text: str, store: str = CHUNK_STORE) -> str:
+    stem = f"{os.path.splitext(source)[0]}_{content_type}"
+    if store == "offsets":
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:DIGEST_CHARS]
+        return f"{stem}.{digest}.txt"
+    return f"{stem}.txt"
+
+
+def is_versioned_file(name: str) -> bool:
+    """True for the digest-named files written in offsets mode."""
+    stem, ext = os.path.splitext(name)
+    digest = os.path.splitext(stem)[1][1:]
+    return ext == ".txt" and len(digest) == DIGEST_CHARS and all(c in "0123456789abcdef" for c in digest)
+
+
+def byte_offsets(text: str, spans: Sequence[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Maps [start, end) character spans of `text` to UTF-8 byte spans."""
+    if text.isascii():
+        return [(start, end) for start, end in spans]
+
+    # Encode each stretch between consecutive offsets once (linear in the text)
+    positions = sorted({p for span in spans for p in span})
+    to_byte: Dict[int, int] = {}
+    char_pos = byte_pos = 0
+    for p in positions:
+        byte_pos += len(text[char_pos:p].encode("utf-8"))
+        char_pos = p
+        to_byte[p] = byte_pos
+    return [(to_byte[start], to_byte[end]) for start, end in spans]
+
+
+def offset_metadata(text_file: str, byte_span: Tuple[int, int]) -> Dict:
+    return {"text_file": text_file, "byte_start": byte_span[0], "byte_end": byte_span[1]}
+
+
+def has_offsets(meta: Optional[dict]) -> bool:
+    return bool(meta) and all(key in meta for key in OFFSET_KEYS)
+
+
+def store_chunks(write: Callable, ids: List[str], embeddings, documents: List[str], metadatas: List[dict]):
+    """
+    Writes one batch through `write` (collection.add / upsert). Under
+    CHUNK_STORE=offsets, chunks with offset metadata go in without their
+    document; everything else keeps its text.
+    """
+    rows = range(len(ids))
+    offset_rows = [i for i in rows if CHUNK_STORE == "offsets" and has_offsets(metadatas[i])]
+    groups = [(offset_rows, False)]
+    if len(offset_rows) < len(ids):
+        skip = set(offset_rows)
+        groups.append(([i for i in rows if i not in skip], True))
+
+    for group, with_text in groups:
+        if not group:
+            continue
+        write(
+            ids=[ids[i] for i in group],
+            embeddings=[embeddings[i] for i in group],
+            documents=[documents[i] for i in group] if with_text else None,
+            metadatas=[metadatas[i] for i in group],
+        )
+
+
+# ---------------------------------------------------------
+#  MEMORY-MAPPED READER
+# ---------------------------------------------------------
+class ChunkStore:
+    def __init__(self, root: str = PROCESSED_DIR):
+        self.root = root
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._lock = threading.Lock()
+
+    def _map(self, text_file: str) -> Optional[mmap.mmap]:
+        mapped = self._maps.get(text_file)
+        if mapped is not None:
+            return mapped
+        with self._lock:
+            mapped = self._maps.get(text_file)
+            if mapped is None:
+                if os.path.basename(text_file) != text_file:
+                    raise ValueError(f"invalid processed file name '{text_file}'")
+                try:
+                    with open(os.path.join(self.root, text_file), "rb") as f:
+                        # the mapping stays valid after the file object is closed
+                        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (FileNotFoundError, ValueError) as e:  # ValueError: empty file
+                    print(f"⚠️ Chunk text unavailable, {text_file}: {e}")
+                    return None
+                self._maps[text_file] = mapped
+            return mapped
+
+    def _slice(self, mapped: mmap.mmap, start: int, end: int) -> str:
+        with memoryview(mapped) as view:
+            return str(view[start:end], "utf-8", "replace")
+
+    def _map_for(self, meta: dict) -> Optional[mmap.mmap]:
+        mapped = self._map(meta["text_file"])
+        if mapped is None or not 0 <= meta["byte_start"] <= meta["byte_end"] <= len(mapped):
+            return None   # file missing, or not the file these offsets were taken from
+        return mapped
+
+    def text(self, meta: dict) -> Optional[str]:
+        """The chunk's text, None if its processed file / offsets are unavailable."""
+        mapped = self._map_for(meta)
+        if mapped is None:
+            return None
+        return self._slice(mapped, meta["byte_start"], meta["byte_end"])
+
+    def window(self, meta: dict, before: int, after: Optional[int] = None) -> Optional[str]:
+        """The chunk plus up to `before` / `after` bytes of its neighbours (whole characters)."""
+        mapped = self._map_for(meta)
+        if mapped is None:
+            return None
+        after = before if after is None else after
+        start = max(0, meta["byte_start"] - before)
+        end = min(len(mapped), meta["byte_end"] + after)
+        # don't cut a multi-byte character: skip UTF-8 continuation bytes
+        while start < meta["byte_start"] and mapped[start] & 0xC0 == 0x80:
+            start += 1
+        while end > meta["byte_end"] and end < len(mapped) and mapped[end] & 0xC0 == 0x80:
+            end -= 1
+        return self._slice(mapped, start, end)
+
+    def resolve(self, documents: Optional[Sequence[Optional[str]]], metadatas: Sequence[Optional[dict]],
+                expand: int = CHUNK_EXPAND_BYTES) -> List[str]:
+        """
+        Chunk texts for a result page: stored documents where the index has
+        them, offset lookups otherwise (or for every chunk when expanding).
+        A stored document is kept whenever its offsets can't be read.
+        """
+        documents = documents or [None] * len(metadatas)
+        texts = []
+        for doc, meta in zip(documents, metadatas):
+            text = None
+            if has_offsets(meta) and (expand > 0 or not doc):
+                text = self.window(meta, expand) if expand > 0 else self.text(meta)
+            texts.append(text if text is not None else (doc or ""))
+        return texts
+
+    def close(self):
+        with self._lock:
+            maps, self._maps = self._maps, {}
+        for mapped in maps.values():
+            mapped.close()
+
+
+chunk_store = ChunkStore()
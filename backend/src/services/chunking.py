@@ -0,0 +1,242 @@
+"""
+Structure-aware, token-budgeted chunker.
+
+Text is first cut into blocks at paragraph, heading and question boundaries,
+all blocks are tokenized in one batched call with the embedder's tokenizer,
+and blocks are then packed into chunks of at most `max_tokens` tokens.
+Only blocks that are longer than the budget on their own are split, at token
+(preferably sentence) boundaries with a small overlap.
+
+Every chunk keeps its [start, end) character offsets into the source text.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces (incl. [CLS]/[SEP])
+DEFAULT_MAX_TOKENS = 250
+DEFAULT_MIN_TOKENS = 128       # don't close a chunk at a heading before this
+DEFAULT_OVERLAP_TOKENS = 32    # only used when a single block must be split
+MIN_KEEP_TOKENS = 12           # standalone fragments smaller than this are dropped
+
+# ---------- BOUNDARY PATTERNS ----------
+# Headings: "Chapter 3", "UNIT-II", "2.4 Decision Trees", "# Title"
+HEADING_RE = re.compile(
+    r"^\s*(?:"
+    r"#{1,6}\s+\S"
+    r"|(?:chapter|section|unit|module|part)[\s\-]*(?:\d+|[ivxlc]+)\b"
+    r"|\d+(?:\.\d+){0,3}\.?\s+[A-Z][^\n]{0,80}$"
+    r")",
+    re.IGNORECASE,
+)
+# Questions: "Q1.", "Q. 3", "Question 2:", "(a)", "b)"
+QUESTION_RE = re.compile(
+    r"^\s*(?:Q\.?\s*\d+|Question\s*\d+|\(?[a-h]\)\s)",
+    re.IGNORECASE,
+)
+SENTENCE_END_RE = re.compile(r"[.?!:;\"”)]\s*$")
+SENTENCE_END_TOKENS = {".", "?", "!", ";"}
+
+
+@dataclass
+class Chunk:
+    text: str
+    start: int
+    end: int
+    tokens: int
+
+
+def load_tokenizer(model_name: str = EMBEDDING_MODEL):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+# ---------- LEGACY FIXED-WINDOW CHUNKER (kept for benchmarks) ----------
+def chunk_text(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
+    chunks = []
+    start = 0
+    n = len(text)
+
+    while start < n:
+        end = min(start + chunk_size, n)
+        chunks.append(text[start:end])
+        start += (chunk_size - overlap)
+
+    return chunks
+
+
+# ---------- 1. BLOCK SEGMENTATION ----------
+def split_blocks(text: str) -> List[Tuple[int, int, bool]]:
+    """
+    Returns (start, end, hard) spans. `hard` marks blocks that open with a
+    heading or question, which should start a new chunk.
+
+    Extracted PDF text rarely has blank lines, so a paragraph end is also
+    inferred from a short line that ends a sentence.
+    """
+    lines = []
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        lines.append((pos, line))
+        pos += len(line)
+    if not lines:
+        return []
+
+    lengths = sorted(len(l.rstrip()) for _, l in lines if l.strip())
+    typical_width = lengths[int(len(lengths) * 0.75)] if lengths else 80
+
+    blocks = []
+    block_start: Optional[int] = None
+    block_hard = False
+    prev_ends_paragraph = False
+
+    for line_start, line in lines:
+        stripped = line.strip()
+        if not stripped:
+            # blank line → paragraph break
+            if block_start is not None:
+                blocks.append((block_start, line_start, block_hard))
+                block_start = None
+            prev_ends_paragraph = False
+            continue
+
+        hard = bool(HEADING_RE.match(line) or QUESTION_RE.match(line))
+        if block_start is not None and (hard or prev_ends_paragraph):
+            blocks.append((block_start, line_start, block_hard))
+            block_start = None
+
+        if block_start is None:
+            block_start = line_start
+            block_hard = hard
+
+        content = line.rstrip()
+        prev_ends_paragraph = (
+            hard and len(content) < typical_width * 0.8  # a heading line stands alone
+        ) or (
+            bool(SENTENCE_END_RE.search(content)) and len(content) < typical_width * 0.8
+        )
+
+    if block_start is not None:
+        blocks.append((block_start, len(text), block_hard))
+
+    # trim surrounding whitespace so offsets point at real content
+    trimmed = []
+    for start, end, hard in blocks:
+        segment = text[start:end]
+        lead = len(segment) - len(segment.lstrip())
+        trail = len(segment) - len(segment.rstrip())
+        if end - trail > start + lead:
+            trimmed.append((start + lead, end - trail, hard))
+    return trimmed
+
+
+# ---------- 2. OVERSIZED BLOCK SPLITTING ----------
+def _split_long_block(
+    text: str,
+    start: int,
+    offsets: List[Tuple[int, int]],
+    max_tokens: int,
+    overlap_tokens: int,
+) -> List[Chunk]:
+    chunks = []
+    n = len(offsets)
+    i = 0
+    while i < n:
+        j = min(i + max_tokens, n)
+
+        # prefer to end on a sentence boundary in the second half of the window
+        if j < n:
+            for k in range(j - 1, i + max_tokens // 2, -1):
+                a, b = offsets[k]
+                if text[start + a:start + b] in SENTENCE_END_TOKENS:
+                    j = k + 1
+                    break
+
+        c_start = start + offsets[i][0]
+        c_end = start + offsets[j - 1][1]
+        chunks.append(Chunk(text[c_start:c_end], c_start, c_end, j - i))
+
+        if j >= n:
+            break
+        i = max(j - overlap_tokens, i + 1)
+    return chunks
+
+
+# ---------- 3. PACKING ----------
+def chunk_document(
+    text: str,
+    tokenizer,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    min_tokens: int = DEFAULT_MIN_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> List[Chunk]:
+    blocks = split_blocks(text)
+    if not blocks:
+        return []
+
+    # One batched (Rust-side parallel) tokenizer call for the whole document
+    encoded = tokenizer(
+        [text[s:e] for s, e, _ in blocks],
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+        verbose=False,
+    )
+    token_counts = [len(ids) for ids in encoded["input_ids"]]
+
+    offset_mapping = encoded["offset_mapping"]
+
+    chunks: List[Chunk] = []
+    cur_blocks: List[int] = []
+    cur_tokens = 0
+
+    def close():
+        nonlocal cur_tokens
+        if cur_blocks:
+            c_start, c_end = blocks[cur_blocks[0]][0], blocks[cur_blocks[-1]][1]
+            chunks.append(Chunk(text[c_start:c_end], c_start, c_end, cur_tokens))
+        cur_blocks.clear()
+        cur_tokens = 0
+
+    for idx, (b_start, b_end, hard) in enumerate(blocks):
+        n_tokens = token_counts[idx]
+
+        if n_tokens > max_tokens:
+            offsets = offset_mapping[idx]
+            if cur_blocks and cur_tokens < min_tokens:
+                # keep a short heading / lead-in attached to the text it introduces:
+                # re-base the pending blocks' token offsets onto the lead-in start
+                lead_start = blocks[cur_blocks[0]][0]
+                merged = []
+                for j in cur_blocks + [idx]:
+                    shift = blocks[j][0] - lead_start
+                    merged.extend((a + shift, b + shift) for a, b in offset_mapping[j])
+                offsets, b_start = merged, lead_start
+                cur_blocks.clear()
+                cur_tokens = 0
+            close()
+            chunks.extend(_split_long_block(text, b_start, offsets, max_tokens, overlap_tokens))
+            continue
+
+        if cur_blocks and (
+            cur_tokens + n_tokens > max_tokens or (hard and cur_tokens >= min_tokens)
+        ):
+            close()
+
+        cur_blocks.append(idx)
+        cur_tokens += n_tokens
+
+    close()
+
+    # fold tiny fragments into their predecessor when it fits, else drop them
+    packed: List[Chunk] = []
+    for chunk in chunks:
+        if chunk.tokens < min_tokens and packed and packed[-1].tokens + chunk.tokens <= max_tokens:
+            prev = packed[-1]
+            packed[-1] = Chunk(text[prev.start:chunk.end], prev.start, chunk.end, prev.tokens + chunk.tokens)
+        elif chunk.tokens >= MIN_KEEP_TOKENS:
+            packed.append(chunk)
+    return packed
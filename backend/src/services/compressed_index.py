@@ -0,0 +1,477 @@
+"""
+Compressed vector index over the `study_kb` collection.
+
+Run from backend/:
+    python -m src.services.compressed_index build --dtype int8 --pca 128
+    python -m src.services.compressed_index check --k 10 --queries 200
+
+Vectors are (optionally) projected with a PCA fitted on the corpus and
+scalar-quantized to int8 (per-dimension scale) or float16. Only these codes
+and two small metadata columns are held in RAM; the original float32 vectors
+stay on disk as a memory-mapped matrix and are read back just for the
+shortlist that gets rescored in full precision, so returned distances are
+the same squared-L2 distances Chroma reports.
+
+`check` measures recall@k of this index against the uncompressed Chroma
+query for the same (subject, type) filter.
+
+The index is tied to the collection (index generation) it was built from.
+After a swap (rebuild, /api/kb/ingest, snapshot import) queries go to Chroma
+with a warning until the index is rebuilt for the new generation; a rebuilt
+index is picked up without a restart.
+
+Each build goes into its own directory under COMPRESSED_INDEX_DIR and is
+published, once complete and fsynced, by atomically replacing the CURRENT
+pointer file (as index_generations does for Chroma). Files a running server
+has loaded or memory-mapped are never rewritten; only builds older than the
+last KEEP_BUILDS are removed.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.services.chunk_store import chunk_store
+
+# ==== CONFIG ====
+COMPRESSED_INDEX_DIR = os.getenv("COMPRESSED_INDEX_DIR", "./vector-db/compressed")
+# Shortlist = top_k * SHORTLIST_FACTOR candidates by compressed score, then exact rescoring
+SHORTLIST_FACTOR = int(os.getenv("COMPRESSED_SHORTLIST_FACTOR", "8"))
+FILTER_COLUMNS = ("subject", "type")
+SCAN_BLOCK_ROWS = 65536        # bounds the float32 temp created while scoring int8 codes
+POINTER_FILE = "CURRENT.json"  # {"build": "<build dir name>", ...}
+KEEP_BUILDS = 2                # current + previous (servers that haven't reloaded yet)
+
+
+# ---------------------------------------------------------
+#  BUILD DIRECTORIES + POINTER
+# ---------------------------------------------------------
+def current_build_dir(index_dir: str) -> str:
+    """Directory of the published build (or `index_dir` itself for a pre-pointer layout)."""
+    try:
+        with open(os.path.join(index_dir, POINTER_FILE), encoding="utf-8") as f:
+            return os.path.join(index_dir, json.load(f)["build"])
+    except FileNotFoundError:
+        return index_dir
+
+
+def _fsync_tree(path: str):
+    for name in os.listdir(path):
+        fd = os.open(os.path.join(path, name), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _publish_build(index_dir: str, build: str, manifest: dict):
+    path = os.path.join(index_dir, POINTER_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"build": build, "collection": manifest["collection"], "published_at": time.time()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # readers see the old or the new build, never half of one
+
+
+def _prune_builds(index_dir: str, current: str, keep: int = KEEP_BUILDS):
+    """
+    Removes all but the last `keep` builds. A server still on a removed
+    build is unaffected: its mmap outlives the unlink.
+    """
+    builds = sorted((name for name in os.listdir(index_dir) if name.startswith("build-")),
+                    key=lambda name: int(name.rsplit("-", 1)[1]))   # build-g<N>-<ms>
+    for name in [name for name in builds[:max(0, len(builds) - keep)] if name != current]:
+        shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+        print(f"🗑️ Pruned old compressed index build {name}")
+
+
+# ---------------------------------------------------------
+#  BUILD  (paged read of the Chroma collection → files on disk)
+# ---------------------------------------------------------
+def _iter_embedding_pages(collection, page_size: int):
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+        ids = page["ids"]
+        if not ids:
+            return
+        yield ids, np.asarray(page["embeddings"], dtype=np.float32), page["metadatas"]
+        offset += len(ids)
+
+
+def build_index(
+    collection,
+    out_dir: str = COMPRESSED_INDEX_DIR,
+    dtype: str = "int8",
+    pca_dim: int = 0,
+    page_size: int = 5000,
+    generation: Optional[int] = None,
+) -> dict:
+    """
+    Builds the compressed index for `collection` in a new directory under
+    `out_dir`, publishes it and returns its manifest. Memory use is one page
+    of embeddings plus a dim x dim covariance, whatever the corpus size.
+    """
+    if dtype not in ("int8", "float16"):
+        raise ValueError("dtype must be 'int8' or 'float16'")
+
+    total = collection.count()
+    if total == 0:
+        raise ValueError("collection is empty")
+
+    build = f"build-g{generation or 0}-{int(time.time() * 1000)}"
+    tmp_dir = os.path.join(out_dir, f".tmp-{build}-{os.getpid()}")
+    os.makedirs(tmp_dir)
+    try:
+        manifest = _write_index(collection, tmp_dir, total, dtype, pca_dim, page_size, generation)
+        _fsync_tree(tmp_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    os.replace(tmp_dir, os.path.join(out_dir, build))
+    _publish_build(out_dir, build, manifest)
+    _prune_builds(out_dir, build)
+    return manifest
+
+
+def _write_index(collection, out_dir: str, total: int, dtype: str, pca_dim: int, page_size: int,
+                 generation: Optional[int]) -> dict:
+
+    # --- pass 1: copy float32 vectors to disk, accumulate mean / covariance ---
+    full = None
+    ids: List[str] = []
+    columns: Dict[str, List[str]] = {name: [] for name in FILTER_COLUMNS}
+    row = 0
+    col_sum = xtx = None
+
+    for page_ids, vectors, metas in _iter_embedding_pages(collection, page_size):
+        if full is None:
+            dim = vectors.shape[1]
+            full = np.lib.format.open_memmap(
+                os.path.join(out_dir, "full_f32.npy"), mode="w+", dtype=np.float32, shape=(total, dim)
+            )
+            col_sum = np.zeros(dim, dtype=np.float64)
+            xtx = np.zeros((dim, dim), dtype=np.float64)
+
+        n = min(len(page_ids), total - row)  # collection may grow while we read
+        vectors = vectors[:n]
+        full[row:row + n] = vectors
+        col_sum += vectors.sum(axis=0)
+        xtx += vectors.T.astype(np.float64) @ vectors
+        ids.extend(page_ids[:n])
+        for meta in metas[:n]:
+            meta = meta or {}
+            for name in FILTER_COLUMNS:
+                columns[name].append(str(meta.get(name, "")))
+        row += n
+        print(f"  → read {row}/{total} vectors")
+
+    full.flush()
+    count, dim = row, full.shape[1]
+
+    # --- PCA (eigendecomposition of the covariance) ---
+    mean = (col_sum / count).astype(np.float32)
+    if pca_dim and pca_dim < dim:
+        cov = xtx / count - np.outer(mean, mean)
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        order = np.argsort(eigvals)[::-1][:pca_dim]
+        components = eigvecs[:, order].T.astype(np.float32)   # (pca_dim, dim)
+        explained = float(eigvals[order].sum() / max(eigvals.sum(), 1e-12))
+    else:
+        pca_dim, components, explained = dim, None, 1.0
+
+    def project(block: np.ndarray) -> np.ndarray:
+        block = block - mean
+        return block @ components.T if components is not None else block
+
+    # --- pass 2: per-dimension scale, pass 3: quantize ---
+    scale = np.ones(pca_dim, dtype=np.float32)
+    if dtype == "int8":
+        max_abs = np.zeros(pca_dim, dtype=np.float32)
+        for start in range(0, count, SCAN_BLOCK_ROWS):
+            max_abs = np.maximum(max_abs, np.abs(project(full[start:start + SCAN_BLOCK_ROWS])).max(axis=0))
+        scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+
+    codes = np.lib.format.open_memmap(
+        os.path.join(out_dir, "codes.npy"), mode="w+",
+        dtype=np.int8 if dtype == "int8" else np.float16, shape=(count, pca_dim),
+    )
+    for start in range(0, count, SCAN_BLOCK_ROWS):
+        block = project(full[start:start + SCAN_BLOCK_ROWS])
+        if dtype == "int8":
+            codes[start:start + len(block)] = np.clip(np.rint(block / scale), -127, 127).astype(np.int8)
+        else:
+            codes[start:start + len(block)] = block.astype(np.float16)
+    codes.flush()
+
+    # --- metadata columns: small-int codes + vocabulary ---
+    vocab = {}
+    for name, values in columns.items():
+        labels = sorted(set(values))
+        lookup = {label: i for i, label in enumerate(labels)}
+        np.save(os.path.join(out_dir, f"col_{name}.npy"), np.array([lookup[v] for v in values], dtype=np.uint16))
+        vocab[name] = labels
+
+    np.save(os.path.join(out_dir, "mean.npy"), mean)
+    np.save(os.path.join(out_dir, "scale.npy"), scale)
+    if components is not None:
+        np.save(os.path.join(out_dir, "components.npy"), components)
+    with open(os.path.join(out_dir, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+
+    manifest = {
+        "collection": collection.name,
+        "generation": generation,
+        "count": count,
+        "dim": dim,
+        "dtype": dtype,
+        "pca_dim": pca_dim if components is not None else 0,
+        "pca_explained_variance": round(explained, 4),
+        "vocab": vocab,
+        "built_at": time.time(),
+        "code_bytes": int(codes.nbytes),
+        "float32_bytes": int(count * dim * 4),
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# ---------------------------------------------------------
+#  SEARCH
+# ---------------------------------------------------------
+def _where_fields(where: Optional[dict]) -> Dict[str, str]:
+    """{"$and": [{"subject": "ML"}, {"type": "BOOK"}]} / {"type": "BOOK"} → plain dict."""
+    if not where:
+        return {}
+    clauses = where.get("$and", [where])
+    fields = {}
+    for clause in clauses:
+        for key, value in clause.items():
+            if key not in FILTER_COLUMNS or isinstance(value, dict):
+                raise ValueError(f"unsupported filter for compressed index: {clause}")
+            fields[key] = value
+    return fields
+
+
+class CompressedIndex:
+    def __init__(self, index_dir: str = COMPRESSED_INDEX_DIR):
+        index_dir = current_build_dir(index_dir)
+        self.build_dir = index_dir
+        with open(os.path.join(index_dir, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(index_dir, "ids.json"), encoding="utf-8") as f:
+            self.ids = json.load(f)
+
+        self.codes = np.load(os.path.join(index_dir, "codes.npy"))                    # in RAM
+        self.full = np.load(os.path.join(index_dir, "full_f32.npy"), mmap_mode="r")   # on disk
+        self.mean = np.load(os.path.join(index_dir, "mean.npy"))
+        self.scale = np.load(os.path.join(index_dir, "scale.npy"))
+        components_path = os.path.join(index_dir, "components.npy")
+        self.components = np.load(components_path) if os.path.exists(components_path) else None
+
+        self.columns = {name: np.load(os.path.join(index_dir, f"col_{name}.npy")) for name in FILTER_COLUMNS}
+        self.vocab = {name: {label: i for i, label in enumerate(labels)}
+                      for name, labels in self.manifest["vocab"].items()}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        mask = None
+        for name, value in _where_fields(where).items():
+            code = self.vocab[name].get(value)
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            col = self.columns[name] == code
+            mask = col if mask is None else mask & col
+        return mask
+
+    def _approx_scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        # <x, q> ≈ <μ, q> + <P(x-μ), Pq>; the constant term doesn't change the ranking
+        q = query @ self.components.T if self.components is not None else query
+        q = (q * self.scale).astype(np.float32)
+
+        codes = self.codes if rows is None else self.codes[rows]
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            scores[start:start + SCAN_BLOCK_ROWS] = codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32) @ q
+        return scores
+
+    def search(self, query_embedding, top_k: int = 10, where: Optional[dict] = None) -> Tuple[List[str], List[float]]:
+        """
+        Returns (ids, squared-L2 distances), best first, for `top_k` nearest
+        vectors that match the Chroma-style `where` filter.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        mask = self._mask(where)
+        rows = None if mask is None else np.flatnonzero(mask)
+        n = len(self) if rows is None else len(rows)
+        if n == 0 or top_k <= 0:
+            return [], []
+
+        scores = self._approx_scores(query, rows)
+        shortlist_size = min(n, top_k * SHORTLIST_FACTOR)
+        shortlist = np.argpartition(-scores, shortlist_size - 1)[:shortlist_size]
+        candidates = shortlist if rows is None else rows[shortlist]
+
+        # exact rescoring against the memory-mapped float32 vectors
+        candidates = np.sort(candidates)                       # sequential-ish disk reads
+        diff = np.asarray(self.full[candidates]) - query
+        distances = np.einsum("ij,ij->i", diff, diff)
+        best = np.argsort(distances)[:top_k]
+
+        return [self.ids[i] for i in candidates[best]], distances[best].tolist()
+
+    def memory_bytes(self) -> int:
+        cols = sum(c.nbytes for c in self.columns.values())
+        return int(self.codes.nbytes + cols)
+
+
+_index: Optional[CompressedIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> CompressedIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CompressedIndex(COMPRESSED_INDEX_DIR)
+            m = _index.manifest
+            print(f"📦 Compressed index loaded: {m['count']} vectors, {m['dtype']}, "
+                  f"pca={m['pca_dim'] or 'off'}, {_index.memory_bytes() / 1e6:.1f} MB in RAM")
+        return _index
+
+
+def reload_index():
+    global _index
+    with _index_lock:
+        _index = None
+    return get_index()
+
+
+_stale_warned = set()
+
+
+def get_index_for(collection_name: str) -> Optional[CompressedIndex]:
+    """
+    The index if it was built from `collection_name`, reloading it first when
+    a newer build has been published; None (warned once per collection) if it wasn't.
+    """
+    index = get_index()
+    if index.manifest.get("collection") != collection_name:
+        if current_build_dir(COMPRESSED_INDEX_DIR) != index.build_dir:
+            index = reload_index()
+    if index.manifest.get("collection") == collection_name:
+        return index
+
+    if collection_name not in _stale_warned:
+        _stale_warned.add(collection_name)
+        print(f"⚠️ Compressed index was built from {index.manifest.get('collection') or 'an older KB'}, "
+              f"not {collection_name}: querying Chroma until it is rebuilt "
+              f"(python -m src.services.compressed_index build)")
+    return None
+
+
+# ---------------------------------------------------------
+#  RECALL CHECK  (compressed vs uncompressed Chroma results)
+# ---------------------------------------------------------
+def recall_check(collection, embedder, index: CompressedIndex, k: int = 10, n_queries: int = 200, seed: int = 0) -> dict:
+    """
+    Samples stored chunks, turns their first ~24 words into a query, and
+    compares the compressed top-k with Chroma's top-k for the same
+    (subject, type) filter.
+    """
+    from src.services.vector_store import build_where_filter
+
+    rng = random.Random(seed)
+    sample_rows = rng.sample(range(len(index)), min(n_queries, len(index)))
+    sample_ids = [index.ids[i] for i in sample_rows]
+    got = collection.get(ids=sample_ids, include=["documents", "metadatas"])
+    by_id = dict(zip(got["ids"], zip(chunk_store.resolve(got["documents"], got["metadatas"], expand=0),
+                                     got["metadatas"])))
+
+    queries, filters = [], []
+    for chunk_id in sample_ids:
+        doc, meta = by_id[chunk_id]
+        queries.append(" ".join((doc or "").split()[:24]))
+        filters.append(build_where_filter((meta or {}).get("subject"), (meta or {}).get("type") == "PYQ"))
+    vectors = embedder.encode(queries, batch_size=64)
+
+    recalls, t_exact, t_compressed = [], 0.0, 0.0
+    for vector, where in zip(vectors, filters):
+        start = time.perf_counter()
+        exact = collection.query(query_embeddings=[vector.tolist()], n_results=k, where=where)["ids"][0]
+        t_exact += time.perf_counter() - start
+
+        start = time.perf_counter()
+        approx, _ = index.search(vector, k, where)
+        t_compressed += time.perf_counter() - start
+
+        if exact:
+            recalls.append(len(set(exact) & set(approx)) / len(exact))
+
+    m = index.manifest
+    return {
+        "k": k,
+        "queries": len(recalls),
+        "recall_at_k": round(float(np.mean(recalls)) if recalls else 0.0, 4),
+        "min_recall": round(float(np.min(recalls)) if recalls else 0.0, 4),
+        "chroma_ms_per_query": round(1000 * t_exact / max(len(recalls), 1), 2),
+        "compressed_ms_per_query": round(1000 * t_compressed / max(len(recalls), 1), 2),
+        "ram_bytes": index.memory_bytes(),
+        "float32_bytes": m["float32_bytes"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed vector index for the knowledge base")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="build the index from the Chroma collection")
+    p_build.add_argument("--dtype", choices=["int8", "float16"], default="int8")
+    p_build.add_argument("--pca", type=int, default=0, help="PCA output dims (0 = no projection)")
+    p_build.add_argument("--page-size", type=int, default=5000)
+    p_build.add_argument("--out", default=COMPRESSED_INDEX_DIR)
+
+    p_check = sub.add_parser("check", help="recall@k against uncompressed Chroma results")
+    p_check.add_argument("--k", type=int, default=10)
+    p_check.add_argument("--queries", type=int, default=200)
+    p_check.add_argument("--dir", default=COMPRESSED_INDEX_DIR)
+
+    args = parser.parse_args()
+    from src.services.index_generations import read_pointer
+    from src.services.kb_maintenance import VECTOR_DB_DIR, open_collection
+    _, collection = open_collection()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        generation = (read_pointer(VECTOR_DB_DIR) or {}).get("generation", 0)
+        manifest = build_index(collection, args.out, args.dtype, args.pca, args.page_size, generation)
+        print(f"\n✅ Built in {time.perf_counter() - start:.1f}s → {current_build_dir(args.out)}")
+        print(f"  {manifest['count']} x {manifest['dim']} float32 = {manifest['float32_bytes'] / 1e6:.1f} MB"
+              f" → codes {manifest['code_bytes'] / 1e6:.1f} MB"
+              f" ({manifest['dtype']}, pca={manifest['pca_dim'] or 'off'},"
+              f" explained variance {manifest['pca_explained_variance']})")
+    elif args.command == "check":
+        from src.services.vector_store import get_embedder
+        report = recall_check(collection, get_embedder(), CompressedIndex(args.dir), args.k, args.queries)
+        for key, value in report.items():
+            print(f"  {key:<24} {value}")
+
+
+if __name__ == "__main__":
+    main()
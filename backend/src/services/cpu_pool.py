@@ -0,0 +1,121 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Callable, Optional
+
+# ==== CONFIG ====
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Max tasks submitted to the pool at once (running + waiting); beyond this → PoolBusyError
+CPU_POOL_MAX_QUEUE = int(os.getenv("CPU_POOL_MAX_QUEUE", str(CPU_POOL_WORKERS * 4)))
+CPU_TASK_TIMEOUT_SECONDS = float(os.getenv("CPU_TASK_TIMEOUT_SECONDS", "120"))
+
+
+class PoolBusyError(RuntimeError):
+    """Raised when the CPU pool queue is full; callers should retry later (HTTP 503)."""
+
+
+class CpuTaskTimeout(RuntimeError):
+    """Raised when a CPU task did not finish within its timeout (HTTP 504)."""
+
+
+# ---------------------------------------------------------
+#  SHARED BOUNDED PROCESS POOL
+#  (PDF text extraction, OCR, PDF rendering)
+# ---------------------------------------------------------
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # "spawn": workers must not inherit the parent's model / DB threads
+            _executor = ProcessPoolExecutor(
+                max_workers=CPU_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def shutdown_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def queue_depth() -> int:
+    with _pending_lock:
+        return _pending
+
+
+def _release(_future=None):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+def _submit(fn: Callable, *args) -> Future:
+    """
+    Submits to the pool if there is queue room. The slot is released when the
+    task really finishes, not when the caller stops waiting, so a timed-out task
+    still counts against the limit until its worker is free again.
+    """
+    global _pending
+    with _pending_lock:
+        if _pending >= CPU_POOL_MAX_QUEUE:
+            raise PoolBusyError(f"CPU pool busy ({_pending} tasks queued)")
+        _pending += 1
+
+    try:
+        try:
+            future = get_executor().submit(partial(fn, *args))
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault in a native lib): start a fresh pool
+            shutdown_pool()
+            future = get_executor().submit(partial(fn, *args))
+    except Exception:
+        _release()
+        raise
+    future.add_done_callback(_release)
+    return future
+
+
+async def run_cpu_bound(fn: Callable, *args, timeout: Optional[float] = None,
+                        on_submit: Optional[Callable[[Future], None]] = None):
+    """
+    Runs `fn(*args)` in the process pool without blocking the event loop.
+    `fn` and its arguments must be picklable (module-level functions, bytes, str).
+    `on_submit` receives the pool future, for callers that must know when the
+    worker is really done (cancelling the await does not stop a running task).
+    """
+    future = _submit(fn, *args)
+    if on_submit is not None:
+        on_submit(future)
+    try:
+        return await asyncio.wait_for(
+            asyncio.wrap_future(future),
+            timeout or CPU_TASK_TIMEOUT_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        raise CpuTaskTimeout(f"{getattr(fn, '__name__', 'task')} timed out")
+
+
+def run_cpu_bound_sync(fn: Callable, *args, timeout: Optional[float] = None):
+    """
+    Same as `run_cpu_bound` for sync (threadpool) routes. The calling thread only
+    waits on the result; the CPU work happens in the pool.
+    """
+    future = _submit(fn, *args)
+    try:
+        return future.result(timeout=timeout or CPU_TASK_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        raise CpuTaskTimeout(f"{getattr(fn, '__name__', 'task')} timed out")
@@ -0,0 +1,131 @@
+"""
+Near-duplicate chunk detection with MinHash signatures + LSH banding.
+
+Each chunk is reduced to a set of word 5-gram shingles, hashed into a
+`num_perm`-wide MinHash signature (vectorized with numpy), and bucketed by
+bands of the signature. Chunks that share a bucket are candidates; a
+candidate is a duplicate when the estimated Jaccard similarity of the two
+signatures reaches `threshold`.
+"""
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16                 # 16 bands x 8 rows → candidate curve centred near J≈0.7
+DEFAULT_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = np.uint64(4294967311)  # smallest prime > 2**32
+_MAX_HASH = np.uint64(2**32 - 1)
+_WORD_RE = re.compile(r"\w+")
+_BATCH_SHINGLES = 50_000   # bounds the (shingles x num_perm) temp matrix
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        grams = [" ".join(words)] if words else [""]
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+class MinHashLSH:
+    def __init__(
+        self,
+        num_perm: int = NUM_PERM,
+        bands: int = BANDS,
+        threshold: float = DEFAULT_THRESHOLD,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64)
+
+        self._buckets: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(bands)]
+        self._signatures: List[np.ndarray] = []
+        self._keys: List[object] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    # ---------- signatures ----------
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), num_perm) uint64 MinHash signatures, computed in batches."""
+        out = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        shingles = [_shingle_hashes(t) for t in texts]
+
+        i = 0
+        while i < len(texts):
+            j, total = i, 0
+            while j < len(texts) and (j == i or total + len(shingles[j]) <= _BATCH_SHINGLES):
+                total += len(shingles[j])
+                j += 1
+
+            flat = np.concatenate(shingles[i:j])
+            starts = np.cumsum([0] + [len(s) for s in shingles[i:j - 1]])
+            # universal hashing: (a*x + b) mod p, all permutations at once
+            hashed = (np.outer(flat, self._a) + self._b) % _MERSENNE_PRIME
+            out[i:j] = np.minimum.reduceat(np.minimum(hashed, _MAX_HASH), starts, axis=0)
+            i = j
+        return out
+
+    # ---------- index ----------
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        return [sig[b * self.rows:(b + 1) * self.rows].tobytes() for b in range(self.bands)]
+
+    def query(self, sig: np.ndarray) -> Optional[Tuple[object, float]]:
+        """Best indexed match with estimated Jaccard ≥ threshold, else None."""
+        candidates = set()
+        for band, key in enumerate(self._band_keys(sig)):
+            candidates.update(self._buckets[band].get(key, ()))
+        if not candidates:
+            return None
+
+        idx = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        sims = (np.stack([self._signatures[i] for i in idx]) == sig).mean(axis=1)
+        best = int(np.argmax(sims))
+        if sims[best] >= self.threshold:
+            return self._keys[idx[best]], float(sims[best])
+        return None
+
+    def insert(self, key: object, sig: np.ndarray):
+        pos = len(self._keys)
+        self._keys.append(key)
+        self._signatures.append(sig)
+        for band, band_key in enumerate(self._band_keys(sig)):
+            self._buckets[band][band_key].append(pos)
+
+
+def dedupe_chunks(texts: List[str], index: MinHashLSH, source: str) -> Tuple[List[int], Dict[str, int]]:
+    """
+    Checks `texts` (in order) against everything already in `index` and against
+    each other; keeps the first occurrence of every near-duplicate group.
+
+    Returns (indices to keep, stats) where stats counts duplicates found
+    within this source and against previously indexed sources.
+    """
+    keep: List[int] = []
+    stats = {"within_source": 0, "cross_source": 0}
+
+    for i, sig in enumerate(index.signatures(texts)):
+        match = index.query(sig)
+        if match is not None:
+            (match_source, _), _ = match
+            stats["within_source" if match_source == source else "cross_source"] += 1
+            continue
+        index.insert((source, i), sig)
+        keep.append(i)
+
+    return keep, stats
@@ -0,0 +1,231 @@
+"""
+Shared embedding server: one MiniLM copy for all API workers.
+
+Run from backend/ (before starting uvicorn):
+    python -m src.services.embedding_server --socket /tmp/syllabus-embed.sock
+and start the API with EMBEDDING_SOCKET=/tmp/syllabus-embed.sock.
+
+Requests from every worker land on one asyncio loop, are merged into
+micro-batches (up to EMBED_MAX_BATCH texts, waiting at most EMBED_MAX_WAIT_MS
+for more to arrive) and encoded in a single `model.encode` call. While a
+batch is encoding, the next one keeps filling up.
+
+Wire format (both directions): 4-byte big-endian length + JSON header,
+responses are followed by the raw float32 matrix.
+    → {"texts": ["...", ...]}
+    ← {"n": 3, "dim": 384}  + n*dim*4 bytes      or  {"error": "..."}
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# ==== CONFIG ====
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "")      # empty → encode in-process
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+EMBED_CLIENT_TIMEOUT_SECONDS = float(os.getenv("EMBED_CLIENT_TIMEOUT_SECONDS", "30"))
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+_HEADER = struct.Struct(">I")
+
+
+# ---------------------------------------------------------
+#  SERVER
+# ---------------------------------------------------------
+class EmbeddingServer:
+    def __init__(self, model, max_batch: int = EMBED_MAX_BATCH, max_wait_ms: float = EMBED_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "asyncio.Queue[Tuple[List[str], asyncio.Future]]" = None
+        # torch already uses all cores inside one encode; one thread keeps batches serial
+        self._encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self.stats = {"requests": 0, "texts": 0, "batches": 0}
+
+    async def _next_batch(self) -> List[Tuple[List[str], asyncio.Future]]:
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = [t for item_texts, _ in batch for t in item_texts]
+            try:
+                vectors = await loop.run_in_executor(
+                    self._encoder,
+                    lambda: np.asarray(self.model.encode(texts, batch_size=len(texts)), dtype=np.float32),
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(texts)
+            pos = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[pos:pos + len(item_texts)])
+                pos += len(item_texts)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        self.stats["requests"] += 1
+        return await future
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                    request = json.loads(await reader.readexactly(length))
+                except asyncio.IncompleteReadError:
+                    return  # client closed the connection
+
+                if request.get("stats"):
+                    _send(writer, {**self.stats, "queued": self._queue.qsize()})
+                    await writer.drain()
+                    continue
+
+                try:
+                    vectors = await self.embed([str(t) for t in request.get("texts", [])])
+                except Exception as e:
+                    _send(writer, {"error": repr(e)})
+                else:
+                    _send(writer, {"n": vectors.shape[0], "dim": vectors.shape[1]}, vectors.tobytes())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path: str):
+        self._queue = asyncio.Queue()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        batcher = asyncio.create_task(self._batch_loop())
+        server = await asyncio.start_unix_server(self._handle, path=socket_path)
+        os.chmod(socket_path, 0o660)
+        print(f"🧠 Embedding server on {socket_path} (batch ≤ {self.max_batch}, wait ≤ {self.max_wait * 1000:.0f} ms)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._encoder.shutdown(wait=False)
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+def _send(writer: asyncio.StreamWriter, header: dict, payload: bytes = b""):
+    data = json.dumps(header).encode("utf-8")
+    writer.write(_HEADER.pack(len(data)) + data + payload)
+
+
+# ---------------------------------------------------------
+#  CLIENT  (one blocking connection per thread)
+# ---------------------------------------------------------
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        read = sock.recv_into(view[got:])
+        if not read:
+            raise ConnectionError("embedding server closed the connection")
+        got += read
+    return bytes(buf)
+
+
+class EmbeddingClient:
+    def __init__(self, socket_path: str = EMBEDDING_SOCKET, timeout: float = EMBED_CLIENT_TIMEOUT_SECONDS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _drop_connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _request(self, header: dict) -> Tuple[dict, Optional[bytes]]:
+        data = json.dumps(header).encode("utf-8")
+        sock = self._connection()
+        sock.sendall(_HEADER.pack(len(data)) + data)
+        (length,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+        response = json.loads(_recv_exactly(sock, length))
+        payload = None
+        if "n" in response:
+            payload = _recv_exactly(sock, response["n"] * response["dim"] * 4)
+        return response, payload
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        for attempt in (1, 2):
+            try:
+                response, payload = self._request({"texts": list(texts)})
+                break
+            except (OSError, ConnectionError):
+                # stale connection (server restarted): reconnect once
+                self._drop_connection()
+                if attempt == 2:
+                    raise
+        if "error" in response:
+            raise RuntimeError(f"embedding server error: {response['error']}")
+        return np.frombuffer(payload, dtype=np.float32).reshape(response["n"], response["dim"])
+
+    def stats(self) -> dict:
+        return self._request({"stats": True})[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared micro-batching embedding server")
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET or "/tmp/syllabus-embed.sock")
+    parser.add_argument("--max-batch", type=int, default=EMBED_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=EMBED_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    server = EmbeddingServer(model, args.max_batch, args.max_wait_ms)
+    try:
+        asyncio.run(server.serve(args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,168 +1,341 @@
-import os
-from markdown import markdown
-from bs4 import BeautifulSoup
+import io
+import time
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import escape
+
+import mistune
 
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+from reportlab.platypus import (
+    SimpleDocTemplate,
+    Paragraph,
+    Spacer,
+    PageBreak,
+    Preformatted,
+    Table,
+    TableStyle,
+)
+from reportlab.platypus.flowables import HRFlowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 
-EXPORT_DIR = "./exports"
-os.makedirs(EXPORT_DIR, exist_ok=True)
+from src.services.metrics import observe_stage
 
 
-def html_to_story(html: str):
-    soup = BeautifulSoup(html, "html.parser")
-    styles = getSampleStyleSheet()
+# ---------------------------------------------------------
+#  STYLES  (built once at import, shared by every export)
+# ---------------------------------------------------------
+def _build_styles() -> Dict[str, ParagraphStyle]:
+    base = getSampleStyleSheet()
 
-    # Base style
     normal = ParagraphStyle(
         "NormalCustom",
-        parent=styles["Normal"],
+        parent=base["Normal"],
         fontSize=11,
         leading=15,
         spaceAfter=6,
     )
 
-    h1 = ParagraphStyle(
-        "Heading1Custom",
-        parent=styles["Heading1"],
-        fontSize=20,
-        leading=24,
-        textColor=colors.darkblue,
-        spaceBefore=10,
-        spaceAfter=12,
-    )
+    styles = {
+        "normal": normal,
+        "h1": ParagraphStyle(
+            "Heading1Custom",
+            parent=base["Heading1"],
+            fontSize=20,
+            leading=24,
+            textColor=colors.darkblue,
+            spaceBefore=10,
+            spaceAfter=12,
+        ),
+        "h2": ParagraphStyle(
+            "Heading2Custom",
+            parent=base["Heading2"],
+            fontSize=16,
+            leading=20,
+            textColor=colors.darkgreen,
+            spaceBefore=8,
+            spaceAfter=8,
+        ),
+        "h3": ParagraphStyle(
+            "Heading3Custom",
+            parent=base["Heading3"],
+            fontSize=14,
+            leading=18,
+            textColor=colors.darkred,
+            spaceBefore=6,
+            spaceAfter=6,
+        ),
+        "h4": ParagraphStyle(
+            "Heading4Custom",
+            parent=base["Heading4"],
+            fontSize=12,
+            leading=16,
+            spaceBefore=4,
+            spaceAfter=4,
+        ),
+        "code": ParagraphStyle(
+            "Code",
+            parent=normal,
+            fontName="Courier",
+            fontSize=9,
+            leading=11,
+            backColor=colors.whitesmoke,
+            leftIndent=10,
+            rightIndent=10,
+            spaceBefore=4,
+            spaceAfter=8,
+        ),
+        "quote": ParagraphStyle(
+            "Quote",
+            parent=normal,
+            fontName="Helvetica-Oblique",
+            leftIndent=18,
+            textColor=colors.HexColor("#333333"),
+        ),
+        "table_cell": ParagraphStyle(
+            "TableCell",
+            parent=normal,
+            fontSize=9,
+            leading=11,
+            spaceAfter=0,
+        ),
+        "table_head": ParagraphStyle(
+            "TableHead",
+            parent=normal,
+            fontName="Helvetica-Bold",
+            fontSize=9,
+            leading=11,
+            spaceAfter=0,
+        ),
+        "title": ParagraphStyle(
+            "PDFTitle",
+            parent=base["Title"],
+            alignment=TA_CENTER,
+            fontSize=28,
+            textColor=colors.darkblue,
+            spaceAfter=20,
+        ),
+        "subtitle": ParagraphStyle(
+            "PDFSubtitle",
+            parent=base["Normal"],
+            alignment=TA_CENTER,
+            fontSize=14,
+            textColor=colors.black,
+            spaceAfter=10,
+        ),
+        "footer": ParagraphStyle(
+            "PDFFooter",
+            parent=base["Normal"],
+            alignment=TA_CENTER,
+            fontSize=9,
+            textColor=colors.grey,
+            spaceBefore=200,
+        ),
+    }
 
-    h2 = ParagraphStyle(
-        "Heading2Custom",
-        parent=styles["Heading2"],
-        fontSize=16,
-        leading=20,
-        textColor=colors.darkgreen,
-        spaceBefore=8,
-        spaceAfter=8,
-    )
+    # Bullet styles per nesting depth
+    for depth in range(6):
+        styles[f"li{depth}"] = ParagraphStyle(
+            f"ListItem{depth}",
+            parent=normal,
+            leftIndent=18 * (depth + 1),
+            bulletIndent=18 * depth + 6,
+            spaceAfter=3,
+        )
 
-    h3 = ParagraphStyle(
-        "Heading3Custom",
-        parent=styles["Heading3"],
-        fontSize=14,
-        leading=18,
-        textColor=colors.darkred,
-        spaceBefore=6,
-        spaceAfter=6,
-    )
+    return styles
 
-    code_style = ParagraphStyle(
-        "Code",
-        parent=normal,
-        fontName="Courier",
-        fontSize=9,
-        leading=11,
-        backColor=colors.whitesmoke,
-        leftIndent=10,
-        rightIndent=10,
-        spaceBefore=4,
-        spaceAfter=4,
-    )
 
-    table_style = ParagraphStyle(
-        "Table",
-        parent=normal,
-        fontName="Courier",
-        fontSize=9,
-        leading=11,
-        leftIndent=10,
-    )
+STYLES = _build_styles()
 
-    story = []
+TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#e8eef7")),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ("LEFTPADDING", (0, 0), (-1, -1), 4),
+    ("RIGHTPADDING", (0, 0), (-1, -1), 4),
+])
+
+CODE_MAX_LINE = 95  # Courier 9pt fits ~95 chars inside letter margins
+
+# Markdown → AST (list of block tokens) parser, reused across calls
+_parse_markdown = mistune.create_markdown(renderer=None, plugins=["table", "strikethrough"])
+
+
+# ---------------------------------------------------------
+#  INLINE TOKENS → ReportLab paragraph markup
+# ---------------------------------------------------------
+def _inline(tokens: List[dict]) -> str:
+    out = []
+    for tok in tokens:
+        kind = tok["type"]
+        if kind == "text":
+            out.append(escape(tok["raw"]))
+        elif kind == "strong":
+            out.append(f"<b>{_inline(tok['children'])}</b>")
+        elif kind == "emphasis":
+            out.append(f"<i>{_inline(tok['children'])}</i>")
+        elif kind == "strikethrough":
+            out.append(f"<strike>{_inline(tok['children'])}</strike>")
+        elif kind == "codespan":
+            out.append(f'<font face="Courier">{escape(tok["raw"])}</font>')
+        elif kind == "link":
+            url = escape(tok["attrs"]["url"], {'"': "&quot;"})
+            out.append(f'<a href="{url}" color="blue">{_inline(tok["children"])}</a>')
+        elif kind == "image":
+            out.append(_inline(tok.get("children", [])))
+        elif kind == "linebreak":
+            out.append("<br/>")
+        elif kind == "softbreak":
+            out.append(" ")
+        elif "raw" in tok:
+            out.append(escape(tok["raw"]))
+        elif "children" in tok:
+            out.append(_inline(tok["children"]))
+    return "".join(out)
+
+
+def _plain_length(tokens: List[dict]) -> int:
+    total = 0
+    for tok in tokens:
+        if "raw" in tok:
+            total += len(tok["raw"])
+        elif "children" in tok:
+            total += _plain_length(tok["children"])
+    return total
+
+
+# ---------------------------------------------------------
+#  BLOCK TOKENS → flowables  (single pass, document order)
+# ---------------------------------------------------------
+class _StoryBuilder:
+    def __init__(self, avail_width: float):
+        self.avail_width = avail_width
+        self.story = []
+
+    def render(self, tokens: List[dict], para_style: str = "normal", depth: int = 0):
+        for tok in tokens:
+            kind = tok["type"]
+
+            if kind == "heading":
+                level = min(tok["attrs"]["level"], 4)
+                self._paragraph(_inline(tok["children"]), f"h{level}")
+            elif kind in ("paragraph", "block_text"):
+                self._paragraph(_inline(tok["children"]), para_style)
+            elif kind == "list":
+                self._list(tok, depth)
+            elif kind == "block_code":
+                self._code(tok["raw"])
+            elif kind == "block_quote":
+                self.render(tok["children"], "quote", depth)
+            elif kind == "table":
+                self._table(tok)
+            elif kind == "thematic_break":
+                self.story.append(HRFlowable(width="100%", thickness=0.5, color=colors.grey,
+                                             spaceBefore=4, spaceAfter=8))
+            elif kind == "block_html":
+                self._paragraph(escape(tok["raw"]), para_style)
+            # blank_line and unknown tokens produce nothing
+
+    def _paragraph(self, markup: str, style: str):
+        if markup.strip():
+            self.story.append(Paragraph(markup, STYLES[style]))
 
-    # Handle tables manually for nicer mono layout
-    for table in soup.find_all("table"):
-        rows = table.find_all("tr")
+    def _code(self, raw: str):
+        text = raw.rstrip("\n")
+        if text.strip():
+            self.story.append(Preformatted(text, STYLES["code"], maxLineLength=CODE_MAX_LINE, newLineChars=""))
+
+    def _list(self, tok: dict, depth: int):
+        ordered = tok["attrs"].get("ordered", False)
+        number = tok["attrs"].get("start", 1) or 1
+        style = STYLES[f"li{min(depth, 5)}"]
+
+        for item in tok["children"]:
+            bullet = f"{number}." if ordered else "•"
+            number += 1
+            first = True
+            for child in item["children"]:
+                if child["type"] in ("block_text", "paragraph") and first:
+                    self.story.append(Paragraph(_inline(child["children"]), style, bulletText=bullet))
+                    first = False
+                elif child["type"] == "list":
+                    self._list(child, depth + 1)
+                else:
+                    self.render([child], depth=depth + 1)
+
+    def _table(self, tok: dict):
+        rows: List[List[dict]] = []
+        for section in tok["children"]:
+            if section["type"] == "table_head":
+                rows.append(section["children"])
+            else:
+                rows.extend(row["children"] for row in section["children"])
+        if not rows:
+            return
+
+        n_cols = max(len(r) for r in rows)
+
+        # Column widths proportional to content length (clamped), filling the frame
+        weights = [1.0] * n_cols
         for row in rows:
-            cells = row.find_all(["th", "td"])
-            texts = [c.get_text(strip=True) for c in cells]
-            if not texts:
-                continue
-            line = " | ".join(texts)
-            story.append(Paragraph(line, table_style))
-        story.append(Spacer(1, 0.12 * inch))
-        table.decompose()
-
-    # Headings, paragraphs, bullets, code/flowcharts
-    for tag in soup.find_all(["h1", "h2", "h3", "p", "li", "pre", "code"]):
-        text = tag.get_text().strip()
-        if not text:
-            continue
-
-        if tag.name == "h1":
-            story.append(Paragraph(text, h1))
-        elif tag.name == "h2":
-            story.append(Paragraph(text, h2))
-        elif tag.name == "h3":
-            story.append(Paragraph(text, h3))
-        elif tag.name == "li":
-            story.append(Paragraph("• " + text, normal))
-        elif tag.name in ("pre", "code"):
-            safe = text.replace(" ", "&nbsp;").replace("\n", "<br/>")
-            story.append(Paragraph(safe, code_style))
-        elif tag.name == "p":
-            story.append(Paragraph(text, normal))
-
-        story.append(Spacer(1, 0.08 * inch))
-
-    return story
-
-
-def generate_beautiful_pdf(markdown_text: str, filename: str, title: str, subject: str):
-    pdf_path = os.path.join(EXPORT_DIR, filename)
-
-    # Markdown → HTML
-    html = markdown(markdown_text, extensions=["fenced_code", "tables"])
-
-    doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-    story = []
+            for i, cell in enumerate(row):
+                weights[i] = max(weights[i], min(_plain_length(cell["children"]), 40))
+        scale = self.avail_width / sum(weights)
+        col_widths = [w * scale for w in weights]
 
-    # Title page
-    title_style = ParagraphStyle(
-        "PDFTitle",
-        parent=getSampleStyleSheet()["Title"],
-        alignment=TA_CENTER,
-        fontSize=28,
-        textColor=colors.darkblue,
-        spaceAfter=20,
-    )
+        data = []
+        for r, row in enumerate(rows):
+            style = STYLES["table_head"] if r == 0 else STYLES["table_cell"]
+            cells = [Paragraph(_inline(cell["children"]), style) for cell in row]
+            cells.extend([""] * (n_cols - len(cells)))
+            data.append(cells)
 
-    subtitle_style = ParagraphStyle(
-        "PDFSubtitle",
-        parent=getSampleStyleSheet()["Normal"],
-        alignment=TA_CENTER,
-        fontSize=14,
-        textColor=colors.black,
-        spaceAfter=10,
-    )
+        self.story.append(Table(data, colWidths=col_widths, repeatRows=1, style=TABLE_STYLE, hAlign="LEFT"))
+        self.story.append(Spacer(1, 0.12 * inch))
+
+
+def markdown_to_story(markdown_text: str, avail_width: float) -> list:
+    """
+    Converts markdown straight into ReportLab flowables in one pass over the AST.
+    """
+    builder = _StoryBuilder(avail_width)
+    builder.render(_parse_markdown(markdown_text))
+    return builder.story
+
+
+def generate_beautiful_pdf(markdown_text: str, title: str, subject: str) -> bytes:
+    """
+    Renders markdown notes into a PDF entirely in memory and returns the bytes.
+    """
+    pdf, timings = render_pdf(markdown_text, title, subject)
+    for stage, seconds in timings.items():
+        observe_stage(stage, seconds, subject)
+    return pdf
 
-    footer_style = ParagraphStyle(
-        "PDFFooter",
-        parent=getSampleStyleSheet()["Normal"],
-        alignment=TA_CENTER,
-        fontSize=9,
-        textColor=colors.grey,
-        spaceBefore=200,
-    )
 
-    story.append(Paragraph(title, title_style))
+def render_pdf(markdown_text: str, title: str, subject: str) -> Tuple[bytes, Dict[str, float]]:
+    """
+    `generate_beautiful_pdf` for the CPU pool: returns (pdf_bytes, stage
+    timings) so the calling process can record the spans.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    story = []
+
+    # Title page
+    story.append(Paragraph(escape(title), STYLES["title"]))
     if subject:
-        story.append(Paragraph(f"<b>Subject:</b> {subject}", subtitle_style))
-    story.append(Paragraph("Generated by Syllabus GPT (HyDE + RAG)", footer_style))
+        story.append(Paragraph(f"<b>Subject:</b> {escape(subject)}", STYLES["subtitle"]))
+    story.append(Paragraph("Generated by Syllabus GPT (HyDE + RAG)", STYLES["footer"]))
     story.append(PageBreak())
 
     # Content
-    story.extend(html_to_story(html))
-
+    start = time.perf_counter()
+    story.extend(markdown_to_story(markdown_text, doc.width))
+    built = time.perf_counter()
     doc.build(story)
-    return pdf_path
+    timings = {"pdf_story": built - start, "pdf_build": time.perf_counter() - built}
+    return buffer.getvalue(), timings
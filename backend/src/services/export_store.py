@@ -0,0 +1,134 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from src.services.cpu_pool import run_cpu_bound, run_cpu_bound_sync
+from src.services.export_notes import render_pdf
+from src.services.metrics import observe_stage, record_cache, track_stage
+
+# ==== CONFIG ====
+# Set EXPORT_CACHE_MAX_MB=0 to disable the cache entirely.
+EXPORT_CACHE_MAX_BYTES = int(float(os.getenv("EXPORT_CACHE_MAX_MB", "64")) * 1024 * 1024)
+EXPORT_CACHE_TTL_SECONDS = float(os.getenv("EXPORT_CACHE_TTL_SECONDS", "3600"))
+
+
+def export_key(markdown_text: str, title: str, subject: str) -> str:
+    """Content address of a PDF: hash of the markdown plus title/subject."""
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(markdown_text.encode("utf-8")).digest())
+    digest.update(b"\0" + title.encode("utf-8"))
+    digest.update(b"\0" + subject.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------
+#  CONTENT-ADDRESSED EXPORT CACHE  (in memory, TTL + size GC)
+# ---------------------------------------------------------
+class ExportStore:
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            created, pdf = item
+            if time.monotonic() - created > self.ttl_seconds:
+                self._drop(key)
+                return None
+            self._items.move_to_end(key)  # LRU
+            return pdf
+
+    def put(self, key: str, pdf: bytes):
+        if not self.enabled or len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (time.monotonic(), pdf)
+            self._size += len(pdf)
+            self._gc()
+
+    def _drop(self, key: str):
+        _, pdf = self._items.pop(key)
+        self._size -= len(pdf)
+
+    def _gc(self):
+        # 1) expired entries (oldest first, insertion order ~ age)
+        now = time.monotonic()
+        for key in list(self._items):
+            created, _ = self._items[key]
+            if now - created > self.ttl_seconds:
+                self._drop(key)
+
+        # 2) least recently used until under the size budget
+        while self._size > self.max_bytes and self._items:
+            self._drop(next(iter(self._items)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+export_store = ExportStore(EXPORT_CACHE_MAX_BYTES, EXPORT_CACHE_TTL_SECONDS)
+
+
+def _lookup(key: str) -> Optional[bytes]:
+    pdf = export_store.get(key)
+    if export_store.enabled:
+        record_cache("pdf_export", hit=pdf is not None)
+    return pdf
+
+
+def _observe_pool_stages(timings: dict, subject: str):
+    # timed inside the pool worker, recorded here in the serving process
+    for stage, seconds in timings.items():
+        observe_stage(stage, seconds, subject)
+
+
+def get_or_build_pdf(markdown_text: str, title: str, subject: str) -> Tuple[bytes, str]:
+    """
+    Returns (pdf_bytes, content_key). Repeated exports of the same
+    notes/title/subject are served from the store without touching ReportLab;
+    misses are rendered in the shared CPU process pool.
+    """
+    key = export_key(markdown_text, title, subject)
+
+    pdf = _lookup(key)
+    if pdf is not None:
+        return pdf, key
+
+    with track_stage("pdf_render", subject):
+        pdf, timings = run_cpu_bound_sync(render_pdf, markdown_text, title, subject)
+    _observe_pool_stages(timings, subject)
+    export_store.put(key, pdf)
+    return pdf, key
+
+
+async def get_or_build_pdf_async(markdown_text: str, title: str, subject: str) -> Tuple[bytes, str]:
+    """Event-loop friendly variant of `get_or_build_pdf` for async routes."""
+    key = export_key(markdown_text, title, subject)
+
+    pdf = _lookup(key)
+    if pdf is not None:
+        return pdf, key
+
+    with track_stage("pdf_render", subject):
+        pdf, timings = await run_cpu_bound(render_pdf, markdown_text, title, subject)
+    _observe_pool_stages(timings, subject)
+    export_store.put(key, pdf)
+    return pdf, key
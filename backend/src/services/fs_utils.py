@@ -0,0 +1,20 @@
+import json
+import os
+import threading
+from typing import Optional
+
+
+def write_json_atomic(path: str, data: dict):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)  # readers see the old or the new file, never half
+
+
+def read_json(path: str) -> Optional[dict]:
+    """Parsed file, or None if it is missing or not valid JSON."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
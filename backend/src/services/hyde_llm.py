@@ -3,6 +3,8 @@ import json
 from dotenv import load_dotenv
 from groq import Groq
 
+from src.services.metrics import timed_chat_completion
+
 # Load API key
 load_dotenv()
 
@@ -38,7 +40,9 @@ Write 1–2 paragraphs that resemble real study material.
 Do NOT mention that this is hypothetical.
 """
 
-    response = client.chat.completions.create(
+    return timed_chat_completion(
+        client,
+        call="hyde",
         model="meta-llama/llama-4-scout-17b-16e-instruct",   # ✅ A real, current Groq model
         messages=[
             {"role": "system", "content": system_prompt},
@@ -47,9 +51,6 @@ Do NOT mention that this is hypothetical.
         temperature=0.2,
     )
 
-    message = response.choices[0].message
-    return message["content"] if isinstance(message, dict) else message.content
-
 
 # ============================================================
 # SYLLABUS → TOPIC LIST PARSER
@@ -74,7 +75,9 @@ Output MUST be valid JSON list, example:
 ["Topic 1", "Topic 2", "Topic 3"]
 """
 
-    response = client.chat.completions.create(
+    raw = timed_chat_completion(
+        client,
+        call="parse_topics",
         model="meta-llama/llama-4-scout-17b-16e-instruct",   # Same stable model
         messages=[
             {"role": "system", "content": system_prompt},
@@ -83,8 +86,6 @@ Output MUST be valid JSON list, example:
         temperature=0.0
     )
 
-    raw = response.choices[0].message.content
-
     # Try converting to JSON
     try:
         data = json.loads(raw)
@@ -0,0 +1,153 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from src.services.hyde_llm import generate_hyde_document
+from src.services.metrics import track_stage
+from src.services.vector_store import retrieve_chunks
+
+# ==== CONFIG ====
+# always   → HyDE doc first, then retrieve with it (original behaviour)
+# adaptive → retrieve with the raw text; only call HyDE when that looks weak
+# parallel → raw retrieval and HyDE generation run concurrently, results fused
+# off      → raw text only
+HYDE_MODE = os.getenv("HYDE_MODE", "always")
+HYDE_MODES = ("always", "adaptive", "parallel", "off")
+
+# Raw retrieval is "confident" when the best hit is close enough AND stands out
+# from the rest (squared L2 on unit vectors: d = 2 - 2·cos, 0.8 ≈ cos 0.6)
+HYDE_MAX_TOP1_DISTANCE = float(os.getenv("HYDE_MAX_TOP1_DISTANCE", "0.8"))
+HYDE_MIN_SCORE_GAP = float(os.getenv("HYDE_MIN_SCORE_GAP", "0.02"))
+HYDE_GAP_RANK = 5          # gap is measured between hit 1 and hit 5
+RRF_K = 60
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("HYDE_PARALLEL_THREADS", "8")),
+                               thread_name_prefix="hyde")
+
+
+def retrieval_confidence(hits: Dict) -> Dict:
+    distances = hits.get("distances") or []
+    if not distances:
+        return {"top1_distance": None, "score_gap": None, "confident": False}
+    top1 = distances[0]
+    gap = distances[min(HYDE_GAP_RANK, len(distances)) - 1] - top1
+    confident = top1 <= HYDE_MAX_TOP1_DISTANCE and gap >= HYDE_MIN_SCORE_GAP
+    return {"top1_distance": top1, "score_gap": gap, "confident": confident}
+
+
+def fuse_rrf(result_lists: List[Dict], top_k: int) -> Dict:
+    """Reciprocal-rank fusion of several retrieve_chunks results (same shape out)."""
+    scores: Dict[str, float] = {}
+    rows: Dict[str, tuple] = {}
+    for hits in result_lists:
+        for rank, (chunk_id, doc, meta, dist) in enumerate(
+            zip(hits["ids"], hits["documents"], hits["metadatas"], hits["distances"])
+        ):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            if chunk_id not in rows or dist < rows[chunk_id][2]:
+                rows[chunk_id] = (doc, meta, dist)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return {
+        "ids": ranked,
+        "documents": [rows[i][0] for i in ranked],
+        "metadatas": [rows[i][1] for i in ranked],
+        "distances": [rows[i][2] for i in ranked],
+    }
+
+
+def _in_background(fn: Callable, *args):
+    # keep route / subject labels for the spans recorded in the worker thread
+    ctx = contextvars.copy_context()
+    return _executor.submit(ctx.run, fn, *args)
+
+
+def retrieve_with_hyde(
+    query_text: str,
+    hyde_seed: str,
+    subject: Optional[str] = None,
+    use_pyq: bool = False,
+    top_k: int = 10,
+    mode: Optional[str] = None,
+    generate_hyde: Callable[[str], str] = generate_hyde_document,
+) -> Dict:
+    """
+    Retrieval for one query, with HyDE applied according to `mode`.
+
+    Returns {"hits", "hyde_doc", "hyde_used", "mode", "confidence", "timings",
+    "hyde_error"}; `hits` has the retrieve_chunks shape. timings["hyde"] is
+    the HyDE LLM time (0 when skipped), timings["hyde_wait"] the part of it
+    the caller actually waited for (less than "hyde" in parallel mode, where
+    it overlaps retrieval), timings["retrieval"] the vector search time.
+
+    In adaptive and parallel mode a failed HyDE call (LLM error, rate limit)
+    falls back to the raw hits with hyde_used=False and the error in
+    "hyde_error"; in always mode there is nothing to fall back to and it raises.
+    """
+    mode = mode or HYDE_MODE
+    if mode not in HYDE_MODES:
+        raise ValueError(f"unknown HyDE mode '{mode}' (expected one of {HYDE_MODES})")
+
+    timings = {"hyde": 0.0, "hyde_wait": 0.0, "retrieval": 0.0}
+    hyde_doc = ""
+    hyde_error = None
+    confidence = None
+
+    def hyde() -> str:
+        with track_stage("hyde", subject) as span:
+            doc = generate_hyde(hyde_seed)
+        timings["hyde"] = span.elapsed
+        return doc
+
+    def retrieve(text: str) -> Dict:
+        with track_stage("retrieval", subject) as span:
+            hits = retrieve_chunks(syllabus_text=text, subject=subject, use_pyq=use_pyq, top_k=top_k)
+        timings["retrieval"] += span.elapsed
+        return hits
+
+    def fused_with_hyde(raw_hits: Dict, get_doc: Callable[[], str]) -> Dict:
+        nonlocal hyde_doc, hyde_error
+        began = time.perf_counter()
+        try:
+            hyde_doc = get_doc()
+        except Exception as e:
+            print(f"⚠️ HyDE failed ({e}); using raw retrieval")
+            hyde_error = str(e) or type(e).__name__
+            return raw_hits
+        finally:
+            timings["hyde_wait"] = time.perf_counter() - began
+        return fuse_rrf([retrieve(hyde_doc), raw_hits], top_k)
+
+    if mode == "always":
+        hyde_doc = hyde()
+        timings["hyde_wait"] = timings["hyde"]
+        hits = retrieve(hyde_doc)
+
+    elif mode == "off":
+        hits = retrieve(query_text)
+
+    elif mode == "adaptive":
+        raw_hits = retrieve(query_text)
+        confidence = retrieval_confidence(raw_hits)
+        if confidence["confident"]:
+            hits = raw_hits
+        else:
+            hits = fused_with_hyde(raw_hits, hyde)
+
+    else:  # parallel
+        hyde_future = _in_background(hyde)
+        raw_hits = retrieve(query_text)
+        confidence = retrieval_confidence(raw_hits)
+        hits = fused_with_hyde(raw_hits, hyde_future.result)  # only the wait is on the critical path
+
+    return {
+        "hits": hits,
+        "hyde_doc": hyde_doc,
+        "hyde_used": bool(hyde_doc),
+        "mode": mode,
+        "confidence": confidence,
+        "timings": timings,
+        "hyde_error": hyde_error,
+    }
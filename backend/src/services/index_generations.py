@@ -0,0 +1,288 @@
+"""
+Versioned index generations with an atomic pointer swap.
+
+Every (re)ingestion builds a brand-new Chroma collection ("study_kb_g<N>")
+next to the live one and, only when it is complete, publishes it by
+atomically replacing a small pointer file in VECTOR_DB_DIR. Readers never
+see a half-populated collection:
+
+  - queries take a lease on the current generation for their whole duration,
+  - `reload()` (POST /api/kb/reload, or the pointer-file poller) swaps the
+    current generation in one assignment; queries already running finish on
+    the old one, which is reported as drained once its last lease is gone.
+
+Every serving process records the oldest generation it still uses in
+SERVING_DIR; publishing never prunes a generation a live process reports,
+so workers that haven't polled the new pointer yet keep theirs.
+
+Without a pointer file the legacy "study_kb" collection is served.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# ==== CONFIG ====
+BASE_COLLECTION = "study_kb"
+POINTER_FILE = "CURRENT_GENERATION.json"
+BUILD_LOCK_FILE = ".generation-build.lock"
+# Poll the pointer file every N seconds (0 = only reload via the API)
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", "5"))
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("INDEX_DRAIN_TIMEOUT_SECONDS", "120"))
+KEEP_GENERATIONS = int(os.getenv("INDEX_KEEP_GENERATIONS", "2"))
+SERVING_DIR = "serving"   # in VECTOR_DB_DIR: <pid>.json per serving process
+
+
+def generation_collection_name(generation: int) -> str:
+    return f"{BASE_COLLECTION}_g{generation}"
+
+
+# ---------------------------------------------------------
+#  POINTER FILE
+# ---------------------------------------------------------
+def read_pointer(db_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(db_dir, POINTER_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_pointer(db_dir: str, pointer: dict):
+    path = os.path.join(db_dir, POINTER_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(pointer, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # atomic on POSIX: readers see the old or the new pointer, never half
+
+
+def current_collection_name(db_dir: str) -> str:
+    pointer = read_pointer(db_dir)
+    return pointer["collection"] if pointer else BASE_COLLECTION
+
+
+@contextmanager
+def build_lock(db_dir: str):
+    """
+    Serializes generation builds across processes (the preprocess CLI and
+    every server worker's ingestion thread), so two builders never pick the
+    same next generation or publish over each other.
+    """
+    os.makedirs(db_dir, exist_ok=True)
+    with open(os.path.join(db_dir, BUILD_LOCK_FILE), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def next_generation(db_dir: str) -> int:
+    pointer = read_pointer(db_dir)
+    return (pointer["generation"] + 1) if pointer else 1
+
+
+def publish_generation(client, db_dir: str, generation: int, stats: Optional[dict] = None) -> dict:
+    """Points readers at `generation`, then prunes generations older than KEEP_GENERATIONS."""
+    name = generation_collection_name(generation)
+    pointer = {
+        "generation": generation,
+        "collection": name,
+        "count": client.get_collection(name).count(),
+        "published_at": time.time(),
+        "stats": stats or {},
+    }
+    _write_pointer(db_dir, pointer)
+    prune_generations(client, db_dir, generation)
+    return pointer
+
+
+def prune_generations(client, db_dir: str, current: int, keep: int = KEEP_GENERATIONS):
+    """
+    Drops generation collections older than the last `keep`, except those a
+    live serving process still reports (not polled yet, or draining); those
+    go at a later publish.
+    """
+    floor = min([current, *serving_generations(db_dir).values()])
+    prefix = f"{BASE_COLLECTION}_g"
+    for c in client.list_collections():
+        name = c if isinstance(c, str) else c.name
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            generation = int(name[len(prefix):])
+            if generation <= current - keep and generation < floor:
+                client.delete_collection(name)
+                print(f"🗑️ Pruned old index generation {name}")
+
+
+# ---------------------------------------------------------
+#  SERVING PROCESSES  (oldest generation each one still uses)
+# ---------------------------------------------------------
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def serving_generations(db_dir: str) -> Dict[int, int]:
+    """{pid: oldest generation in use} of live serving processes; files of dead ones are removed."""
+    root = os.path.join(db_dir, SERVING_DIR)
+    if not os.path.isdir(root):
+        return {}
+    serving = {}
+    for name in os.listdir(root):
+        pid = name[:-len(".json")]
+        if not (name.endswith(".json") and pid.isdigit()):
+            continue
+        path = os.path.join(root, name)
+        if not _pid_alive(int(pid)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                serving[int(pid)] = json.load(f)["oldest"]
+        except (OSError, ValueError, KeyError):
+            continue   # being replaced right now
+    return serving
+
+
+# ---------------------------------------------------------
+#  IN-PROCESS GENERATION TRACKING (reader side)
+# ---------------------------------------------------------
+class Generation:
+    def __init__(self, generation: int, name: str, collection):
+        self.generation = generation
+        self.name = name
+        self.collection = collection
+        self.inflight = 0
+        self.retired_at: Optional[float] = None
+        self.drained = threading.Event()
+
+
+class GenerationManager:
+    def __init__(self, client, db_dir: str):
+        self.client = client
+        self.db_dir = db_dir
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()   # one reload at a time (poller vs. API)
+        self._report_lock = threading.Lock()
+        self._current = self._open(read_pointer(db_dir))
+        self._retired: List[Generation] = []
+        self._pointer_mtime = self._mtime()
+        self._poller: Optional[threading.Thread] = None
+        self._report_serving()
+
+    def _open(self, pointer: Optional[dict]) -> Generation:
+        if pointer is None:
+            return Generation(0, BASE_COLLECTION, self.client.get_or_create_collection(BASE_COLLECTION))
+        return Generation(pointer["generation"], pointer["collection"], self.client.get_collection(pointer["collection"]))
+
+    def _mtime(self) -> float:
+        try:
+            return os.stat(os.path.join(self.db_dir, POINTER_FILE)).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    @property
+    def generation(self) -> int:
+        return self._current.generation
+
+    @contextmanager
+    def lease(self):
+        """Yields the current collection; a swap during the block doesn't affect it."""
+        with self._lock:
+            gen = self._current
+            gen.inflight += 1
+        try:
+            yield gen.collection
+        finally:
+            with self._lock:
+                gen.inflight -= 1
+                if gen.retired_at is not None and gen.inflight == 0:
+                    gen.drained.set()
+
+    def reload(self) -> Dict:
+        """Switches to the published generation if it changed."""
+        with self._reload_lock:
+            pointer = read_pointer(self.db_dir)
+            target = pointer["generation"] if pointer else 0
+            if target == self._current.generation:
+                return self.status()
+
+            new = self._open(pointer)   # opened before the swap: no reader ever waits on it
+            with self._lock:
+                old, self._current = self._current, new
+                old.retired_at = time.time()
+                if old.inflight == 0:
+                    old.drained.set()
+                self._retired.append(old)
+            print(f"🔁 Index generation {old.generation} → {new.generation} "
+                  f"({new.name}, {old.inflight} queries draining on the old one)")
+
+            threading.Thread(target=self._await_drain, args=(old,), daemon=True).start()
+            self._report_serving()
+        return self.status()
+
+    def _await_drain(self, gen: Generation):
+        if gen.drained.wait(DRAIN_TIMEOUT_SECONDS):
+            print(f"✅ Index generation {gen.generation} drained")
+        else:
+            print(f"⚠️ Index generation {gen.generation} still has {gen.inflight} queries after {DRAIN_TIMEOUT_SECONDS}s")
+        with self._lock:
+            if gen in self._retired:
+                self._retired.remove(gen)
+            gen.collection = None
+        self._report_serving()
+
+    def _report_serving(self):
+        root = os.path.join(self.db_dir, SERVING_DIR)
+        path = os.path.join(root, f"{os.getpid()}.json")
+        with self._report_lock:   # the last write always has the latest state
+            with self._lock:
+                oldest = min([self._current.generation, *(g.generation for g in self._retired)])
+            try:
+                os.makedirs(root, exist_ok=True)
+                with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump({"oldest": oldest, "updated": time.time()}, f)
+                os.replace(f"{path}.tmp", path)
+            except OSError as e:
+                print(f"⚠️ Could not record the served index generation: {e}")
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "generation": self._current.generation,
+                "collection": self._current.name,
+                "inflight": self._current.inflight,
+                "draining": [{"generation": g.generation, "inflight": g.inflight} for g in self._retired],
+            }
+
+    # ---------- pointer-file watcher ----------
+    def start_polling(self, interval: float = INDEX_POLL_SECONDS):
+        if interval <= 0 or self._poller is not None:
+            return
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                mtime = self._mtime()
+                if mtime != self._pointer_mtime:
+                    self._pointer_mtime = mtime
+                    try:
+                        self.reload()
+                    except Exception as e:  # keep serving the current generation
+                        print(f"⚠️ Index reload failed: {e}")
+
+        self._poller = threading.Thread(target=poll, name="index-generation-poller", daemon=True)
+        self._poller.start()
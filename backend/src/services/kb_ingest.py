@@ -0,0 +1,290 @@
+"""
+Runtime knowledge-base ingestion (POST /api/kb/ingest).
+
+Uploaded PDFs are saved to knowledgebase/raw_files (so a full rebuild picks
+them up too) and queued for one background worker thread per server
+process. The worker folds everything queued into one new index generation:
+
+  1. copy the live generation into the new collection (minus older copies
+     of the files being re-ingested), seeding the near-duplicate index,
+  2. run each file through preprocess_kb.process_file — text extraction and
+     OCR in the shared CPU pool, embedding throttled (see below),
+  3. publish the generation and switch this worker to it; other workers
+     follow via the pointer-file poller.
+
+Live queries keep running on the current generation throughout. Embedding is
+the part that competes with them for CPU, so it runs in small batches, waits
+(briefly) while retrieval queries are in flight, and sleeps between batches
+to stay under INGEST_EMBED_DUTY of wall time.
+
+The queue is bounded: an upload batch first reserves its slots (all or
+nothing) and gets IngestQueueFull (HTTP 429) when they aren't free, instead
+of accepting work that can't start soon. Queue and worker thread are per
+server process.
+
+Job status is written to INGEST_JOBS_DIR on every change, so whichever
+server process answers GET /kb/ingest/{job_id} sees the same state.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from src.services import preprocess_kb
+from src.services.cpu_pool import run_cpu_bound_sync
+from src.services.dedup import MinHashLSH
+from src.services.fs_utils import read_json, write_json_atomic
+from src.services.index_generations import build_lock, next_generation, publish_generation
+from src.services.vector_store import VECTOR_DB_DIR, embed_queries, get_client, get_generations, get_tokenizer
+
+# ==== CONFIG ====
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "32"))
+# Max share of wall time the worker spends embedding (the rest is left to live traffic)
+INGEST_EMBED_DUTY = float(os.getenv("INGEST_EMBED_DUTY", "0.5"))
+INGEST_YIELD_MAX_SECONDS = 0.5       # per embed batch, max wait for in-flight queries to finish
+INGEST_EXTRACT_TIMEOUT_SECONDS = float(os.getenv("INGEST_EXTRACT_TIMEOUT_SECONDS", "1800"))
+INGEST_HISTORY = 200                 # finished jobs kept for status queries
+INGEST_JOBS_DIR = os.getenv("INGEST_JOBS_DIR", "./checkpoints/ingest")   # shared by all server processes
+COPY_PAGE_SIZE = 1000
+
+
+class IngestQueueFull(RuntimeError):
+    """Raised when the ingestion queue has no room; callers should retry later (HTTP 429)."""
+
+
+@dataclass
+class IngestJob:
+    job_id: str
+    filename: str
+    path: str
+    subject: str
+    status: str = "queued"   # queued → extracting/ocr/chunking/embedding/storing → indexed → published | skipped | failed
+    content_type: Optional[str] = None
+    chunks: int = 0
+    kept: int = 0
+    generation: Optional[int] = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data.pop("path")
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "IngestJob":
+        return cls(path="", **data)
+
+
+# ---------------------------------------------------------
+#  THROTTLED EMBEDDING
+# ---------------------------------------------------------
+def _yield_to_queries():
+    deadline = time.monotonic() + INGEST_YIELD_MAX_SECONDS
+    while get_generations().status()["inflight"] > 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def throttled_embed(documents: List[str]) -> List[List[float]]:
+    embeddings: List[List[float]] = []
+    for start in range(0, len(documents), INGEST_EMBED_BATCH):
+        _yield_to_queries()
+        began = time.perf_counter()
+        embeddings.extend(embed_queries(documents[start:start + INGEST_EMBED_BATCH]).tolist())
+        busy = time.perf_counter() - began
+        if 0 < INGEST_EMBED_DUTY < 1:
+            time.sleep(busy * (1 - INGEST_EMBED_DUTY) / INGEST_EMBED_DUTY)
+    return embeddings
+
+
+def _run_in_pool(fn, *args):
+    return run_cpu_bound_sync(fn, *args, timeout=INGEST_EXTRACT_TIMEOUT_SECONDS)
+
+
+# ---------------------------------------------------------
+#  WORKER
+# ---------------------------------------------------------
+class IngestWorker:
+    def __init__(self, max_queue: int = INGEST_QUEUE_SIZE, jobs_dir: str = INGEST_JOBS_DIR):
+        self._queue: "queue.Queue[IngestJob]" = queue.Queue(maxsize=max_queue)
+        self._reserved = 0
+        self._jobs: Dict[str, IngestJob] = {}
+        self.jobs_dir = jobs_dir
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- API side ----------
+    def free_slots(self) -> int:
+        with self._lock:
+            return self._queue.maxsize - self._queue.qsize() - self._reserved
+
+    def reserve(self, count: int):
+        """
+        Holds `count` queue slots for one upload batch (all or nothing), so
+        concurrent batches can't both pass the room check. Each submit()
+        uses one; release() returns what a rejected batch didn't use.
+        """
+        with self._lock:
+            free = self._queue.maxsize - self._queue.qsize() - self._reserved
+            if free < count:
+                raise IngestQueueFull(f"Ingestion queue has room for {free} file(s), got {count}")
+            self._reserved += count
+
+    def release(self, count: int):
+        with self._lock:
+            self._reserved -= count
+
+    def submit(self, filename: str, path: str) -> IngestJob:
+        """Queues one file into a slot taken with reserve()."""
+        job = IngestJob(
+            job_id=uuid.uuid4().hex,
+            filename=filename,
+            path=path,
+            subject=preprocess_kb.detect_subject(filename),
+        )
+        with self._lock:
+            self._reserved -= 1
+            self._queue.put_nowait(job)  # the reservation guarantees room
+            self._jobs[job.job_id] = job
+            self._trim_history()
+        self._save(job)
+        self._ensure_thread()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or not job_id.isalnum():
+            return job
+        # submitted to another server process
+        data = read_json(self._job_path(job_id))
+        return IngestJob.from_dict(data) if data is not None else None
+
+    def jobs(self) -> List[IngestJob]:
+        """Recent jobs of all server processes, newest first."""
+        jobs = {}
+        if os.path.isdir(self.jobs_dir):
+            for name in os.listdir(self.jobs_dir):
+                data = read_json(os.path.join(self.jobs_dir, name)) if name.endswith(".json") else None
+                if data is not None:
+                    jobs[data["job_id"]] = IngestJob.from_dict(data)
+        with self._lock:
+            jobs.update(self._jobs)
+        return sorted(jobs.values(), key=lambda j: j.submitted_at, reverse=True)[:INGEST_HISTORY]
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job: IngestJob):
+        try:
+            os.makedirs(self.jobs_dir, exist_ok=True)
+            write_json_atomic(self._job_path(job.job_id), job.to_dict())
+        except OSError as e:
+            print(f"⚠️ Could not persist ingestion job {job.job_id}: {e}")
+
+    def _update(self, job: IngestJob, **changes):
+        for key, value in changes.items():
+            setattr(job, key, value)
+        self._save(job)
+
+    def _trim_history(self):
+        finished = [j for j in self._jobs.values() if j.finished_at is not None]
+        for job in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(finished) - INGEST_HISTORY)]:
+            del self._jobs[job.job_id]
+            try:
+                os.remove(self._job_path(job.job_id))
+            except OSError:
+                pass
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="kb-ingest", daemon=True)
+                self._thread.start()
+
+    # ---------- worker side ----------
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Everything already waiting goes into the same generation
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._build(batch)
+            except Exception as e:
+                print(f"❌ Ingestion of {len(batch)} file(s) failed: {e}")
+                for job in batch:
+                    if job.finished_at is None:
+                        self._update(job, status="failed", error=str(e), finished_at=time.time())
+
+    def _build(self, batch: List[IngestJob]):
+        os.makedirs(preprocess_kb.PROCESSED_DIR, exist_ok=True)
+        replaced = {job.filename for job in batch}
+
+        client, generations = get_client(), get_generations()
+        with build_lock(VECTOR_DB_DIR):
+            generations.reload()  # copy from the latest published generation, not a stale view
+            generation = next_generation(VECTOR_DB_DIR)
+            collection = preprocess_kb.create_generation_collection(client, generation)
+            print(f"📥 Ingesting {len(batch)} file(s) into generation {generation}")
+
+            dedup_indexes = {"BOOK": MinHashLSH(), "PYQ": MinHashLSH()}
+            copied = self._copy_live(collection, replaced, dedup_indexes)
+            print(f"   copied {copied} chunks from the live generation")
+
+            indexed = []
+            for job in batch:
+                self._update(job, started_at=time.time())
+                try:
+                    stats = preprocess_kb.process_file(
+                        job.path,
+                        collection,
+                        dedup_indexes,
+                        tokenizer=get_tokenizer(),
+                        embed=throttled_embed,
+                        run=_run_in_pool,
+                        on_stage=lambda stage, job=job: self._update(job, status=stage),
+                    )
+                except Exception as e:
+                    print(f"❌ Ingestion failed for {job.filename}: {e}")
+                    self._update(job, status="failed", error=str(e), finished_at=time.time())
+                    continue
+
+                self._update(job, content_type=stats["type"], chunks=stats["chunks"], kept=stats["kept"])
+                if stats["status"] == "indexed":
+                    self._update(job, status="indexed")
+                    indexed.append(job)
+                else:
+                    self._update(job, status="skipped", error=stats["reason"], finished_at=time.time())
+
+            if not indexed:
+                # nothing new: keep serving the live generation as it is
+                client.delete_collection(collection.name)
+                return
+
+            pointer = publish_generation(client, VECTOR_DB_DIR, generation, stats={
+                "ingested": [job.filename for job in indexed],
+                "copied": copied,
+            })
+
+        generations.reload()
+        for job in indexed:
+            self._update(job, status="published", generation=generation, finished_at=time.time())
+        print(f"✅ Generation {generation} published ({pointer['count']} chunks)")
+
+    def _copy_live(self, target, replaced: set, dedup_indexes: Dict[str, MinHashLSH]) -> int:
+        """Copies the live generation, minus chunks of re-ingested files."""
+        with get_generations().lease() as live:
+            return preprocess_kb.copy_generation(live, target, replaced, dedup_indexes, COPY_PAGE_SIZE)
+
+
+ingest_worker = IngestWorker()
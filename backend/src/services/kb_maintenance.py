@@ -0,0 +1,216 @@
+"""
+Knowledge-base maintenance command.
+
+Run from backend/:
+    python -m src.services.kb_maintenance stats
+    python -m src.services.kb_maintenance relabel --dry-run
+    python -m src.services.kb_maintenance relabel --page-size 5000 --batch-size 5000
+    python -m src.services.kb_maintenance prune-texts --dry-run
+
+Reads the collection page by page (metadata-only `get` calls where that is
+enough), so memory stays constant regardless of KB size. `relabel` writes
+its result to a new index generation instead of the one being served.
+"""
+import argparse
+import os
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from chromadb import PersistentClient
+
+from src.services.chunk_store import PROCESSED_DIR, chunk_store, is_versioned_file, store_chunks
+from src.services.index_generations import (
+    BASE_COLLECTION,
+    build_lock,
+    current_collection_name,
+    next_generation,
+    publish_generation,
+)
+from src.services.subjects import detect_subject_from_filename
+
+VECTOR_DB_DIR = "./vector-db"
+
+# A rule maps a metadata field to a function of the chunk's `source`.
+# Every rule is evaluated once per distinct source, then broadcast to all rows.
+FIELD_RULES: Dict[str, Callable[[str], str]] = {
+    "subject": detect_subject_from_filename,
+}
+
+
+def open_collection():
+    """The collection of the currently published index generation."""
+    client = PersistentClient(path=VECTOR_DB_DIR)
+    return client, client.get_collection(current_collection_name(VECTOR_DB_DIR))
+
+
+def iter_metadata_pages(collection, page_size: int) -> Iterator[Tuple[List[str], List[dict]]]:
+    """Yields (ids, metadatas) one page at a time, metadata only."""
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        ids = page["ids"]
+        if not ids:
+            return
+        yield ids, page["metadatas"]
+        offset += len(ids)
+
+
+# --------------------------------------------
+# Commands
+# --------------------------------------------
+def kb_stats(page_size: int = 5000):
+    _, collection = open_collection()
+    total = collection.count()
+    by_subject, by_type, by_source = Counter(), Counter(), Counter()
+
+    for ids, metas in iter_metadata_pages(collection, page_size):
+        for meta in metas:
+            meta = meta or {}
+            by_subject[meta.get("subject", "UNKNOWN")] += 1
+            by_type[meta.get("type", "?")] += 1
+            by_source[meta.get("source", "?")] += 1
+
+    print(f"📦 {total} chunks in '{collection.name}'")
+    print(f"  subjects → {dict(by_subject)}")
+    print(f"  types    → {dict(by_type)}")
+    print(f"  sources  → {len(by_source)}")
+    for source, n in by_source.most_common():
+        print(f"    {n:>7}  {source}")
+
+
+def relabel(dry_run: bool = False, page_size: int = 5000, batch_size: int = 5000) -> int:
+    """
+    Recomputes FIELD_RULES for every chunk. The served generation is never
+    written to: under the build lock, the KB is copied with corrected labels
+    into a new index generation, which is published only if something
+    changed. Servers switch to it (and drop cached retrieval results) as
+    after any rebuild. Returns the number of rows (to be) updated.
+    """
+    from src.services.preprocess_kb import create_generation_collection
+
+    client = PersistentClient(path=VECTOR_DB_DIR)
+    with build_lock(VECTOR_DB_DIR):
+        live = client.get_collection(current_collection_name(VECTOR_DB_DIR))
+        total = live.count()
+        batch_size = min(batch_size, getattr(client, "max_batch_size", batch_size) or batch_size)
+        generation = next_generation(VECTOR_DB_DIR)
+        target = None if dry_run else create_generation_collection(client, generation)
+
+        print(f"🔍 Scanning {total} chunks of {live.name} (page={page_size}, batch={batch_size}, dry_run={dry_run})")
+        start = time.perf_counter()
+
+        corrected_by_source: Dict[str, Dict[str, str]] = {}
+        changes_by_label: Counter = Counter()
+        scanned = updated = 0
+
+        offset = 0
+        while True:
+            include = ["metadatas"] if dry_run else ["embeddings", "documents", "metadatas"]
+            page = live.get(include=include, limit=page_size, offset=offset)
+            ids = page["ids"]
+            if not ids:
+                break
+            offset += len(ids)
+
+            metas = []
+            for meta in page["metadatas"]:
+                meta = meta or {}
+                source = meta.get("source", "")
+
+                corrected = corrected_by_source.get(source)
+                if corrected is None:
+                    corrected = {field: rule(source) for field, rule in FIELD_RULES.items()}
+                    corrected_by_source[source] = corrected
+
+                changed = [field for field, value in corrected.items() if meta.get(field) != value]
+                for field in changed:
+                    changes_by_label[(source, field, meta.get(field), corrected[field])] += 1
+                updated += bool(changed)
+                # Keep every other field (type, offsets, ...) as is
+                metas.append({**meta, **corrected})
+
+            if target is not None:
+                docs = chunk_store.resolve(page["documents"], page["metadatas"], expand=0)
+                for i in range(0, len(ids), batch_size):
+                    store_chunks(target.add, ids[i:i + batch_size], list(page["embeddings"][i:i + batch_size]),
+                                 docs[i:i + batch_size], metas[i:i + batch_size])
+
+            scanned += len(ids)
+            print(f"  → scanned {scanned}/{total} ({updated} changed)")
+
+        if target is not None:
+            if updated:
+                publish_generation(client, VECTOR_DB_DIR, generation, stats={"relabelled": updated})
+            else:
+                client.delete_collection(target.name)  # nothing to fix: keep serving the live generation
+
+    # old values can be None next to strings: sort on their text
+    for (source, field, old, new), n in sorted(changes_by_label.items(), key=lambda kv: tuple(map(str, kv[0]))):
+        print(f"  {'Would fix' if dry_run else 'Fixed'} → {source}: {field} {old} → {new} ({n} chunks)")
+
+    elapsed = time.perf_counter() - start
+    verb = "Would update" if dry_run else "Updated"
+    print(f"\n✅ DONE — {verb} {updated} of {scanned} entries in {elapsed:.1f}s")
+    if updated and not dry_run:
+        print(f"   published as index generation {generation} (servers switch on their next poll)")
+    return updated
+
+
+def prune_texts(dry_run: bool = False, page_size: int = 5000) -> int:
+    """
+    Deletes digest-named processed texts (CHUNK_STORE=offsets) that no index
+    generation points into any more. Runs under the build lock, so a build
+    can't be writing a new one meanwhile. Returns the number of files (to be) removed.
+    """
+    client = PersistentClient(path=VECTOR_DB_DIR)
+    with build_lock(VECTOR_DB_DIR):
+        referenced = set()
+        for c in client.list_collections():
+            name = c if isinstance(c, str) else c.name
+            if not name.startswith(BASE_COLLECTION):
+                continue
+            for _, metas in iter_metadata_pages(client.get_collection(name), page_size):
+                referenced.update((meta or {}).get("text_file") for meta in metas)
+
+        stale = [name for name in sorted(os.listdir(PROCESSED_DIR))
+                 if is_versioned_file(name) and name not in referenced]
+        freed = 0
+        for name in stale:
+            path = os.path.join(PROCESSED_DIR, name)
+            freed += os.path.getsize(path)
+            print(f"  {'Would remove' if dry_run else 'Removed'} → {name}")
+            if not dry_run:
+                os.remove(path)
+
+    print(f"\n✅ DONE — {len(stale)} unreferenced text file(s), {freed / 1e6:.1f} MB")
+    return len(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Syllabus GPT knowledge-base maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_stats = sub.add_parser("stats", help="chunk counts by subject / type / source")
+    p_stats.add_argument("--page-size", type=int, default=5000)
+
+    p_relabel = sub.add_parser("relabel", help="recompute subject labels from source filenames")
+    p_relabel.add_argument("--dry-run", action="store_true")
+    p_relabel.add_argument("--page-size", type=int, default=5000)
+    p_relabel.add_argument("--batch-size", type=int, default=5000)
+
+    p_prune = sub.add_parser("prune-texts", help="delete processed texts no index generation references")
+    p_prune.add_argument("--dry-run", action="store_true")
+    p_prune.add_argument("--page-size", type=int, default=5000)
+
+    args = parser.parse_args()
+    if args.command == "stats":
+        kb_stats(page_size=args.page_size)
+    elif args.command == "relabel":
+        relabel(dry_run=args.dry_run, page_size=args.page_size, batch_size=args.batch_size)
+    elif args.command == "prune-texts":
+        prune_texts(dry_run=args.dry_run, page_size=args.page_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+"""
+Portable single-file knowledge-base snapshot.
+
+Run from backend/:
+    python -m src.services.kb_snapshot export kb-2024-06.kbsnap
+    python -m src.services.kb_snapshot info   kb-2024-06.kbsnap
+    python -m src.services.kb_snapshot verify kb-2024-06.kbsnap
+    python -m src.services.kb_snapshot import kb-2024-06.kbsnap    # new Chroma index generation
+
+Or serve straight from the file (no Chroma, no OCR, no embedding of the corpus):
+    RETRIEVAL_BACKEND=snapshot KB_SNAPSHOT_PATH=kb-2024-06.kbsnap uvicorn src.main:app
+
+Layout (all sections 64-byte aligned, little-endian):
+    b"SGKBSNAP" | uint32 format version | uint32 reserved | uint64 manifest length
+    manifest (JSON: count, dim, embedder, per-section offset/length/dtype/sha256, columns)
+    embeddings   float32 (count, dim), contiguous
+    text         utf-8 chunk texts back to back      + text_offsets uint64 (count + 1)
+    ids          utf-8 chunk ids back to back        + ids_offsets  uint64 (count + 1)
+    col_<name>   one array per metadata key: int64 for integer fields,
+                 int32 codes into a JSON vocabulary for everything else (-1 = missing)
+
+Loading memory-maps the file; every section is a zero-copy numpy view.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.services.chunk_store import OFFSET_KEYS, chunk_store
+
+MAGIC = b"SGKBSNAP"
+FORMAT_VERSION = 1
+ALIGN = 64
+_PREAMBLE = struct.Struct("<8sIIQ")
+INT_MISSING = np.iinfo(np.int64).min
+HASH_BLOCK = 8 * 1024 * 1024
+
+# ==== CONFIG ====
+KB_SNAPSHOT_PATH = os.getenv("KB_SNAPSHOT_PATH", "./vector-db/kb.kbsnap")
+
+
+class SnapshotError(RuntimeError):
+    """Raised for a corrupt, truncated or incompatible snapshot file."""
+
+
+def _pad(n: int) -> int:
+    return (-n) % ALIGN
+
+
+# ---------------------------------------------------------
+#  EXPORT
+# ---------------------------------------------------------
+class _SectionWriter:
+    """Appends to a temp file while hashing, so sections never sit in memory."""
+
+    def __init__(self, directory: str, name: str, dtype: str, shape=None):
+        self.name = name
+        self.dtype = dtype
+        self.shape = shape
+        self.path = os.path.join(directory, name)
+        self.file = open(self.path, "wb")
+        self.hash = hashlib.sha256()
+        self.length = 0
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.hash.update(data)
+        self.length += len(data)
+
+    def close(self):
+        self.file.close()
+
+
+def _iter_pages(collection, page_size: int):
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def _column_kind(values) -> str:
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return "int"
+    return "category"
+
+
+def export_snapshot(collection, path: str, embedder_name: str, page_size: int = 5000) -> dict:
+    """
+    Writes `collection` to a snapshot file at `path` (atomically, via a temp
+    file + rename) and returns its manifest.
+    """
+    total = collection.count()
+    tmp_dir = tempfile.mkdtemp(prefix="kbsnap-", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        emb = text = ids = None
+        text_offsets, id_offsets = [0], [0]
+        metadata_rows: List[dict] = []
+        dim = None
+
+        for page in _iter_pages(collection, page_size):
+            vectors = np.ascontiguousarray(np.asarray(page["embeddings"], dtype=np.float32))
+            if emb is None:
+                dim = vectors.shape[1]
+                emb = _SectionWriter(tmp_dir, "embeddings", "float32")
+                text = _SectionWriter(tmp_dir, "text", "uint8")
+                ids = _SectionWriter(tmp_dir, "ids", "uint8")
+            emb.write(vectors.tobytes())
+
+            # offset-stored chunks are exported with their text: a snapshot stands on its own
+            docs = chunk_store.resolve(page["documents"], page["metadatas"], expand=0)
+            for chunk_id, doc, meta in zip(page["ids"], docs, page["metadatas"]):
+                encoded = (doc or "").encode("utf-8")
+                text.write(encoded)
+                text_offsets.append(text_offsets[-1] + len(encoded))
+                encoded = chunk_id.encode("utf-8")
+                ids.write(encoded)
+                id_offsets.append(id_offsets[-1] + len(encoded))
+                # metadata is small (a handful of scalars per chunk), kept until the end
+                metadata_rows.append(meta or {})
+            print(f"  → exported {len(metadata_rows)}/{total} chunks")
+
+        if emb is None:
+            raise SnapshotError("collection is empty")
+        count = len(metadata_rows)
+        emb.shape = [count, dim]
+
+        sections = [emb, text, ids]
+        for name, offsets in (("text_offsets", text_offsets), ("ids_offsets", id_offsets)):
+            w = _SectionWriter(tmp_dir, name, "uint64", [count + 1])
+            w.write(np.asarray(offsets, dtype=np.uint64).tobytes())
+            sections.append(w)
+
+        # --- metadata columns ---
+        columns = {}
+        keys = sorted({k for meta in metadata_rows for k in meta})
+        for key in keys:
+            values = [meta.get(key) for meta in metadata_rows]
+            if _column_kind(values) == "int":
+                arr = np.array([INT_MISSING if v is None else v for v in values], dtype=np.int64)
+                columns[key] = {"kind": "int"}
+            else:
+                vocab = sorted({v for v in values if v is not None}, key=lambda v: (type(v).__name__, str(v)))
+                lookup = {(type(v), v): i for i, v in enumerate(vocab)}
+                arr = np.array([-1 if v is None else lookup[(type(v), v)] for v in values], dtype=np.int32)
+                columns[key] = {"kind": "category", "vocab": vocab}
+            w = _SectionWriter(tmp_dir, f"col_{key}", str(arr.dtype), [count])
+            w.write(arr.tobytes())
+            sections.append(w)
+        for w in sections:
+            w.close()
+
+        # --- layout: preamble | manifest | sections ---
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "created_at": time.time(),
+            "collection": getattr(collection, "name", ""),
+            "count": count,
+            "dim": dim,
+            "embedder": {"model": embedder_name, "dim": dim},
+            "columns": columns,
+            "sections": {},
+        }
+        # offsets depend on the manifest length; reserve generously, then fill in
+        offset = 0
+        for w in sections:
+            manifest["sections"][w.name] = {
+                "offset": offset, "length": w.length, "dtype": w.dtype,
+                "shape": w.shape, "sha256": w.hash.hexdigest(),
+            }
+            offset += w.length + _pad(w.length)
+
+        body_start = _PREAMBLE.size + len(json.dumps(manifest).encode("utf-8")) + 1024
+        body_start += _pad(body_start)
+        for info in manifest["sections"].values():
+            info["offset"] += body_start
+        manifest_bytes = json.dumps(manifest).encode("utf-8")
+        assert _PREAMBLE.size + len(manifest_bytes) <= body_start
+
+        out_tmp = path + ".tmp"
+        with open(out_tmp, "wb") as out:
+            out.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(manifest_bytes)))
+            out.write(manifest_bytes)
+            out.write(b"\0" * (body_start - out.tell()))
+            for w in sections:
+                with open(w.path, "rb") as src:
+                    shutil.copyfileobj(src, out, HASH_BLOCK)
+                out.write(b"\0" * _pad(w.length))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(out_tmp, path)
+        return manifest
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------
+#  LOAD  (memory-mapped, zero-copy sections)
+# ---------------------------------------------------------
+def read_manifest(f) -> dict:
+    preamble = f.read(_PREAMBLE.size)
+    if len(preamble) < _PREAMBLE.size:
+        raise SnapshotError("file too short")
+    magic, version, _, manifest_len = _PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise SnapshotError("not a KB snapshot (bad magic)")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"unsupported snapshot format version {version}")
+    try:
+        return json.loads(f.read(manifest_len))
+    except ValueError as e:
+        raise SnapshotError(f"corrupt manifest: {e}")
+
+
+class KBSnapshot:
+    def __init__(self, path: str, verify: bool = True, expected_embedder: Optional[str] = None):
+        self.path = path
+        self._file = open(path, "rb")
+        self.manifest = read_manifest(self._file)
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        size = len(self._mmap)
+        for name, info in self.manifest["sections"].items():
+            if info["offset"] + info["length"] > size:
+                raise SnapshotError(f"section '{name}' is truncated")
+
+        model = self.manifest["embedder"]["model"]
+        if expected_embedder and model != expected_embedder:
+            raise SnapshotError(f"snapshot was embedded with '{model}', this node uses '{expected_embedder}'")
+        if verify:
+            self.verify()
+
+        self.count = self.manifest["count"]
+        self.embeddings = self._section("embeddings")
+        self._text = self._section("text")
+        self._text_offsets = self._section("text_offsets")
+        self._ids = self._section("ids")
+        self._id_offsets = self._section("ids_offsets")
+        self.columns = {name: self._section(f"col_{name}") for name in self.manifest["columns"]}
+        self._norms: Optional[np.ndarray] = None
+        self._id_list: Optional[List[str]] = None
+
+    def _section(self, name: str) -> np.ndarray:
+        info = self.manifest["sections"][name]
+        arr = np.frombuffer(self._mmap, dtype=info["dtype"], count=info["length"] // np.dtype(info["dtype"]).itemsize,
+                            offset=info["offset"])
+        return arr.reshape(info["shape"]) if info["shape"] else arr
+
+    def verify(self):
+        """Streams every section through sha256; raises SnapshotError on mismatch."""
+        for name, info in self.manifest["sections"].items():
+            digest = hashlib.sha256()
+            start, end = info["offset"], info["offset"] + info["length"]
+            for pos in range(start, end, HASH_BLOCK):
+                digest.update(self._mmap[pos:min(pos + HASH_BLOCK, end)])
+            if digest.hexdigest() != info["sha256"]:
+                raise SnapshotError(f"checksum mismatch in section '{name}'")
+
+    def close(self):
+        for name in ("embeddings", "_text", "_text_offsets", "_ids", "_id_offsets", "columns"):
+            setattr(self, name, None)
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # a caller still holds a view; the map goes away with it
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    # ---------- row access ----------
+    def chunk_id(self, i: int) -> str:
+        return bytes(self._ids[self._id_offsets[i]:self._id_offsets[i + 1]]).decode("utf-8")
+
+    def document(self, i: int) -> str:
+        return bytes(self._text[self._text_offsets[i]:self._text_offsets[i + 1]]).decode("utf-8")
+
+    def metadata(self, i: int) -> dict:
+        meta = {}
+        for name, spec in self.manifest["columns"].items():
+            value = int(self.columns[name][i])
+            if spec["kind"] == "int":
+                if value != INT_MISSING:
+                    meta[name] = value
+            elif value >= 0:
+                meta[name] = spec["vocab"][value]
+        return meta
+
+    def ids(self) -> List[str]:
+        if self._id_list is None:
+            self._id_list = [self.chunk_id(i) for i in range(self.count)]
+        return self._id_list
+
+    def iter_batches(self, batch_size: int) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[dict]]]:
+        for start in range(0, self.count, batch_size):
+            rows = range(start, min(start + batch_size, self.count))
+            yield (
+                [self.chunk_id(i) for i in rows],
+                self.embeddings[start:rows.stop],
+                [self.document(i) for i in rows],
+                [self.metadata(i) for i in rows],
+            )
+
+    # ---------- search ----------
+    def _mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        mask = np.ones(self.count, dtype=bool)
+        for clause in where.get("$and", [where]):
+            for key, value in clause.items():
+                spec = self.manifest["columns"].get(key)
+                if spec is None or isinstance(value, dict):
+                    raise ValueError(f"unsupported filter for snapshot search: {clause}")
+                if spec["kind"] == "int":
+                    mask &= self.columns[key] == value
+                elif value in spec["vocab"]:
+                    mask &= self.columns[key] == spec["vocab"].index(value)
+                else:
+                    mask[:] = False
+        return mask
+
+    def search(self, query_embedding, top_k: int = 10, where: Optional[dict] = None) -> dict:
+        """Exact squared-L2 search, same result shape as vector_store.retrieve_chunks."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if self._norms is None:
+            self._norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+
+        mask = self._mask(where)
+        rows = np.arange(self.count) if mask is None else np.flatnonzero(mask)
+        if len(rows) == 0:
+            return {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        vectors = self.embeddings if mask is None else self.embeddings[rows]
+        distances = self._norms[rows] - 2.0 * (vectors @ query) + float(query @ query)
+        k = min(top_k, len(rows))
+        best = np.argpartition(distances, k - 1)[:k]
+        best = best[np.argsort(distances[best])]
+        hits = rows[best]
+
+        return {
+            "ids": [self.chunk_id(i) for i in hits],
+            "documents": [self.document(i) for i in hits],
+            "metadatas": [self.metadata(i) for i in hits],
+            "distances": [float(d) for d in distances[best]],
+        }
+
+
+_snapshot: Optional[KBSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot(expected_embedder: Optional[str] = None) -> KBSnapshot:
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            start = time.perf_counter()
+            _snapshot = KBSnapshot(KB_SNAPSHOT_PATH, verify=True, expected_embedder=expected_embedder)
+            print(f"📦 KB snapshot loaded: {_snapshot.count} chunks from {KB_SNAPSHOT_PATH} "
+                  f"({time.perf_counter() - start:.2f}s incl. checksum)")
+        return _snapshot
+
+
+def reload_snapshot(expected_embedder: Optional[str] = None) -> KBSnapshot:
+    """Loads KB_SNAPSHOT_PATH again (e.g. after a new export was moved into place)."""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None  # not closed: queries still running on it keep their maps
+    return get_snapshot(expected_embedder)
+
+
+# ---------------------------------------------------------
+#  IMPORT INTO CHROMA
+# ---------------------------------------------------------
+def import_snapshot(path: str, batch_size: int = 5000) -> int:
+    """
+    Loads a snapshot into a new index generation and publishes it. Chunks are
+    stored with their text whatever CHUNK_STORE says.
+    """
+    from src.services.embedding_server import EMBEDDING_MODEL_NAME
+    from src.services.index_generations import (
+        build_lock,
+        generation_collection_name,
+        next_generation,
+        publish_generation,
+    )
+    from src.services.kb_maintenance import VECTOR_DB_DIR
+    from chromadb import PersistentClient
+
+    snap = KBSnapshot(path, verify=True, expected_embedder=EMBEDDING_MODEL_NAME)
+    client = PersistentClient(path=VECTOR_DB_DIR)
+    with build_lock(VECTOR_DB_DIR):
+        generation = next_generation(VECTOR_DB_DIR)
+        collection = client.get_or_create_collection(generation_collection_name(generation))
+        batch_size = min(batch_size, getattr(client, "max_batch_size", batch_size) or batch_size)
+
+        done = 0
+        for ids, vectors, docs, metas in snap.iter_batches(batch_size):
+            # The snapshot carries the text; offsets would point into processed
+            # files this node may not have, so they are not imported
+            metas = [{k: v for k, v in (meta or {}).items() if k not in OFFSET_KEYS} for meta in metas]
+            collection.upsert(ids=ids, embeddings=vectors.tolist(), documents=docs, metadatas=metas)
+            done += len(ids)
+            print(f"  → imported {done}/{snap.count}")
+        snap.close()
+
+        publish_generation(client, VECTOR_DB_DIR, generation, stats={"snapshot": os.path.basename(path)})
+    print(f"  → published as generation {generation}")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KB snapshot export / import")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="write the Chroma collection to a snapshot file")
+    p_export.add_argument("path")
+    p_export.add_argument("--page-size", type=int, default=5000)
+
+    for name, help_text in (("info", "print the manifest"), ("verify", "check all section checksums")):
+        sub.add_parser(name, help=help_text).add_argument("path")
+
+    p_import = sub.add_parser("import", help="load a snapshot into a new published index generation")
+    p_import.add_argument("path")
+    p_import.add_argument("--batch-size", type=int, default=5000)
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+
+    if args.command == "export":
+        from src.services.embedding_server import EMBEDDING_MODEL_NAME
+        from src.services.kb_maintenance import open_collection
+        _, collection = open_collection()
+        manifest = export_snapshot(collection, args.path, EMBEDDING_MODEL_NAME, args.page_size)
+        print(f"\n✅ {manifest['count']} chunks → {args.path} "
+              f"({os.path.getsize(args.path) / 1e6:.1f} MB, {time.perf_counter() - start:.1f}s)")
+    elif args.command == "info":
+        with open(args.path, "rb") as f:
+            manifest = read_manifest(f)
+        print(json.dumps({k: v for k, v in manifest.items() if k != "sections"}, indent=2, default=str))
+        for name, info in manifest["sections"].items():
+            print(f"  {name:<16} {info['length'] / 1e6:>9.2f} MB  {info['dtype']}")
+    elif args.command == "verify":
+        KBSnapshot(args.path, verify=True).close()
+        print(f"✅ checksums OK ({time.perf_counter() - start:.2f}s)")
+    elif args.command == "import":
+        n = import_snapshot(args.path, args.batch_size)
+        print(f"\n✅ Imported {n} chunks in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+from src.services.subjects import KNOWN_SUBJECTS
+
+# Route / subject of the request currently being served.
+# Set by the HTTP middleware and the notes pipeline, read by every span.
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+current_subject: ContextVar[str] = ContextVar("current_subject", default="ALL")
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+
+# ==== METRICS ====
+STAGE_LATENCY = Histogram(
+    "syllabus_gpt_stage_seconds",
+    "Latency of a single pipeline stage",
+    ["stage", "subject", "route"],
+    buckets=STAGE_BUCKETS,
+)
+
+REQUEST_LATENCY = Histogram(
+    "syllabus_gpt_request_seconds",
+    "End-to-end HTTP request latency",
+    ["route", "method", "status"],
+    buckets=STAGE_BUCKETS,
+)
+
+LLM_TTFT = Histogram(
+    "syllabus_gpt_llm_time_to_first_token_seconds",
+    "Time until the first streamed token of an LLM completion",
+    ["call", "subject", "route"],
+    buckets=STAGE_BUCKETS,
+)
+
+LLM_TOKENS_PER_SECOND = Histogram(
+    "syllabus_gpt_llm_tokens_per_second",
+    "Decode throughput of an LLM completion (after the first token)",
+    ["call", "subject", "route"],
+    buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600, 3200),
+)
+
+LLM_COMPLETION_TOKENS = Counter(
+    "syllabus_gpt_llm_completion_tokens_total",
+    "Completion tokens produced by the LLM",
+    ["call", "subject", "route"],
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "syllabus_gpt_event_loop_lag_seconds",
+    "How late the event loop woke up a periodic timer (blocking work on the loop shows up here)",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+ADMISSION_WAIT = Histogram(
+    "syllabus_gpt_admission_wait_seconds",
+    "Time a request waited in its route class queue before running",
+    ["gate"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+
+ADMISSION_REJECTED = Counter(
+    "syllabus_gpt_admission_rejected_total",
+    "Requests turned away by admission control (429 queue full, 503 waited too long)",
+    ["gate", "status"],
+)
+
+CACHE_REQUESTS = Counter(
+    "syllabus_gpt_cache_requests_total",
+    "Cache lookups by cache name and result (hit / miss)",
+    ["cache", "result"],
+)
+
+
+def _subject_label(subject: Optional[str]) -> str:
+    # Subjects come from request bodies: only known ones become label values,
+    # so a client can't create a new time series per string
+    label = (subject or current_subject.get()).upper()
+    return label if label == "ALL" or label in KNOWN_SUBJECTS else "other"
+
+
+# ---------------------------------------------------------
+#  TIMING SPANS
+# ---------------------------------------------------------
+class Span:
+    """Result of a timed stage; `elapsed` is filled in when the block exits."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.elapsed = 0.0
+
+
+@contextmanager
+def track_stage(stage: str, subject: Optional[str] = None):
+    """
+    Times the wrapped block and records it in the stage histogram:
+
+        with track_stage("chroma_query") as span:
+            ...
+        span.elapsed  # seconds
+    """
+    span = Span(stage)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span.elapsed = time.perf_counter() - start
+        observe_stage(stage, span.elapsed, subject)
+
+
+def observe_stage(stage: str, seconds: float, subject: Optional[str] = None):
+    """
+    Records a stage timed elsewhere, e.g. inside a CPU pool worker: worker
+    processes don't share this registry, so they return their timings instead.
+    """
+    STAGE_LATENCY.labels(
+        stage=stage,
+        subject=_subject_label(subject),
+        route=current_route.get(),
+    ).observe(seconds)
+
+
+@contextmanager
+def bind_subject(subject: Optional[str]):
+    """Labels every span recorded inside the block with `subject`."""
+    token = current_subject.set(subject or "ALL")
+    try:
+        yield
+    finally:
+        current_subject.reset(token)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+# ---------------------------------------------------------
+#  INSTRUMENTED LLM CALL
+# ---------------------------------------------------------
+def timed_chat_completion(client, call: str, **kwargs) -> str:
+    """
+    Runs a streamed Groq chat completion and returns the full message text.
+    Records total latency, time-to-first-token and decode tokens/sec.
+    """
+    labels = {
+        "call": call,
+        "subject": _subject_label(None),
+        "route": current_route.get(),
+    }
+
+    with track_stage(f"llm_{call}"):
+        start = time.perf_counter()
+        first_token_at = None
+        parts = []
+        completion_tokens = None
+
+        stream = client.chat.completions.create(stream=True, **kwargs)
+        for chunk in stream:
+            if chunk.choices:
+                delta = chunk.choices[0].delta
+                text = delta.get("content") if isinstance(delta, dict) else delta.content
+                if text:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(text)
+
+            # Groq reports usage on the final chunk under `x_groq`
+            x_groq = getattr(chunk, "x_groq", None)
+            usage = getattr(x_groq, "usage", None) if x_groq else None
+            if usage is not None:
+                completion_tokens = usage.completion_tokens
+
+        end = time.perf_counter()
+
+    if completion_tokens is None:
+        completion_tokens = len(parts)  # ~1 token per streamed delta
+
+    if first_token_at is not None:
+        LLM_TTFT.labels(**labels).observe(first_token_at - start)
+        decode_time = end - first_token_at
+        if decode_time > 0:
+            LLM_TOKENS_PER_SECOND.labels(**labels).observe(completion_tokens / decode_time)
+    LLM_COMPLETION_TOKENS.labels(**labels).inc(completion_tokens)
+
+    return "".join(parts)
+
+
+# ---------------------------------------------------------
+#  EVENT LOOP LAG
+# ---------------------------------------------------------
+async def monitor_event_loop_lag(interval: float = 0.1):
+    """Runs forever on the serving loop; started from the app's startup hook."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+# ---------------------------------------------------------
+#  HTTP MIDDLEWARE + EXPOSITION
+# ---------------------------------------------------------
+def _route_template(request) -> str:
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match.name == "FULL":
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+async def metrics_middleware(request, call_next):
+    route = _route_template(request)
+    token = current_route.set(route)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUEST_LATENCY.labels(
+            route=route, method=request.method, status=str(status)
+        ).observe(time.perf_counter() - start)
+        current_route.reset(token)
+
+
+def render_metrics() -> tuple:
+    """
+    Returns (payload, content_type) in Prometheus text format.
+    With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR so every
+    worker's samples are aggregated.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,13 +1,19 @@
+import contextvars
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 
 from dotenv import load_dotenv
 from groq import Groq
 
 # Import your existing services
-from src.services.hyde_llm import generate_hyde_document
-from src.services.vector_store import retrieve_relevant_context
+from src.services.admission import gates
+from src.services.hyde_retrieval import retrieve_with_hyde
+from src.services.vector_store import retrieve_chunks
+from src.services.metrics import timed_chat_completion, track_stage
 
 load_dotenv()
 
@@ -22,6 +28,79 @@ client = Groq(api_key=GROQ_API_KEY)
 MODEL_NAME = "meta-llama/llama-4-scout-17b-16e-instruct" 
 # Fallback to "llama-3.1-8b-instant" if rate limits are an issue.
 
+# ==== MAP-REDUCE CONFIG ====
+# Units with at least this many subtopics are written as parallel per-batch
+# completions plus a small summary completion instead of one long one (0 = off)
+NOTES_MAP_REDUCE_MIN_SUBTOPICS = int(os.getenv("NOTES_MAP_REDUCE_MIN_SUBTOPICS", "8"))
+NOTES_MAP_BATCH_SIZE = int(os.getenv("NOTES_MAP_BATCH_SIZE", "3"))
+# Completions one unit has in flight at once (frame + map batches); the rest wait their turn
+NOTES_MAP_FANOUT = int(os.getenv("NOTES_MAP_FANOUT", "6"))
+# Shared by all requests: sized so every admitted generation (admission gate) gets its
+# full fan-out. Units of one request run one after another, so that is one unit each.
+NOTES_MAP_WORKERS = int(os.getenv("NOTES_MAP_WORKERS", str(gates["generation"].limit * NOTES_MAP_FANOUT)))
+MAP_TOKENS_PER_SUBTOPIC = 900
+MAP_TOP_K = 8
+REDUCE_MAX_TOKENS = 2000
+SECTIONS_MARKER = "[[TOPIC SECTIONS]]"
+
+_map_executor = ThreadPoolExecutor(max_workers=NOTES_MAP_WORKERS, thread_name_prefix="notes-map")
+
+NOTES_SYSTEM_PROMPT = """You are an expert academic author and university professor. 
+    You create high-quality, comprehensive study notes that look like they come from a premium textbook.
+
+    # **YOUR GOAL:** 
+    Convert the provided syllabus into **detailed, structured, and visually scannable notes**.
+
+    ---
+
+    # **FORMATTING RULES:**
+
+    ## **1. Hierarchy & Headers**
+    - **`#` (H1):** Unit titles - use for major divisions
+    - **`##` (H2):** Main topics - primary concepts within the unit
+    - **`###` (H3):** Sub-sections - detailed breakdowns
+    - **`####` (H4):** Supporting details when needed
+
+    ## **2. Visual Elements**
+    - **MUST include:** ASCII diagrams or Mermaid syntax for all processes
+    - **Example:** `Input → Processing → Output` or flowcharts
+    - **Use:** Boxes, arrows, and visual representations for complex workflows
+
+    ## **3. Mathematical Notation**
+    - **ALL formulas** must use LaTeX formatting
+    - **Example:** `$y = mx + c$`, `$E = mc^2$`
+    - **Display equations:** Use `$$...$$` for centered, standalone formulas
+
+    ## **4. Tables & Comparisons**
+    - **Use Markdown tables** to compare concepts side-by-side
+    - **Example topics:** Supervised vs Unsupervised, Stack vs Queue
+    - **Format:** Clear headers, aligned columns, concise entries
+
+    ## **5. Emphasis & Readability**
+    - **Bold (`**text**`):** Key terms, definitions, important concepts
+    - **Italic (`*text*`):** Emphasis, variables, first-use terminology
+    - **Blockquotes (`>`):** Formal definitions, important notes
+    - **Lists:** Use for features, steps, characteristics
+
+    ## **6. Professional Writing**
+    - **NO fluff** or robotic transitions like "Let's dive into..."
+    - **Write directly** and professionally
+    - **Focus:** Educational clarity over conversational style
+
+    ---
+
+    # **TONE:** 
+    Educational, insightful, and clear—similar to 'Head First' series or premium university textbooks.
+
+    ---
+
+    # **CONTENT DEPTH:**
+    - **Explanations:** Focus on "WHY" and "HOW," not just "WHAT"
+    - **Examples:** Real-world applications and specific scenarios
+    - **Visuals:** Minimum 1-2 diagrams per major topic
+    - **Comparisons:** Tables for easily confused concepts
+    """
+
 # -------------------------------------------------
 # 1. Syllabus Parsing Utilities
 # -------------------------------------------------
@@ -55,17 +134,21 @@ def split_syllabus_into_units(syllabus_text: str) -> List[Dict[str, str]]:
     return units
 
 
+SUBTOPIC_SPLIT_RE = re.compile(r"[.,;]|\sand\s|\sor\s|\n")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
 def extract_subtopics(unit_text: str) -> List[str]:
     """
-    Extracts individual subtopics for the LLM to focus on.
+    Extracts individual subtopics for the LLM to focus on, in syllabus order.
     """
     # Clean text
-    text = re.sub(r"\s+", " ", unit_text)
+    text = WHITESPACE_RE.sub(" ", unit_text)
     # Split by common delimiters used in syllabus
-    raw_parts = re.split(r"[.,;]|\sand\s|\sor\s|\n", text)
+    raw_parts = SUBTOPIC_SPLIT_RE.split(text)
     # Filter out empty or too short strings
     subtopics = [p.strip(" -–—:•") for p in raw_parts if len(p.strip()) > 3]
-    return list(set(subtopics)) # Deduplicate
+    return list(dict.fromkeys(subtopics))  # Deduplicate, keeping order
 
 
 def _truncate_context(text: str, max_chars: int = 6000) -> str:
@@ -80,102 +163,82 @@ def _truncate_context(text: str, max_chars: int = 6000) -> str:
 # -------------------------------------------------
 # 2. Core Note Generation Logic
 # -------------------------------------------------
-def generate_unit_notes(
+def retrieve_unit_context(
     unit_title: str,
     unit_text: str,
     subject: Optional[str],
     use_pyq: bool,
     top_k: int,
-) -> str:
+) -> Dict:
     """
-    Generates detailed, textbook-style notes for a single unit.
+    HyDE + RAG for a single unit (HyDE applied per HYDE_MODE).
+    Returns the HyDE doc, the retrieved chunks (with provenance), the
+    prompt-ready context strings and per-stage timings in seconds.
     """
-    subtopics = extract_subtopics(unit_text)
-    
-    # 1. Semantic Search Prep (HyDE)
+    # 1. Concepts — raw unit text and/or a HyDE doc, depending on the mode
     hyde_seed = f"Explain the concepts of {unit_title} in {subject or 'Data Science'}: {unit_text}"
-    hyde_doc = generate_hyde_document(hyde_seed)
-
-    # 2. Retrieve Context (RAG)
-    # Concepts
-    book_context = retrieve_relevant_context(
-        syllabus_text=hyde_doc,
+    result = retrieve_with_hyde(
+        query_text=f"{unit_title}: {unit_text}",
+        hyde_seed=hyde_seed,
         subject=subject,
         use_pyq=False,
         top_k=min(top_k, 25),
     )
-    # Previous Year Questions (if enabled)
-    pyq_context = ""
+    hyde_doc = result["hyde_doc"]
+    book_hits = result["hits"]
+    timings: Dict[str, float] = dict(result["timings"])
+
+    # 2. Previous Year Questions (if enabled), with whichever text won above
+    pyq_hits = None
     if use_pyq:
-        pyq_raw = retrieve_relevant_context(
-            syllabus_text=hyde_doc,
-            subject=subject,
-            use_pyq=True,
-            top_k=5,
-        )
+        with track_stage("retrieval", subject) as span:
+            pyq_hits = retrieve_chunks(
+                syllabus_text=hyde_doc or f"{unit_title}: {unit_text}",
+                subject=subject,
+                use_pyq=True,
+                top_k=5,
+            )
+        timings["retrieval"] += span.elapsed
+
+    book_context = "\n\n".join(book_hits["documents"])
+    pyq_context = ""
+    if pyq_hits is not None:
+        pyq_raw = "\n\n".join(pyq_hits["documents"])
         pyq_context = f"\nRELEVANT PAST EXAM QUESTIONS:\n{pyq_raw}\n"
 
     # Truncate to fit context window
-    book_context = _truncate_context(book_context, 5000)
-    
+    with track_stage("context_truncation", subject) as span:
+        book_context = _truncate_context(book_context, 5000)
+    timings["context_truncation"] = span.elapsed
+
+    return {
+        "hyde_doc": hyde_doc,
+        "hyde_mode": result["mode"],
+        "hyde_used": result["hyde_used"],
+        "book_hits": book_hits,
+        "pyq_hits": pyq_hits,
+        "book_context": book_context,
+        "pyq_context": pyq_context,
+        "timings": timings,
+    }
+
+
+def write_unit_notes(
+    unit_title: str,
+    unit_text: str,
+    subject: Optional[str],
+    book_context: str,
+    pyq_context: str = "",
+) -> str:
+    """
+    Writes textbook-style notes for a single unit from already retrieved context.
+    Raises if the LLM call fails.
+    """
+    subtopics = extract_subtopics(unit_text)
+
     # 3. Construct the Prompt
     subtopic_list_str = "\n".join([f"- {s}" for s in subtopics])
 
-    system_prompt = """You are an expert academic author and university professor. 
-    You create high-quality, comprehensive study notes that look like they come from a premium textbook.
-
-    # **YOUR GOAL:** 
-    Convert the provided syllabus into **detailed, structured, and visually scannable notes**.
-
-    ---
-
-    # **FORMATTING RULES:**
-
-    ## **1. Hierarchy & Headers**
-    - **`#` (H1):** Unit titles - use for major divisions
-    - **`##` (H2):** Main topics - primary concepts within the unit
-    - **`###` (H3):** Sub-sections - detailed breakdowns
-    - **`####` (H4):** Supporting details when needed
-
-    ## **2. Visual Elements**
-    - **MUST include:** ASCII diagrams or Mermaid syntax for all processes
-    - **Example:** `Input → Processing → Output` or flowcharts
-    - **Use:** Boxes, arrows, and visual representations for complex workflows
-
-    ## **3. Mathematical Notation**
-    - **ALL formulas** must use LaTeX formatting
-    - **Example:** `$y = mx + c$`, `$E = mc^2$`
-    - **Display equations:** Use `$$...$$` for centered, standalone formulas
-
-    ## **4. Tables & Comparisons**
-    - **Use Markdown tables** to compare concepts side-by-side
-    - **Example topics:** Supervised vs Unsupervised, Stack vs Queue
-    - **Format:** Clear headers, aligned columns, concise entries
-
-    ## **5. Emphasis & Readability**
-    - **Bold (`**text**`):** Key terms, definitions, important concepts
-    - **Italic (`*text*`):** Emphasis, variables, first-use terminology
-    - **Blockquotes (`>`):** Formal definitions, important notes
-    - **Lists:** Use for features, steps, characteristics
-
-    ## **6. Professional Writing**
-    - **NO fluff** or robotic transitions like "Let's dive into..."
-    - **Write directly** and professionally
-    - **Focus:** Educational clarity over conversational style
-
-    ---
-
-    # **TONE:** 
-    Educational, insightful, and clear—similar to 'Head First' series or premium university textbooks.
-
-    ---
-
-    # **CONTENT DEPTH:**
-    - **Explanations:** Focus on "WHY" and "HOW," not just "WHAT"
-    - **Examples:** Real-world applications and specific scenarios
-    - **Visuals:** Minimum 1-2 diagrams per major topic
-    - **Comparisons:** Tables for easily confused concepts
-    """
 
     user_prompt = f"""
     # **CONTEXT:**
@@ -304,81 +367,281 @@ def generate_unit_notes(
     """
 
     # 4. Call LLM
-    try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.3, # Low temp for factual accuracy
-            max_tokens=6000, # Allow long output
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"# Error Generating Notes for {unit_title}\n\nTechnical error: {str(e)}"
+    return timed_chat_completion(
+        client,
+        call="unit_notes",
+        model=MODEL_NAME,
+        messages=[
+            {"role": "system", "content": NOTES_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.3, # Low temp for factual accuracy
+        max_tokens=6000, # Allow long output
+    )
 
 
 # -------------------------------------------------
-# 3. Final Orchestrator
+# 3. Map-Reduce Generation (long units)
+#    One 6000-token completion is bound by sequential decode. Instead the
+#    subtopics are split into batches, each gets its own retrieval and a
+#    smaller completion (the map), and a short completion writes the
+#    overview, comparisons, summary and questions from the unit outline
+#    (the reduce). Up to NOTES_MAP_FANOUT of them run concurrently per
+#    unit; assembly is local.
 # -------------------------------------------------
-def generate_final_notes(
-    syllabus_text: str,
-    subject: Optional[str] = None,
-    use_pyq: bool = False,
-    top_k: int = 40,
+def use_map_reduce(unit_text: str) -> bool:
+    return 0 < NOTES_MAP_REDUCE_MIN_SUBTOPICS <= len(extract_subtopics(unit_text))
+
+
+def batch_subtopics(subtopics: List[str], batch_size: int = NOTES_MAP_BATCH_SIZE) -> List[List[str]]:
+    return [subtopics[i:i + batch_size] for i in range(0, len(subtopics), batch_size)]
+
+
+def _submit(fn, *args):
+    # keep route / subject labels for the metrics recorded in the worker thread
+    ctx = contextvars.copy_context()
+    return _map_executor.submit(ctx.run, fn, *args)
+
+
+def _windowed_submitter(limit: int = NOTES_MAP_FANOUT):
+    """_submit, but at most `limit` tasks of the caller in flight (blocks until one finishes)."""
+    window = threading.BoundedSemaphore(max(1, limit))
+
+    def submit(fn, *args):
+        window.acquire()
+        try:
+            future = _submit(fn, *args)
+        except Exception:
+            window.release()
+            raise
+        future.add_done_callback(lambda _: window.release())
+        return future
+
+    return submit
+
+
+def write_subtopic_sections(
+    unit_title: str,
+    subtopics: List[str],
+    subject: Optional[str],
+    book_context: str,
 ) -> str:
+    """Map step: the per-topic sections for one batch of subtopics."""
+    subtopic_list_str = "\n".join([f"- {s}" for s in subtopics])
+
+    user_prompt = f"""
+    # **CONTEXT:**
+    - **Subject:** {subject or "General"}
+    - **Unit:** {unit_title}
+    - **Topics to cover (this part only):**
+    {subtopic_list_str}
+
+    ---
+
+    # **RETRIEVED KNOWLEDGE BASE (Source Material):**
+    {book_context}
+
+    ---
+
+    # **TASK:**
+    Write the study-notes sections for **only** the topics listed above, in that order.
+    Other writers cover the rest of the unit: do NOT write a unit title, unit overview,
+    comparison tables, chapter summary or practice questions.
+
+    # **STRUCTURE PER TOPIC:**
+
+    ## **[Topic Name]**
+
+    ### **1. Definition**
+    > [Clear, formal definition in a blockquote]
+
+    ### **2. Conceptual Explanation**
+    [2-3 paragraphs: **"Why"** and **"How"**, not just **"What"**]
+
+    ### **3. Key Characteristics/Features**
+    - **Feature 1:** [Description]
+
+    ### **4. Process/Workflow** (IF APPLICABLE)
+    [Steps plus a visual representation]
+
+    ### **5. Real-World Case Study**
+    **Scenario:** ... **Application:** ... **Outcome:** ...
+
+    ### **6. Applications**
+    - **Industry 1:** [Specific use case]
+
+    ---
     """
-    Main entry point to generate the full subject notes.
+
+    return timed_chat_completion(
+        client,
+        call="unit_notes_map",
+        model=MODEL_NAME,
+        messages=[
+            {"role": "system", "content": NOTES_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.3,
+        max_tokens=min(6000, MAP_TOKENS_PER_SUBTOPIC * len(subtopics)),
+    )
+
+
+def write_unit_frame(
+    unit_title: str,
+    unit_text: str,
+    subject: Optional[str],
+    subtopics: List[str],
+    book_context: str,
+    pyq_context: str = "",
+) -> str:
+    """Reduce step: overview, comparisons, summary and practice questions around the sections."""
+    subtopic_list_str = "\n".join([f"- {s}" for s in subtopics])
+
+    user_prompt = f"""
+    # **CONTEXT:**
+    - **Subject:** {subject or "General"}
+    - **Unit:** {unit_title}
+    - **Syllabus Topics:**
+    {unit_text}
+
+    # **TOPICS COVERED IN DETAIL ELSEWHERE (do not explain them again):**
+    {subtopic_list_str}
+
+    ---
+
+    # **RETRIEVED KNOWLEDGE BASE (Source Material):**
+    {book_context}
+
+    {pyq_context}
+
+    ---
+
+    # **TASK:**
+    Write only the frame of the notes for **{unit_title}**. The per-topic sections are written
+    separately and inserted where the line `{SECTIONS_MARKER}` appears. Output exactly:
+
+    # **{unit_title}** - [Topic Name]
+
+    > **Unit Overview:** [3-4 sentence summary of what this unit covers and why it matters]
+
+    {SECTIONS_MARKER}
+
+    ## **Key Differences & Comparisons**
+    [1-2 comparison tables for easily confused topics of this unit]
+
+    ## **Chapter Summary & Revision**
+    ### **Key Takeaways:**
+    ### **Important Formulae:**
+    ### **Must-Remember Points:**
+
+    ## **Practice Questions** (Based on Exam Patterns)
+    ### **Conceptual Questions:**
+    ### **Application Questions:**
+    ### **Problem-Solving Questions:**
+
+    ---
+
+    **END OF NOTES**
     """
-    # 1. Parse Syllabus
-    units = split_syllabus_into_units(syllabus_text)
-    if not units:
-        # Fallback if regex fails completely
-        units = [{"unit_title": "Complete Syllabus", "unit_text": syllabus_text}]
-
-    # 2. Generate content for each unit
-    all_unit_content: List[str] = []
-    
-    # Progress indication (for console logs)
-    print(f"Found {len(units)} units. Generating notes...")
-
-    for unit in units:
-        print(f"Processing {unit['unit_title']}...")
-        unit_content = generate_unit_notes(
-            unit_title=unit["unit_title"],
-            unit_text=unit["unit_text"],
+
+    return timed_chat_completion(
+        client,
+        call="unit_notes_reduce",
+        model=MODEL_NAME,
+        messages=[
+            {"role": "system", "content": NOTES_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.3,
+        max_tokens=REDUCE_MAX_TOKENS,
+    )
+
+
+def assemble_unit_notes(unit_title: str, frame: str, sections: List[str]) -> str:
+    body = "\n\n---\n\n".join(s.strip() for s in sections)
+    if SECTIONS_MARKER in frame:
+        head, tail = frame.split(SECTIONS_MARKER, 1)
+    else:
+        # Marker dropped by the model: keep the frame, sections go after the title
+        head, tail = f"# **{unit_title}**\n", frame
+    return f"{head.rstrip()}\n\n---\n\n{body}\n\n---\n\n{tail.lstrip()}"
+
+
+def write_unit_notes_map_reduce(
+    unit_title: str,
+    unit_text: str,
+    subject: Optional[str],
+    book_context: str,
+    pyq_context: str = "",
+    top_k: int = MAP_TOP_K,
+) -> Dict:
+    """
+    Map-reduce version of write_unit_notes. Returns the notes markdown, the
+    per-batch retrieval hits (for provenance) and timings in seconds.
+    Raises if any of the LLM calls fails.
+    """
+    start = time.perf_counter()
+    subtopics = extract_subtopics(unit_text)
+    batches = batch_subtopics(subtopics)
+
+    def map_batch(batch: List[str]) -> Dict:
+        retrieved = retrieve_with_hyde(
+            query_text=f"{unit_title}: {', '.join(batch)}",
+            hyde_seed=f"Explain {', '.join(batch)} ({unit_title}) in {subject or 'Data Science'}",
             subject=subject,
-            use_pyq=use_pyq,
-            top_k=top_k,
+            use_pyq=False,
+            top_k=min(top_k, MAP_TOP_K),
         )
-        all_unit_content.append(unit_content)
+        context = _truncate_context("\n\n".join(retrieved["hits"]["documents"]), 3000)
+        return {
+            "subtopics": batch,
+            "hits": retrieved["hits"],
+            "markdown": write_subtopic_sections(unit_title, batch, subject, context),
+        }
 
-    # 3. Assemble Final Document
-    subject_header = subject.upper() if subject else "SUBJECT NOTES"
-    
-    final_markdown = f"""
-# {subject_header}
-**Comprehensive Study Notes & Exam Preparation**
+    submit = _windowed_submitter()
+    frame_future = submit(write_unit_frame, unit_title, unit_text, subject, subtopics, book_context, pyq_context)
+    map_futures = [submit(map_batch, batch) for batch in batches]
+    mapped = [f.result() for f in map_futures]
+    frame = frame_future.result()
 
----
+    return {
+        "notes_markdown": assemble_unit_notes(unit_title, frame, [m["markdown"] for m in mapped]),
+        "batches": [{"subtopics": m["subtopics"], "hits": m["hits"]} for m in mapped],
+        "timings": {"map_reduce": time.perf_counter() - start},
+    }
 
-## Table of Contents
-"""
-    # Dynamic TOC
-    for unit in units:
-        final_markdown += f"- [{unit['unit_title']}](#{unit['unit_title'].lower().replace(' ', '-').replace(':', '')})\n"
-    
-    final_markdown += "\n---\n"
-    
-    # Append all unit contents
-    final_markdown += "\n\n".join(all_unit_content)
-    
-    final_markdown += f"""
-\n
----
-**End of Notes**
-*Generated by SyllabusGPT | {subject_header}*
-"""
-
-    return final_markdown
\ No newline at end of file
+
+def unit_error_markdown(unit_title: str, error: Exception) -> str:
+    return f"# Error Generating Notes for {unit_title}\n\nTechnical error: {str(error)}"
+
+
+def generate_unit_notes(
+    unit_title: str,
+    unit_text: str,
+    subject: Optional[str],
+    use_pyq: bool,
+    top_k: int,
+) -> str:
+    """
+    Generates detailed, textbook-style notes for a single unit.
+    """
+    retrieved = retrieve_unit_context(unit_title, unit_text, subject, use_pyq, top_k)
+    try:
+        if use_map_reduce(unit_text):
+            return write_unit_notes_map_reduce(
+                unit_title,
+                unit_text,
+                subject,
+                retrieved["book_context"],
+                retrieved["pyq_context"],
+            )["notes_markdown"]
+        return write_unit_notes(
+            unit_title,
+            unit_text,
+            subject,
+            retrieved["book_context"],
+            retrieved["pyq_context"],
+        )
+    except Exception as e:
+        return unit_error_markdown(unit_title, e)
@@ -0,0 +1,304 @@
+import os
+import time
+from dataclasses import asdict, dataclass, field, fields, replace
+from typing import Dict, List, Optional
+
+from src.services.checkpoints import checkpoint_store
+from src.services.metrics import bind_subject, track_stage
+from src.services.notes_llm import (
+    retrieve_unit_context,
+    split_syllabus_into_units,
+    unit_error_markdown,
+    use_map_reduce,
+    write_unit_notes,
+    write_unit_notes_map_reduce,
+)
+from src.services.singleflight import SingleFlight, normalize_text, request_key
+from src.services.vector_store import count_tokens
+
+# ==== CONFIG ====
+# Identical concurrent requests / units share one HyDE + retrieval + LLM run
+NOTES_SINGLEFLIGHT = os.getenv("NOTES_SINGLEFLIGHT", "1") != "0"
+
+_request_flights = SingleFlight("notes_request")
+_unit_flights = SingleFlight("notes_unit")
+
+
+# -------------------------------------------------
+# Per-unit artifacts (provenance returned to clients)
+# -------------------------------------------------
+@dataclass
+class UnitArtifacts:
+    unit_title: str
+    unit_text: str
+    hyde_doc: str = ""
+    hyde_mode: str = ""
+    hyde_used: bool = False
+    chunks: List[Dict] = field(default_factory=list)  # id, source, type, subject, distance
+    context_chars: int = 0
+    context_tokens: int = 0
+    map_batches: List[List[str]] = field(default_factory=list)  # subtopic batches when map-reduced
+    notes_markdown: str = ""
+    error: Optional[str] = None
+    resumed: bool = False  # True when taken from a checkpoint instead of regenerated
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def provenance(self) -> Dict:
+        """Everything except the generated notes text."""
+        data = asdict(self)
+        data.pop("notes_markdown")
+        return data
+
+    @classmethod
+    def from_checkpoint(cls, data: Dict) -> "UnitArtifacts":
+        known = {f.name for f in fields(cls)}
+        return cls(**{**{k: v for k, v in data.items() if k in known}, "resumed": True})
+
+
+@dataclass
+class NotesResult:
+    notes_markdown: str
+    units: List[UnitArtifacts]
+    timings: Dict[str, float] = field(default_factory=dict)
+    coalesced: bool = False  # True when this request waited on an identical one in flight
+    request_id: str = ""     # fingerprint for /notes/resume
+
+    @property
+    def context_length(self) -> int:
+        return sum(u.context_chars for u in self.units)
+
+
+def _hits_to_chunks(hits: Optional[Dict]) -> List[Dict]:
+    if not hits:
+        return []
+    chunks = []
+    for chunk_id, meta, dist in zip(hits["ids"], hits["metadatas"], hits["distances"]):
+        meta = meta or {}
+        chunks.append({
+            "id": chunk_id,
+            "source": meta.get("source"),
+            "type": meta.get("type"),
+            "subject": meta.get("subject"),
+            "distance": dist,
+        })
+    return chunks
+
+
+def assemble_notes_document(units: List[Dict[str, str]], unit_contents: List[str], subject: Optional[str]) -> str:
+    """
+    Joins per-unit markdown into the final document (header, TOC, footer).
+    """
+    subject_header = subject.upper() if subject else "SUBJECT NOTES"
+
+    final_markdown = f"""
+# {subject_header}
+**Comprehensive Study Notes & Exam Preparation**
+
+---
+
+## Table of Contents
+"""
+    # Dynamic TOC
+    for unit in units:
+        final_markdown += f"- [{unit['unit_title']}](#{unit['unit_title'].lower().replace(' ', '-').replace(':', '')})\n"
+
+    final_markdown += "\n---\n"
+
+    # Append all unit contents
+    final_markdown += "\n\n".join(unit_contents)
+
+    final_markdown += f"""
+\n
+---
+**End of Notes**
+*Generated by SyllabusGPT | {subject_header}*
+"""
+
+    return final_markdown
+
+
+# -------------------------------------------------
+# Single-pass notes pipeline
+# -------------------------------------------------
+class NotesPipeline:
+    """
+    Runs split → HyDE → retrieval → LLM exactly once per unit and keeps
+    every intermediate artifact, so callers get provenance for free
+    instead of re-querying the vector store.
+    """
+
+    def __init__(
+        self,
+        subject: Optional[str] = None,
+        use_pyq: bool = False,
+        top_k: int = 40,
+    ):
+        self.subject = subject
+        self.use_pyq = use_pyq
+        self.top_k = top_k
+
+    def split_units(self, syllabus_text: str) -> List[Dict[str, str]]:
+        units = split_syllabus_into_units(syllabus_text)
+        if not units:
+            # Fallback if regex fails completely
+            units = [{"unit_title": "Complete Syllabus", "unit_text": syllabus_text}]
+        return units
+
+    def _key(self, *parts) -> str:
+        # subject as given: retrieval filters on it case-sensitively
+        return request_key(self.subject, self.use_pyq, self.top_k, *parts)
+
+    def run_unit(self, unit: Dict[str, str]) -> UnitArtifacts:
+        """
+        Unit-level single flight: two different syllabi that share a unit
+        still only pay for it once while both are in flight.
+        """
+        if not NOTES_SINGLEFLIGHT:
+            return self._run_unit(unit)
+        key = self._key(normalize_text(unit["unit_title"]), normalize_text(unit["unit_text"]))
+        artifacts, _ = _unit_flights.do(key, self._run_unit, unit)
+        return artifacts
+
+    def _run_unit(self, unit: Dict[str, str]) -> UnitArtifacts:
+        artifacts = UnitArtifacts(unit_title=unit["unit_title"], unit_text=unit["unit_text"])
+        start = time.perf_counter()
+
+        with track_stage("unit_total"):
+            retrieved = retrieve_unit_context(
+                unit_title=unit["unit_title"],
+                unit_text=unit["unit_text"],
+                subject=self.subject,
+                use_pyq=self.use_pyq,
+                top_k=self.top_k,
+            )
+            context = retrieved["book_context"] + retrieved["pyq_context"]
+
+            artifacts.hyde_doc = retrieved["hyde_doc"]
+            artifacts.hyde_mode = retrieved["hyde_mode"]
+            artifacts.hyde_used = retrieved["hyde_used"]
+            artifacts.chunks = _hits_to_chunks(retrieved["book_hits"]) + _hits_to_chunks(retrieved["pyq_hits"])
+            artifacts.context_chars = len(context)
+            artifacts.context_tokens = count_tokens(context)
+            artifacts.timings.update(retrieved["timings"])
+
+            llm_start = time.perf_counter()
+            try:
+                if use_map_reduce(unit["unit_text"]):
+                    mapped = write_unit_notes_map_reduce(
+                        unit_title=unit["unit_title"],
+                        unit_text=unit["unit_text"],
+                        subject=self.subject,
+                        book_context=retrieved["book_context"],
+                        pyq_context=retrieved["pyq_context"],
+                    )
+                    artifacts.notes_markdown = mapped["notes_markdown"]
+                    artifacts.map_batches = [b["subtopics"] for b in mapped["batches"]]
+                    seen = {c["id"] for c in artifacts.chunks}
+                    for batch in mapped["batches"]:
+                        for chunk in _hits_to_chunks(batch["hits"]):
+                            if chunk["id"] not in seen:
+                                seen.add(chunk["id"])
+                                artifacts.chunks.append(chunk)
+                else:
+                    artifacts.notes_markdown = write_unit_notes(
+                        unit_title=unit["unit_title"],
+                        unit_text=unit["unit_text"],
+                        subject=self.subject,
+                        book_context=retrieved["book_context"],
+                        pyq_context=retrieved["pyq_context"],
+                    )
+            except Exception as e:
+                artifacts.error = str(e)
+                artifacts.notes_markdown = unit_error_markdown(unit["unit_title"], e)
+            artifacts.timings["llm"] = time.perf_counter() - llm_start
+
+        artifacts.timings["total"] = time.perf_counter() - start
+        return artifacts
+
+    def fingerprint(self, syllabus_text: str) -> str:
+        """Request id: the same request (normalized) always maps to the same checkpoints."""
+        return self._key(normalize_text(syllabus_text))
+
+    def run(self, syllabus_text: str, resume: bool = False) -> NotesResult:
+        """
+        Request-level single flight keyed by the normalized request. Results
+        handed to coalesced callers are shared objects: treat them as read-only.
+
+        Units that complete are checkpointed under the request fingerprint;
+        with `resume=True` checkpointed units are reused and only missing or
+        failed ones are generated again.
+        """
+        if not NOTES_SINGLEFLIGHT:
+            return self._run(syllabus_text, resume)
+        key = self.fingerprint(syllabus_text) + (":resume" if resume else "")
+        result, shared = _request_flights.do(key, self._run, syllabus_text, resume)
+        return replace(result, coalesced=True) if shared else result
+
+    def _run(self, syllabus_text: str, resume: bool = False) -> NotesResult:
+        start = time.perf_counter()
+        request_id = self.fingerprint(syllabus_text)
+
+        with bind_subject(self.subject):
+            # 1. Parse Syllabus
+            with track_stage("syllabus_split") as span:
+                units = self.split_units(syllabus_text)
+            timings = {"syllabus_split": span.elapsed}
+
+            checkpoint_store.start(request_id, {
+                "syllabus_text": syllabus_text,
+                "subject": self.subject,
+                "use_pyq": self.use_pyq,
+                "top_k": self.top_k,
+            }, units)
+
+            # Progress indication (for console logs)
+            print(f"Found {len(units)} units. Generating notes...")
+
+            # 2. Generate content for each unit
+            artifacts: List[UnitArtifacts] = []
+            for i, unit in enumerate(units):
+                stored = checkpoint_store.load_unit(request_id, i, unit) if resume else None
+                if stored is not None:
+                    print(f"Resuming {unit['unit_title']} from checkpoint")
+                    artifacts.append(UnitArtifacts.from_checkpoint(stored))
+                    continue
+
+                print(f"Processing {unit['unit_title']}...")
+                unit_artifacts = self.run_unit(unit)
+                if unit_artifacts.error is None:
+                    checkpoint_store.save_unit(request_id, i, unit, asdict(unit_artifacts))
+                artifacts.append(unit_artifacts)
+
+        checkpoint_store.finish(request_id, [i for i, a in enumerate(artifacts) if a.error is not None])
+
+        # 3. Assemble Final Document
+        notes_md = assemble_notes_document(units, [a.notes_markdown for a in artifacts], self.subject)
+        timings["total"] = time.perf_counter() - start
+
+        return NotesResult(notes_markdown=notes_md, units=artifacts, timings=timings, request_id=request_id)
+
+
+def resume_notes(request_id: str) -> Optional[NotesResult]:
+    """
+    Re-runs a checkpointed request: completed units come from disk, missing
+    or failed ones are generated, the document is re-assembled.
+    Returns None when nothing is stored under `request_id`.
+    """
+    manifest = checkpoint_store.manifest(request_id)
+    if manifest is None:
+        return None
+    request = manifest["request"]
+    pipeline = NotesPipeline(subject=request["subject"], use_pyq=request["use_pyq"], top_k=request["top_k"])
+    return pipeline.run(request["syllabus_text"], resume=True)
+
+
+def generate_final_notes(
+    syllabus_text: str,
+    subject: Optional[str] = None,
+    use_pyq: bool = False,
+    top_k: int = 40,
+) -> str:
+    """
+    Main entry point to generate the full subject notes (markdown only).
+    """
+    return NotesPipeline(subject=subject, use_pyq=use_pyq, top_k=top_k).run(syllabus_text).notes_markdown
@@ -1,9 +1,42 @@
 from pdfminer.high_level import extract_text
+import fitz  # PyMuPDF
 import io
 
+from src.services.ocr import extract_text_from_image
+
+# Pages with less text than this are treated as scanned and OCR'd
+MIN_TEXT_LAYER_CHARS = 25
+OCR_DPI = 200
 
 
 def extract_text_from_pdf(content):
     with io.BytesIO(content) as pdf_file:
         text = extract_text(pdf_file)
         return text
+
+
+def count_pdf_pages(path: str) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def extract_page_range(path: str, start: int, end: int) -> list:
+    """
+    Extracts pages [start, end) of the PDF at `path`.
+    Uses the text layer when there is one and OCRs only the pages without it.
+    Returns [{"page": n, "text": str, "ocr": bool}, ...] (1-based page numbers).
+    """
+    pages = []
+    with fitz.open(path) as doc:
+        for page_number in range(start, min(end, doc.page_count)):
+            page = doc.load_page(page_number)
+            text = page.get_text()
+            ocr = False
+
+            if len(text.strip()) < MIN_TEXT_LAYER_CHARS:
+                pix = page.get_pixmap(dpi=OCR_DPI)
+                text = extract_text_from_image(pix.tobytes("png"))
+                ocr = True
+
+            pages.append({"page": page_number + 1, "text": text, "ocr": ocr})
+    return pages
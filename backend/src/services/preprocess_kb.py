@@ -1,28 +1,72 @@
+import argparse
 import os
 import uuid
-import re
-from typing import List, Dict
+import threading
+from typing import Callable, List, Dict, Optional
 
 import numpy as np
-import easyocr
 import fitz  # PyMuPDF
 
 from pdfminer.high_level import extract_text
-from sentence_transformers import SentenceTransformer
-from chromadb import PersistentClient
+
+from src.services.chunk_store import (
+    CHUNK_STORE,
+    byte_offsets,
+    chunk_store,
+    offset_metadata,
+    processed_file_name,
+    store_chunks,
+)
+from src.services.chunking import chunk_document
+from src.services.dedup import MinHashLSH, dedupe_chunks
+from src.services import text_cleaning
+from src.services.index_generations import (
+    build_lock,
+    current_collection_name,
+    generation_collection_name,
+    next_generation,
+    publish_generation,
+)
 
 # ==== PATHS ====
 RAW_DIR = "./knowledgebase/raw_files"
 PROCESSED_DIR = "./knowledgebase/processed"
 VECTOR_DB_DIR = "./vector-db"
 
-# ==== MODELS ====
-embedder = SentenceTransformer("all-MiniLM-L6-v2")  # Free embeddings
-easy_reader = easyocr.Reader(['en'], gpu=False)     # OCR for scanned PDFs
+# ==== MODELS (loaded on first use) ====
+# Importing this module stays cheap: the API server imports it for runtime
+# ingestion, and CPU-pool workers import it to run the extraction functions.
+_embedder = None
+_easy_reader = None
+_client = None
+_models_lock = threading.Lock()
+
+
+def get_embedder():
+    global _embedder
+    with _models_lock:
+        if _embedder is None:
+            from sentence_transformers import SentenceTransformer
+            _embedder = SentenceTransformer("all-MiniLM-L6-v2")  # Free embeddings
+        return _embedder
+
+
+def get_ocr_reader():
+    global _easy_reader
+    with _models_lock:
+        if _easy_reader is None:
+            import easyocr
+            _easy_reader = easyocr.Reader(['en'], gpu=False)  # OCR for scanned PDFs
+        return _easy_reader
 
-# ==== CHROMA CLIENT ====
-client = PersistentClient(path=VECTOR_DB_DIR)
-collection = client.get_or_create_collection("study_kb")
+
+def get_client():
+    global _client
+    with _models_lock:
+        if _client is None:
+            from chromadb import PersistentClient
+            _client = PersistentClient(path=VECTOR_DB_DIR)
+        return _client
 
 
 # ---------- SUBJECT DETECTION ----------
@@ -82,7 +126,7 @@ def extract_text_ocr(pdf_path: str) -> str:
             pix.height, pix.width, pix.n
         )
 
-        result = easy_reader.readtext(img, detail=0)
+        result = get_ocr_reader().readtext(img, detail=0)
         output.extend(result)
 
     return "\n".join(output)
@@ -90,156 +134,237 @@ def extract_text_ocr(pdf_path: str) -> str:
 
 # ---------- CLEAN BOOK TEXT ----------
 def clean_book_text(text: str) -> str:
-    noise_keywords = [
-        "copyright", "all rights reserved", "isbn", "publisher",
-        "acknowledgements", "acknowledgments", "preface",
-        "about the author", "table of contents", "contents",
-        "printed in", "edition", "foreword"
-    ]
-
-    lines = text.splitlines()
-    cleaned_lines = []
-
-    for ln in lines:
-        low = ln.lower().strip()
-        if any(kw in low for kw in noise_keywords):
-            continue
-        if len(low) <= 3:
-            continue
-        cleaned_lines.append(ln)
-
-    cleaned_text = "\n".join(cleaned_lines)
-
-    FRONT_SKIP_CHARS = 3000
-    if len(cleaned_text) > FRONT_SKIP_CHARS:
-        cleaned_text = cleaned_text[FRONT_SKIP_CHARS:]
-
-    return cleaned_text
-
-
-# ---------- SPLIT PYQs INTO QUESTIONS ----------
-def split_questions(text: str) -> List[str]:
-    pattern = r"(Q\.?\s*\d+[^:.\n]*[:.]|Question\s*\d+[:.]|Q\s*\d+)"
-    parts = re.split(pattern, text, flags=re.IGNORECASE)
-
-    questions = [p.strip() for p in parts if len(p.strip()) > 20]
-
-    return questions if questions else [text]
-
-
-# ---------- CHUNKING ----------
-def chunk_text(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
-    chunks = []
-    start = 0
-    n = len(text)
-
-    while start < n:
-        end = min(start + chunk_size, n)
-        chunks.append(text[start:end])
-        start += (chunk_size - overlap)
-
-    return chunks
+    # page-aware: repeated headers/footers, front matter, short noise lines
+    return text_cleaning.clean_book_text(text)
 
 
 # ---------- BATCH INSERT ----------
-def add_in_batches(documents: List[str], embeddings: List[List[float]], metadata_base: Dict, batch_size: int = 1000):
+def add_in_batches(collection, documents: List[str], embeddings: List[List[float]], metadatas: List[Dict], batch_size: int = 1000):
     for start in range(0, len(documents), batch_size):
         end = start + batch_size
         batch_docs = documents[start:end]
         batch_embeds = embeddings[start:end]
         batch_ids = [str(uuid.uuid4()) for _ in batch_docs]
-        batch_meta = [metadata_base] * len(batch_docs)
+        batch_meta = metadatas[start:end]
 
         print(f"  → Adding batch {start} to {end} ({len(batch_docs)} docs)...")
 
-        collection.add(
-            ids=batch_ids,
-            documents=batch_docs,
-            embeddings=batch_embeds,
-            metadatas=batch_meta
-        )
-
-
-# ---------- MAIN PIPELINE ----------
-def process_all_files():
-    print("\n[START] Processing ALL knowledgebase files (Books + PYQs)...\n")
-
-    os.makedirs(PROCESSED_DIR, exist_ok=True)
-
-    for file in os.listdir(RAW_DIR):
-
-        if not file.lower().endswith(".pdf"):
-            print(f"[SKIP] Not a PDF: {file}")
-            continue
-
-        file_path = os.path.join(RAW_DIR, file)
-        print(f"\n[FILE] {file}")
-
-        subject = detect_subject(file)
-        print(f"    Subject detected → {subject}")
-
-        raw_text = extract_text_from_pdf(file_path)
-        pyq_flag = is_pyq(file, raw_text)
-
-        if pyq_flag:
-            print("    → Treating as PYQ (OCR via PyMuPDF + EasyOCR)")
-            full_text = extract_text_ocr(file_path)
-            content_type = "PYQ"
-        else:
-            print("    → Treating as BOOK (PDFMiner text)")
-            if len(raw_text.strip()) < 50:
-                print("    [WARNING] Too little text for book — skipping.")
-                continue
-            full_text = clean_book_text(raw_text)
-            content_type = "BOOK"
-
-        if not full_text or len(full_text.strip()) < 50:
-            print("    [WARNING] No usable text — skipping.")
+        # offset-stored chunks (CHUNK_STORE=offsets) go in without their text
+        store_chunks(collection.add, batch_ids, batch_embeds, batch_docs, batch_meta)
+
+
+# ---------- ONE FILE → CHUNKS IN A COLLECTION ----------
+def _run_inline(fn: Callable, *args):
+    return fn(*args)
+
+
+def process_file(
+    file_path: str,
+    collection,
+    dedup_indexes: Dict[str, MinHashLSH],
+    tokenizer=None,
+    embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    run: Callable = _run_inline,
+    on_stage: Callable[[str], None] = lambda stage: None,
+) -> Dict:
+    """
+    Extract (PDFMiner, or OCR for PYQs) → clean → chunk → dedupe → embed → add.
+
+    `run(fn, *args)` executes the extraction functions (inline by default; the
+    ingestion worker sends them to the CPU pool), `embed` defaults to the local
+    embedder. Returns per-file stats; "status" is "indexed" or "skipped".
+    """
+    file = os.path.basename(file_path)
+    subject = detect_subject(file)
+    print(f"    Subject detected → {subject}")
+    stats = {"file": file, "subject": subject, "type": None, "chunks": 0, "kept": 0,
+             "within_source": 0, "cross_source": 0, "status": "skipped", "reason": None}
+
+    on_stage("extracting")
+    raw_text = run(extract_text_from_pdf, file_path)
+    pyq_flag = is_pyq(file, raw_text)
+
+    if pyq_flag:
+        print("    → Treating as PYQ (OCR via PyMuPDF + EasyOCR)")
+        on_stage("ocr")
+        full_text = run(extract_text_ocr, file_path)
+        content_type = "PYQ"
+    else:
+        print("    → Treating as BOOK (PDFMiner text)")
+        if len(raw_text.strip()) < 50:
+            print("    [WARNING] Too little text for book — skipping.")
+            stats["reason"] = "too little text"
+            return stats
+        full_text = clean_book_text(raw_text)
+        content_type = "BOOK"
+    stats["type"] = content_type
+
+    if not full_text or len(full_text.strip()) < 50:
+        print("    [WARNING] No usable text — skipping.")
+        stats["reason"] = "no usable text"
+        return stats
+
+    processed_name = processed_file_name(file, content_type, full_text)
+    processed_path = os.path.join(PROCESSED_DIR, processed_name)
+
+    with open(processed_path, "w", encoding="utf-8") as f:
+        f.write(full_text)
+
+    # Structure-aware chunks (question boundaries for PYQs, paragraphs /
+    # headings for books), sized with the embedder's own tokenizer
+    on_stage("chunking")
+    chunks = chunk_document(full_text, tokenizer or get_embedder().tokenizer)
+    print(f"    Total chunks → {len(chunks)}")
+
+    # Drop near-duplicates (repeated boilerplate, re-printed sections, ...)
+    keep, dup_stats = dedupe_chunks([c.text for c in chunks], dedup_indexes[content_type], file)
+    stats.update(chunks=len(chunks), kept=len(keep), **dup_stats)
+    if len(keep) < len(chunks):
+        print(f"    Dedup → dropped {len(chunks) - len(keep)} "
+              f"({dup_stats['within_source']} within source, {dup_stats['cross_source']} across sources)")
+    chunks = [chunks[i] for i in keep]
+    documents = [c.text for c in chunks]
+
+    if len(documents) == 0:
+        print("    No chunks — skipping.")
+        stats["reason"] = "no chunks"
+        return stats
+
+    print("    Embedding chunks...")
+    on_stage("embedding")
+    if embed is None:
+        embeddings = get_embedder().encode(documents, show_progress_bar=True).tolist()
+    else:
+        embeddings = embed(documents)
+
+    metadata_base = {
+        "source": file,
+        "type": content_type,
+        "subject": subject,
+    }
+    # char offsets into the processed .txt, for provenance
+    metadatas = [{**metadata_base, "start": c.start, "end": c.end} for c in chunks]
+    if CHUNK_STORE == "offsets":
+        spans = byte_offsets(full_text, [(c.start, c.end) for c in chunks])
+        metadatas = [{**meta, **offset_metadata(processed_name, span)} for meta, span in zip(metadatas, spans)]
+
+    print("    Storing in ChromaDB...")
+    on_stage("storing")
+    add_in_batches(collection, documents, embeddings, metadatas)
+    stats["status"] = "indexed"
+    return stats
+
+
+def create_generation_collection(client, generation: int):
+    collection_name = generation_collection_name(generation)
+    try:
+        client.delete_collection(collection_name)  # leftover of an interrupted run
+    except Exception:
+        pass
+    return client.create_collection(collection_name)
+
+
+# ---------- CARRY OVER THE LIVE GENERATION ----------
+def copy_generation(live, target, replaced: set, dedup_indexes: Dict[str, MinHashLSH], page_size: int = 1000) -> int:
+    """
+    Copies `live` into `target` page by page, minus the chunks of `replaced`
+    sources, and seeds the near-duplicate indexes with what was copied (so
+    new files are deduplicated against the rest of the KB). Returns the rows copied.
+    """
+    rows = 0
+    offset = 0
+    while True:
+        page = live.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+
+        keep = [i for i, meta in enumerate(page["metadatas"]) if (meta or {}).get("source") not in replaced]
+        if not keep:
             continue
-
-        processed_path = os.path.join(
-            PROCESSED_DIR,
-            f"{os.path.splitext(file)[0]}_{content_type}.txt"
+        metas = [page["metadatas"][i] for i in keep]
+        docs = chunk_store.resolve([(page["documents"] or [None] * len(page["ids"]))[i] for i in keep],
+                                   metas, expand=0)
+        store_chunks(
+            target.add,
+            [page["ids"][i] for i in keep],
+            [list(page["embeddings"][i]) for i in keep],
+            docs,
+            metas,
         )
 
-        with open(processed_path, "w", encoding="utf-8") as f:
-            f.write(full_text)
-
-        if content_type == "PYQ":
-            print("    Splitting into questions...")
-            questions = split_questions(full_text)
-            print(f"    → Found ~{len(questions)} questions")
-            documents = []
-            for q in questions:
-                documents.extend(chunk_text(q))
-        else:
-            documents = chunk_text(full_text)
+        for content_type, index in dedup_indexes.items():
+            of_type = [j for j, meta in enumerate(metas) if meta.get("type") == content_type]
+            if of_type:
+                sigs = index.signatures([docs[j] for j in of_type])
+                for j, sig in zip(of_type, sigs):
+                    index.insert((metas[j].get("source"), rows + j), sig)
+        rows += len(keep)
+    return rows
 
-        print(f"    Total chunks → {len(documents)}")
-
-        if len(documents) == 0:
-            print("    No chunks — skipping.")
-            continue
 
-        try:
-            collection.delete(where={"source": file, "type": content_type})
-        except:
-            pass
+def _live_collection(client):
+    try:
+        return client.get_collection(current_collection_name(VECTOR_DB_DIR))
+    except Exception:
+        return None  # nothing published yet
 
-        print("    Embedding chunks...")
-        embeddings = embedder.encode(documents, show_progress_bar=True).tolist()
 
-        metadata_base = {
-            "source": file,
-            "type": content_type,
-            "subject": subject,
-        }
+# ---------- MAIN PIPELINE ----------
+def process_all_files(full_rebuild: bool = False):
+    """
+    Builds a new generation from every PDF in RAW_DIR. Unless `full_rebuild`,
+    chunks of sources that are only in the live index (ingested at runtime,
+    raw file no longer here) are carried over, so publishing never drops them.
+    """
+    print("\n[START] Processing ALL knowledgebase files (Books + PYQs)...\n")
 
-        print("    Storing in ChromaDB...")
-        add_in_batches(documents, embeddings, metadata_base)
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    client = get_client()
+    print(f"[INDEX] Chunk store → {CHUNK_STORE}")
+
+    with build_lock(VECTOR_DB_DIR):
+        # Build into a fresh generation; the live one keeps serving until we publish
+        generation = next_generation(VECTOR_DB_DIR)
+        collection = create_generation_collection(client, generation)
+        print(f"[INDEX] Building generation {generation} → {collection.name}")
+
+        # Near-duplicate index per content type, shared across all files of this run
+        dedup_indexes = {"BOOK": MinHashLSH(), "PYQ": MinHashLSH()}
+        corpus = {"chunks": 0, "kept": 0, "within_source": 0, "cross_source": 0, "copied": 0}
+
+        files = sorted(os.listdir(RAW_DIR))
+        for file in files:
+            if not file.lower().endswith(".pdf"):
+                print(f"[SKIP] Not a PDF: {file}")
+        files = [f for f in files if f.lower().endswith(".pdf")]
+
+        live = None if full_rebuild else _live_collection(client)
+        if live is not None:
+            corpus["copied"] = copy_generation(live, collection, set(files), dedup_indexes)
+            print(f"[INDEX] Carried over {corpus['copied']} chunks of sources not in {RAW_DIR} "
+                  f"(--full-rebuild to drop them)")
+
+        for file in files:
+            print(f"\n[FILE] {file}")
+            stats = process_file(os.path.join(RAW_DIR, file), collection, dedup_indexes)
+            for key in ("chunks", "kept", "within_source", "cross_source"):
+                corpus[key] += stats[key]
+
+        if corpus["chunks"]:
+            shrink = 100 * (1 - corpus["kept"] / corpus["chunks"])
+            print(f"\n[DEDUP] {corpus['chunks']} → {corpus['kept']} chunks ({shrink:.1f}% smaller; "
+                  f"{corpus['within_source']} within-source, {corpus['cross_source']} cross-source duplicates)")
+
+        pointer = publish_generation(client, VECTOR_DB_DIR, generation, stats=corpus)
+    print(f"\n[INDEX] Published generation {generation} ({pointer['count']} chunks); "
+          f"running servers pick it up within INDEX_POLL_SECONDS or via POST /api/kb/reload")
 
     print("\n[DONE] KB processing complete! 🚀\n")
 
 
 if __name__ == "__main__":
-    process_all_files()
+    parser = argparse.ArgumentParser(description="Build a new knowledge-base index generation")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help=f"index only the PDFs in {RAW_DIR}; drop every other source from the KB")
+    process_all_files(full_rebuild=parser.parse_args().full_rebuild)
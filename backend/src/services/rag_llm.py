@@ -4,8 +4,7 @@ from typing import List, Optional
 from dotenv import load_dotenv
 from groq import Groq
 
-from src.services.hyde_llm import generate_hyde_document
-from src.services.vector_store import retrieve_relevant_context
+from src.services.hyde_retrieval import retrieve_with_hyde
 
 load_dotenv()
 
@@ -85,27 +84,26 @@ def generate_notes_with_rag(
     FULL PIPELINE:
 
     1. Take user's syllabus text (topic / unit).
-    2. Use HyDE to generate a hypothetical doc for better retrieval.
-    3. Retrieve top_k chunks from ChromaDB (books or PYQs).
-    4. Generate final structured notes using Groq LLM.
+    2. Retrieve top_k chunks from ChromaDB (books or PYQs), using a HyDE
+       hypothetical doc as the query according to HYDE_MODE.
+    3. Generate final structured notes using Groq LLM.
     """
 
-    # 1) HyDE – generate hypothetical doc based on the syllabus text
-    hyde_doc = generate_hyde_document(syllabus_text)
-
-    # 2) Retrieve context (BOOK or PYQ) from Chroma
-    combined_context = retrieve_relevant_context(
-        syllabus_text=hyde_doc,
+    # 1) HyDE + retrieve context (BOOK or PYQ) from Chroma
+    result = retrieve_with_hyde(
+        query_text=syllabus_text,
+        hyde_seed=syllabus_text,
         subject=subject,
         use_pyq=use_pyq,
         top_k=top_k,
     )
+    combined_context = "\n\n".join(result["hits"]["documents"])
 
     if not combined_context.strip():
         # Fallback: if retrieval returns nothing, still answer from model
         return generate_notes(syllabus_text, [ "No context found in KB, answer from general knowledge." ])
 
-    # 3) Use LLM to generate final notes
+    # 2) Use LLM to generate final notes
     notes = generate_notes(
         topic=syllabus_text,
         context_chunks=[combined_context],
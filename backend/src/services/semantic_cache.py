@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+from src.services.metrics import record_cache
+
+# ==== CONFIG ====
+# Entries per (backend, filter) partition; 0 disables the cache.
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+# Minimum cosine similarity between query embeddings for a hit.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+# Subjects come from clients: keep at most this many partitions (least recently used dropped)
+SEMANTIC_CACHE_MAX_PARTITIONS = int(os.getenv("SEMANTIC_CACHE_MAX_PARTITIONS", "64"))
+INITIAL_PARTITION_ROWS = 16    # rows are allocated as a partition fills, up to the capacity
+
+
+class _Partition:
+    """Query embeddings of one (backend, where-filter) pair, one row per entry."""
+
+    def __init__(self, capacity: int, dim: int):
+        self.capacity = capacity
+        rows = min(capacity, INITIAL_PARTITION_ROWS)
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)  # unit-normalized
+        self.results: List[Optional[dict]] = [None] * rows
+        self.top_k = np.zeros(rows, dtype=np.int32)
+        self.created = np.zeros(rows, dtype=np.float64)
+        self.last_used = np.zeros(rows, dtype=np.float64)
+        self.size = 0
+
+    def next_row(self) -> int:
+        """Row for a new entry: a free one (growing the arrays if needed), else the least recently used."""
+        if self.size == len(self.results) and self.size < self.capacity:
+            rows = min(self.capacity, 2 * self.size)
+            grow = rows - self.size
+            self.vectors = np.concatenate([self.vectors, np.zeros((grow, self.vectors.shape[1]), dtype=np.float32)])
+            self.results.extend([None] * grow)
+            self.top_k = np.concatenate([self.top_k, np.zeros(grow, dtype=np.int32)])
+            self.created = np.concatenate([self.created, np.zeros(grow)])
+            self.last_used = np.concatenate([self.last_used, np.zeros(grow)])
+        if self.size < len(self.results):
+            self.size += 1
+            return self.size - 1
+        return int(np.argmin(self.last_used))  # evict the least recently used entry
+
+
+# ---------------------------------------------------------
+#  SEMANTIC RETRIEVAL CACHE
+#  HyDE docs for the same unit differ run to run but embed to nearly the
+#  same vector, and retrieve the same chunks. A new query is served from the
+#  cache when its cosine similarity to a cached query (same filter, same
+#  index generation) reaches the threshold.
+# ---------------------------------------------------------
+class SemanticCache:
+    def __init__(self, capacity: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS, max_partitions: int = SEMANTIC_CACHE_MAX_PARTITIONS):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_partitions = max_partitions
+        self._partitions: "OrderedDict[Hashable, _Partition]" = OrderedDict()
+        self._generation: Optional[Hashable] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _check_generation(self, generation: Hashable):
+        # Results from an older index generation (or any other identity of the
+        # served index, see vector_store.index_version) are never served
+        if generation != self._generation:
+            self._partitions.clear()
+            self._generation = generation
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else v
+
+    def get(self, partition: Hashable, generation: Hashable, query_embedding, top_k: int) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        q = self._unit(query_embedding)
+        hit = None
+
+        with self._lock:
+            self._check_generation(generation)
+            part = self._partitions.get(partition)
+            if part is not None:
+                self._partitions.move_to_end(partition)
+            if part is not None and part.size:
+                now = time.time()
+                sims = part.vectors[:part.size] @ q
+                # only entries that hold enough results and are still fresh
+                sims[(part.top_k[:part.size] < top_k) | (now - part.created[:part.size] > self.ttl_seconds)] = -1.0
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    part.last_used[best] = now
+                    hit = part.results[best]
+
+        record_cache("retrieval_semantic", hit=hit is not None)
+        if hit is None:
+            return None
+        return {key: list(values[:top_k]) for key, values in hit.items()}
+
+    def put(self, partition: Hashable, generation: Hashable, query_embedding, top_k: int, result: dict):
+        if not self.enabled:
+            return
+        q = self._unit(query_embedding)
+        stored = {key: list(values) for key, values in result.items()}
+
+        with self._lock:
+            self._check_generation(generation)
+            part = self._partitions.get(partition)
+            if part is None:
+                part = self._partitions[partition] = _Partition(self.capacity, q.shape[0])
+                while len(self._partitions) > self.max_partitions:
+                    self._partitions.popitem(last=False)
+            self._partitions.move_to_end(partition)
+
+            row = part.next_row()
+            now = time.time()
+            part.vectors[row] = q
+            part.results[row] = stored
+            part.top_k[row] = top_k
+            part.created[row] = now
+            part.last_used[row] = now
+
+    def invalidate(self):
+        with self._lock:
+            self._partitions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "generation": self._generation,
+                "partitions": len(self._partitions),
+                "entries": sum(p.size for p in self._partitions.values()),
+                "capacity_per_partition": self.capacity,
+                "max_partitions": self.max_partitions,
+                "threshold": self.threshold,
+            }
+
+
+retrieval_cache = SemanticCache()
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import re
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+from src.services.metrics import record_cache
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace-insensitive form of user text, for coalescing keys."""
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+def request_key(*parts: Any) -> str:
+    """Stable hash of the (already normalized) parts of a request."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------
+#  SINGLE-FLIGHT
+#  Concurrent calls with the same key share one execution: the first
+#  caller runs `fn`, everyone arriving while it runs waits on the same
+#  future. Nothing is cached afterwards — a later call runs again.
+# ---------------------------------------------------------
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """Returns (result, shared) — `shared` is True for callers that waited on another's run."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        record_cache(f"singleflight_{self.name}", hit=not leader)
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)  # waiters see the same failure
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._calls)
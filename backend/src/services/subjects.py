@@ -0,0 +1,26 @@
+from typing import List, Tuple
+
+# --------------------------------------------
+# Subject detection rules (filename patterns), first match wins
+# --------------------------------------------
+SUBJECT_RULES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("AI", ("ai", "artificial-intelligence", "artificial intelligence")),
+    ("ML", (
+        "ml", "machine learning", "machine-learning",
+        "data science", "data-science", "introduction to machine learning",
+    )),
+    ("IOT", ("iot", "internet of things")),
+    ("TOC", ("toc", "theoryofcomputation", "theory of computation")),
+    ("STDS", ("stds", "thinkstats", "statistics", "stats")),
+]
+
+# Every label the knowledge base can carry
+KNOWN_SUBJECTS = tuple(subject for subject, _ in SUBJECT_RULES) + ("UNKNOWN",)
+
+
+def detect_subject_from_filename(filename: str) -> str:
+    name = filename.lower()
+    for subject, keywords in SUBJECT_RULES:
+        if any(kw in name for kw in keywords):
+            return subject
+    return "UNKNOWN"
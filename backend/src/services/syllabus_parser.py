@@ -0,0 +1,143 @@
+"""
+Local, deterministic syllabus → topic parser.
+
+Handles the layouts syllabi are usually pasted in:
+  - unit headers: "UNIT I", "Unit-2:", "MODULE 3", "Chapter IV" (on their own
+    line or inline, one after another on a single line),
+  - numbered / bulleted lists: "1.", "1.2", "a)", "(iv)", "-", "•",
+  - topics separated by commas / semicolons (not inside parentheses), spaced
+    dashes ("Sampling – types – bias"; "K-means" stays one topic), colons
+    and sentence breaks,
+  - noise: lecture hours, L-T-P-C lines, and everything from "Text Books" /
+    "References" on.
+
+Topics keep their order of appearance (first spelling wins on duplicates), so
+the same syllabus always gives the same list. `confidence` says how much the
+input looked like a list of topics; callers fall back to the LLM below
+SYLLABUS_PARSER_MIN_CONFIDENCE.
+"""
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Iterator, List
+
+# ==== CONFIG ====
+SYLLABUS_PARSER_MIN_CONFIDENCE = float(os.getenv("SYLLABUS_PARSER_MIN_CONFIDENCE", "0.7"))
+MIN_TOPIC_CHARS = 3
+MAX_TOPIC_WORDS = 12           # longer pieces are prose, not topic names
+MIN_TOPICS = 3                 # fewer than this is not much of a list
+
+UNIT_HEADER_RE = re.compile(
+    r"\b(?:unit|module|chapter)\s*[-–—.:]?\s*(?:[ivx]{1,5}|\d{1,2})\b\s*[-–—.:)]*\s*",
+    re.IGNORECASE,
+)
+END_SECTION_RE = re.compile(
+    r"^\s*(?:text\s*books?|reference\s*books?|references|suggested\s+readings?|"
+    r"recommended\s+books|books\s+recommended|course\s+outcomes?)\b"
+    r"|\b(?:text\s*books?|reference\s*books?|references)\s*:",
+    re.IGNORECASE | re.MULTILINE,
+)
+NOISE_LINE_RE = re.compile(
+    r"^\s*(?:course\s+(?:code|objectives?|outcomes?)|l\s*-?\s*t\s*-?\s*p\b|credits?\b|"
+    r"total\s+(?:hours|lectures)|prerequisites?\b)",
+    re.IGNORECASE,
+)
+LIST_MARKER_RE = re.compile(
+    r"^\s*(?:[-•*●▪◦–—]+|\d{1,2}(?:\.\d{1,2})*[.)]?(?=\s)|\(?(?:[a-h]|[ivx]{1,4})[.)])\s*",
+    re.IGNORECASE,
+)
+HOURS_RE = re.compile(
+    r"\(?\b\d{1,2}\s*(?:hrs?|hours?|lectures?|periods?)\b\.?\)?"
+    r"|\b(?:no\.?\s+of\s+)?(?:hours|hrs|lectures)\s*[:\-]?\s*\d{1,2}\b",
+    re.IGNORECASE,
+)
+# Topic boundaries inside a line. Commas / semicolons inside "(...)" don't split.
+SPLIT_RE = re.compile(
+    r"[,;](?![^()]*\))"
+    r"|\s[-–—]\s"
+    r"|:\s"
+    r"|(?<=[a-z)\]])\.\s+(?=[A-Z])"
+    r"|\s(?=(?:\d{1,2}(?:\.\d{1,2})*|\(?[a-h])[.)]\s)"
+)
+TRAILING_RE = re.compile(r"(?:\s*\b(?:etc|and|or)\b\.?)+$|[\s.:;,\-–—]+$", re.IGNORECASE)
+SPACES_RE = re.compile(r"\s+")
+HEADER_WORD_RE = re.compile(r"[a-z]+|\d+", re.IGNORECASE)
+
+
+@dataclass
+class ParsedUnit:
+    header: str                       # "UNIT II", "" for a syllabus without headers
+    topics: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ParsedSyllabus:
+    units: List[ParsedUnit]
+    confidence: float
+
+    @property
+    def topics(self) -> List[str]:
+        """All topics in order, de-duplicated case-insensitively."""
+        seen = {}
+        for unit in self.units:
+            for topic in unit.topics:
+                seen.setdefault(topic.casefold(), topic)
+        return list(seen.values())
+
+
+def _split_units(text: str) -> List[ParsedUnit]:
+    headers = list(UNIT_HEADER_RE.finditer(text))
+    if not headers:
+        return [ParsedUnit(header="", topics=list(_iter_topics(text)))]
+
+    # Anything before the first header is the course title / objectives
+    units = []
+    for i, match in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        header = " ".join(HEADER_WORD_RE.findall(match.group(0))).upper()
+        units.append(ParsedUnit(header=header, topics=list(_iter_topics(text[match.end():end]))))
+    return units
+
+
+def _iter_topics(body: str) -> Iterator[str]:
+    for line in body.splitlines():
+        if not line.strip() or NOISE_LINE_RE.match(line):
+            continue
+        line = HOURS_RE.sub(" ", line)
+        for piece in SPLIT_RE.split(line):
+            topic = _clean_topic(piece)
+            if topic:
+                yield topic
+
+
+def _clean_topic(piece: str) -> str:
+    topic = LIST_MARKER_RE.sub("", SPACES_RE.sub(" ", piece)).strip()
+    topic = TRAILING_RE.sub("", topic).strip(" -–—")
+    if topic.count("(") != topic.count(")"):
+        topic = topic.strip(" ()")
+    if len(topic) < MIN_TOPIC_CHARS or not any(c.isalpha() for c in topic):
+        return ""
+    return topic
+
+
+def _confidence(units: List[ParsedUnit], structured: bool) -> float:
+    topics = [t for u in units for t in u.topics]
+    if not topics:
+        return 0.0
+    short = sum(len(t.split()) <= MAX_TOPIC_WORDS for t in topics) / len(topics)
+    size = min(1.0, len(topics) / MIN_TOPICS)
+    return round(short * size * (1.0 if structured else 0.6), 3)
+
+
+def parse_syllabus(syllabus_text: str) -> ParsedSyllabus:
+    text = (syllabus_text or "").replace("\r", "\n")
+    end = END_SECTION_RE.search(text)
+    if end:
+        text = text[:end.start()]
+
+    units = [u for u in _split_units(text) if u.topics]
+    # Headers, list markers or several delimiters mean the text had list structure
+    structured = bool(UNIT_HEADER_RE.search(text)) or any(
+        LIST_MARKER_RE.match(line) for line in text.splitlines() if line.strip()
+    ) or len(SPLIT_RE.findall(text)) >= MIN_TOPICS - 1
+    return ParsedSyllabus(units=units, confidence=_confidence(units, structured))
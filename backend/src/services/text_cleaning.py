@@ -0,0 +1,141 @@
+"""
+Boilerplate / noise removal for extracted book text.
+
+Works on the page structure pdfminer emits ("\\f" between pages):
+  1. running headers / footers are found by how often a (digit-normalized)
+     line shows up in the first / last lines of pages,
+  2. front matter (title, copyright, contents, preface, ...) is detected by
+     page position at the start of the book,
+  3. the remaining pages are streamed line by line through one compiled
+     keyword pattern that only applies to short, heading-like lines, so a
+     paragraph that merely mentions "edition" or "contents" is kept.
+
+Everything is a single linear pass over the text plus a cheap pre-pass over
+page edges.
+"""
+import re
+from collections import Counter
+from typing import Iterable, Iterator, List, Set
+
+EDGE_LINES = 3                 # lines at the top / bottom of a page considered for headers
+HEADER_MIN_PAGES = 3           # a repeated edge line must recur on at least this many pages
+HEADER_MIN_FRACTION = 0.02     # ... and on this fraction of all pages
+FRONT_MATTER_MAX_PAGES = 30    # never look for front matter past this page
+FRONT_MATTER_MAX_FRACTION = 0.15
+HEADING_MAX_CHARS = 60         # keyword filter applies only to lines this short
+
+NOISE_KEYWORDS = [
+    "copyright", "all rights reserved", "isbn", "publisher",
+    "acknowledgements", "acknowledgments", "preface",
+    "about the author", "table of contents", "contents",
+    "printed in", "edition", "foreword", "dedication",
+    "library of congress", "cataloging-in-publication",
+]
+FRONT_MATTER_KEYWORDS = [
+    "copyright", "all rights reserved", "isbn", "contents", "table of contents",
+    "preface", "foreword", "acknowledgements", "acknowledgments", "dedication",
+    "about the author", "library of congress", "printed in",
+]
+
+# One alternation, compiled once: the regex engine walks each line once no
+# matter how many keywords there are.
+NOISE_RE = re.compile(r"\b(?:" + "|".join(map(re.escape, NOISE_KEYWORDS)) + r")\b", re.IGNORECASE)
+FRONT_RE = re.compile(r"\b(?:" + "|".join(map(re.escape, FRONT_MATTER_KEYWORDS)) + r")\b", re.IGNORECASE)
+BODY_START_RE = re.compile(r"^\s*(?:chapter\s+(?:1|one|i)\b|1\.?\s+[A-Z]|part\s+(?:1|one|i)\b|introduction\b)", re.IGNORECASE)
+DOT_LEADER_RE = re.compile(r"(?:\.\s?){4,}\s*\d*\s*$")
+PAGE_NUMBER_RE = re.compile(r"^\W*(?:\d{1,4}|[ivxlc]{1,6})\W*$", re.IGNORECASE)
+DIGITS_RE = re.compile(r"\d+")
+SPACES_RE = re.compile(r"\s+")
+
+
+def _normalize(line: str) -> str:
+    return SPACES_RE.sub(" ", DIGITS_RE.sub("#", line.strip().lower()))
+
+
+def _edge_lines(page: str) -> List[str]:
+    lines = [ln for ln in page.splitlines() if ln.strip()]
+    if len(lines) <= 2 * EDGE_LINES:
+        return lines
+    return lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+
+
+# ---------- 1. RUNNING HEADERS / FOOTERS ----------
+def find_repeated_edge_lines(pages: List[str]) -> Set[str]:
+    counts: Counter = Counter()
+    for page in pages:
+        counts.update({_normalize(ln) for ln in _edge_lines(page)})
+
+    min_pages = max(HEADER_MIN_PAGES, int(len(pages) * HEADER_MIN_FRACTION))
+    return {line for line, n in counts.items() if n >= min_pages and line}
+
+
+# ---------- 2. FRONT MATTER ----------
+def _prose_lines(page: str) -> int:
+    return sum(1 for ln in page.splitlines() if len(ln.strip()) > 40 and not DOT_LEADER_RE.search(ln))
+
+
+def _is_toc_page(page: str) -> bool:
+    lines = [ln for ln in page.splitlines() if ln.strip()]
+    if not lines:
+        return False
+    leaders = sum(1 for ln in lines if DOT_LEADER_RE.search(ln))
+    return leaders >= 3 or leaders / len(lines) > 0.2
+
+
+def count_front_matter_pages(pages: List[str]) -> int:
+    """
+    Number of leading pages that are front matter: near-empty title pages,
+    TOC pages, and sections opened by a front-matter keyword (copyright,
+    preface, ...) up to the first page that starts the body.
+    """
+    limit = min(FRONT_MATTER_MAX_PAGES, max(1, int(len(pages) * FRONT_MATTER_MAX_FRACTION)))
+    front = 0
+    in_front_section = False
+
+    for i, page in enumerate(pages[:limit]):
+        top = "\n".join(_edge_lines(page)[:EDGE_LINES])
+
+        if BODY_START_RE.search(top) and not _is_toc_page(page):
+            break
+        if FRONT_RE.search(top) or _is_toc_page(page):
+            in_front_section = True
+            front = i + 1
+        elif in_front_section or _prose_lines(page) < 5:
+            front = i + 1
+        else:
+            break
+    return front
+
+
+# ---------- 3. STREAMING LINE FILTER ----------
+def iter_clean_lines(pages: Iterable[str], repeated: Set[str]) -> Iterator[str]:
+    blank = True
+    for page in pages:
+        for line in page.splitlines():
+            stripped = line.strip()
+
+            if not stripped:
+                # keep single blank lines: they mark paragraphs for the chunker
+                if not blank:
+                    blank = True
+                    yield ""
+                continue
+            if len(stripped) <= 3 or PAGE_NUMBER_RE.match(stripped):
+                continue
+            if _normalize(stripped) in repeated:
+                continue
+            if DOT_LEADER_RE.search(stripped):
+                continue
+            if len(stripped) <= HEADING_MAX_CHARS and NOISE_RE.search(stripped):
+                continue
+
+            blank = False
+            yield line
+
+
+def clean_book_text(text: str) -> str:
+    pages = text.split("\f")
+    repeated = find_repeated_edge_lines(pages) if len(pages) > 1 else set()
+    skip = count_front_matter_pages(pages) if len(pages) > 1 else 0
+
+    return "\n".join(iter_clean_lines(pages[skip:], repeated)).strip()
@@ -1,50 +1,144 @@
-import chromadb
-from chromadb import PersistentClient
+import json
+import os
+import threading
+import time
+from typing import Hashable, List, Optional
+
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from src.services.chunk_store import chunk_store
+from src.services.chunking import load_tokenizer
+from src.services.embedding_server import EMBEDDING_MODEL_NAME, EMBEDDING_SOCKET, EmbeddingClient
+from src.services.index_generations import GenerationManager
+from src.services.metrics import track_stage
+from src.services.semantic_cache import retrieval_cache
+
 # === Paths ===
 VECTOR_DB_DIR = "./vector-db"
 
+# === Retrieval backend ===
+# "chroma"     → HNSW query on the Chroma collection (default)
+# "compressed" → int8/float16 (+PCA) codes in RAM, float32 rescoring from disk
+#                (build with: python -m src.services.compressed_index build)
+# "snapshot"   → exact search over a memory-mapped KB snapshot file (KB_SNAPSHOT_PATH),
+#                no Chroma needed (python -m src.services.kb_snapshot export ...);
+#                the Chroma client is only opened if something else asks for it
+#                (KB reload / ingestion endpoints)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+
 # === Embedding Model ===
-embedder = SentenceTransformer("all-MiniLM-L6-v2")  # must match preprocess embeddings
+# Loaded on first use. With EMBEDDING_SOCKET set, queries are encoded by the
+# shared embedding server instead and this process only loads the tokenizer.
+# If the server is unreachable, calls encode in-process and the server is
+# tried again after EMBEDDING_RETRY_SECONDS (it may just be restarting).
+EMBEDDING_RETRY_SECONDS = float(os.getenv("EMBEDDING_RETRY_SECONDS", "30"))
+_embedder = None
+_tokenizer = None
+_embedder_lock = threading.Lock()
+_embedding_client = EmbeddingClient(EMBEDDING_SOCKET) if EMBEDDING_SOCKET else None
+_embedding_retry_at = 0.0   # monotonic time before which the server is skipped
+
+
+def get_embedder() -> SentenceTransformer:
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)  # must match preprocess embeddings
+        return _embedder
+
+
+def get_tokenizer():
+    global _tokenizer
+    if _embedding_client is None:
+        return get_embedder().tokenizer
+    with _embedder_lock:
+        if _tokenizer is None:
+            _tokenizer = load_tokenizer()
+        return _tokenizer
+
+
+def embed_queries(texts: List[str]) -> np.ndarray:
+    """(len(texts), 384) float32 query embeddings."""
+    global _embedding_retry_at
+    if _embedding_client is not None and time.monotonic() >= _embedding_retry_at:
+        try:
+            vectors = _embedding_client.encode(texts)
+            if _embedding_retry_at:
+                print("✅ Embedding server reachable again")
+                _embedding_retry_at = 0.0
+            return vectors
+        except (OSError, ConnectionError) as e:
+            # server down: degrade to the in-process model for now rather than failing requests
+            print(f"⚠️ Embedding server unavailable ({e}); encoding in-process, "
+                  f"retrying the server in {EMBEDDING_RETRY_SECONDS:.0f}s")
+            _embedding_retry_at = time.monotonic() + EMBEDDING_RETRY_SECONDS
+    return np.asarray(get_embedder().encode(texts), dtype=np.float32)
 
-# === ChromaDB Client ===
-client = PersistentClient(path=VECTOR_DB_DIR)
-collection = client.get_or_create_collection("study_kb")
+
+# === ChromaDB Client (opened on first use) ===
+# The collection is resolved per query through the generation pointer, so a
+# re-ingested KB can be swapped in without a restart (see index_generations).
+_client = None
+_generations = None
+_chroma_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _chroma_lock:
+        if _client is None:
+            from chromadb import PersistentClient
+            _client = PersistentClient(path=VECTOR_DB_DIR)
+        return _client
+
+
+def get_generations() -> GenerationManager:
+    global _generations
+    client = get_client()
+    with _chroma_lock:
+        if _generations is None:
+            _generations = GenerationManager(client, VECTOR_DB_DIR)
+            _generations.start_polling()
+        return _generations
 
 
 # ---------------------------------------------------------
 #  BASIC RAW VECTOR SEARCH  (needed for /query route)
 # ---------------------------------------------------------
 def vector_search(query: str, top_k: int = 5):
-    """Raw semantic search without filters."""
-    
-    query_embedding = embedder.encode([query])[0].tolist()
+    """
+    Raw semantic search without filters, on RETRIEVAL_BACKEND. Keeps the
+    Chroma query shape (one list per query) the /query route has always returned.
+    """
+    with track_stage("query_embedding"):
+        query_embedding = embed_queries([query])[0].tolist()
+
+    hits = _search(query_embedding, top_k, where_filter=None)
+    return {key: [hits[key]] for key in ("ids", "documents", "metadatas", "distances")}
 
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k
-    )
 
-    return results
+# ---------------------------------------------------------
+#  TOKEN COUNTING  (embedder tokenizer, used for context budgets)
+# ---------------------------------------------------------
+def count_tokens(text: str) -> int:
+    """Number of embedder (MiniLM word-piece) tokens in `text`."""
+    if not text:
+        return 0
+    return len(get_tokenizer()(text, add_special_tokens=False)["input_ids"])
 
 
 # ---------------------------------------------------------
 #  FILTERED CONTEXT RETRIEVAL  (used for notes generation)
 # ---------------------------------------------------------
-def retrieve_relevant_context(
-        syllabus_text: str,
-        subject: str = None,
-        use_pyq: bool = False,
-        top_k: int = 10
-    ):
+def build_where_filter(subject: str = None, use_pyq: bool = False) -> dict:
     """
-    Retrieves the most relevant BOOK or PYQ chunks based on the given syllabus text.
+    Chroma metadata filter for a subject + content type (BOOK / PYQ).
     """
 
     ### Fix: Chroma expects only ONE operator in "where"
     ### So we use a nested operator "$and"
-    
+
     where_filter = {"$and": []}
 
     if subject and subject != "ALL":
@@ -57,14 +151,142 @@ def retrieve_relevant_context(
     if len(where_filter["$and"]) == 1:
         where_filter = where_filter["$and"][0]
 
-    query_embedding = embedder.encode([syllabus_text])[0].tolist()
+    return where_filter
+
+
+def retrieve_chunks(
+        syllabus_text: str,
+        subject: str = None,
+        use_pyq: bool = False,
+        top_k: int = 10
+    ) -> dict:
+    """
+    Retrieves the most relevant BOOK or PYQ chunks together with their provenance.
+
+    Returns a flat dict: {"ids", "documents", "metadatas", "distances"}
+    (one entry per retrieved chunk, best match first).
+    """
+    where_filter = build_where_filter(subject, use_pyq)
+
+    with track_stage("query_embedding", subject):
+        query_embedding = embed_queries([syllabus_text])[0]
+
+    # Near-identical queries (e.g. HyDE reruns) reuse earlier results
+    partition = (RETRIEVAL_BACKEND, json.dumps(where_filter, sort_keys=True))
+    generation = index_version()
+    cached = retrieval_cache.get(partition, generation, query_embedding, top_k)
+    if cached is not None:
+        return cached
+
+    result = _search(query_embedding.tolist(), top_k, where_filter, subject)
+    retrieval_cache.put(partition, generation, query_embedding, top_k, result)
+    return result
+
+
+def index_version() -> Hashable:
+    """
+    Identity of the index RETRIEVAL_BACKEND answers from (retrieval cache key):
+    the Chroma generation, plus the build of the compressed index, or the
+    content hash of the loaded snapshot.
+    """
+    if RETRIEVAL_BACKEND == "snapshot":
+        from src.services.kb_snapshot import get_snapshot
+        return ("snapshot", get_snapshot(EMBEDDING_MODEL_NAME).manifest["sections"]["embeddings"]["sha256"])
+    generation = get_generations().generation
+    if RETRIEVAL_BACKEND == "compressed":
+        from src.services.compressed_index import get_index
+        index = get_index()
+        return (generation, index.manifest.get("collection"), index.build_dir)
+    return generation
+
+
+def reload_indexes() -> dict:
+    """
+    Picks up whatever RETRIEVAL_BACKEND serves from: the latest published
+    generation, a rebuilt compressed index, a new snapshot file. The changed
+    index_version() then clears the retrieval cache.
+    """
+    if RETRIEVAL_BACKEND == "snapshot":
+        from src.services.kb_snapshot import reload_snapshot
+        snap = reload_snapshot(EMBEDDING_MODEL_NAME)
+        return {"backend": RETRIEVAL_BACKEND, "snapshot_chunks": snap.count}
+
+    status = {"backend": RETRIEVAL_BACKEND, **get_generations().reload()}
+    if RETRIEVAL_BACKEND == "compressed":
+        from src.services.compressed_index import reload_index
+        status["compressed_index"] = reload_index().manifest.get("collection")
+    return status
+
+
+def _search(query_embedding: List[float], top_k: int, where_filter: Optional[dict], subject: str = None) -> dict:
+    if RETRIEVAL_BACKEND == "compressed":
+        return _compressed_query(query_embedding, top_k, where_filter, subject)
+    if RETRIEVAL_BACKEND == "snapshot":
+        from src.services.kb_snapshot import get_snapshot
+        # the snapshot carries every chunk's text; no processed files to expand from
+        with track_stage("snapshot_query", subject):
+            return get_snapshot(EMBEDDING_MODEL_NAME).search(query_embedding, top_k, where_filter)
+
+    with get_generations().lease() as collection:
+        return _chroma_query(collection, query_embedding, top_k, where_filter, subject)
 
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        where=where_filter
-    )
 
-    docs = results.get("documents", [[]])[0]
+def _chroma_query(collection, query_embedding: List[float], top_k: int, where_filter: Optional[dict],
+                  subject: str = None) -> dict:
+    with track_stage("chroma_query", subject):
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=top_k,
+            where=where_filter
+        )
 
-    return "\n\n".join(docs)
+    metadatas = (results.get("metadatas") or [[]])[0]
+    return {
+        "ids": (results.get("ids") or [[]])[0],
+        # offset-stored chunks have no document: sliced from the processed text
+        "documents": chunk_store.resolve((results.get("documents") or [None])[0], metadatas),
+        "metadatas": metadatas,
+        "distances": (results.get("distances") or [[]])[0],
+    }
+
+
+def _compressed_query(query_embedding, top_k: int, where_filter: dict, subject: str = None) -> dict:
+    from src.services.compressed_index import get_index_for
+
+    with get_generations().lease() as collection:
+        index = get_index_for(collection.name)
+        if index is None:
+            # built from another generation: its ids don't match this collection
+            return _chroma_query(collection, query_embedding, top_k, where_filter, subject)
+
+        with track_stage("compressed_query", subject):
+            ids, distances = index.search(query_embedding, top_k, where_filter)
+
+        # Only the winners' documents / metadata are read back from Chroma
+        with track_stage("chroma_fetch", subject):
+            got = collection.get(ids=ids, include=["documents", "metadatas"]) if ids else {"ids": []}
+    by_id = dict(zip(got["ids"], zip(chunk_store.resolve(got.get("documents"), got.get("metadatas") or []),
+                                     got.get("metadatas") or [])))
+
+    kept = [(i, d) for i, d in zip(ids, distances) if i in by_id]
+    if len(kept) < len(ids):
+        print(f"⚠️ {len(ids) - len(kept)} compressed-index hits missing from {collection.name}")
+    return {
+        "ids": [i for i, _ in kept],
+        "documents": [by_id[i][0] for i, _ in kept],
+        "metadatas": [by_id[i][1] for i, _ in kept],
+        "distances": [d for _, d in kept],
+    }
+
+
+def retrieve_relevant_context(
+        syllabus_text: str,
+        subject: str = None,
+        use_pyq: bool = False,
+        top_k: int = 10
+    ):
+    """
+    Retrieves the most relevant BOOK or PYQ chunks based on the given syllabus text.
+    """
+    hits = retrieve_chunks(syllabus_text, subject, use_pyq, top_k)
+    return "\n\n".join(hits["documents"])